@@ -0,0 +1,67 @@
+import pandas as pd
+import numpy as np
+
+
+def calculate_AFUDC_schedule(new_capex_df, new_unit_spend_schedule_df):
+    """
+    Calculates the AFUDC schedule for every plant and year at once.
+
+    Each year's value looks ahead at the CapEx of the next three years, weighted by the share of spend in each year of
+    construction: CapEx in year + 1 times the year 3 share, year + 2 times the year 2 share and year + 3 times the
+    year 1 share. Years past the last column are left out, so the last three years only look ahead as far as the
+    table goes (and the last year is 0).
+
+    Parameters:
+    - new_capex_df (pd.DataFrame): New CapEx with plants as rows and consecutive years as columns.
+    - new_unit_spend_schedule_df (pd.DataFrame): Share of spend by year of construction (rows 1, 2 and 3) by plant.
+
+    Returns:
+    - pd.DataFrame: AFUDC schedule, shaped like new_capex_df.
+    """
+
+    capex = new_capex_df.values.astype(np.float64)
+    spend_shares = new_unit_spend_schedule_df.loc[[1, 2, 3], new_capex_df.index].values.astype(np.float64)
+
+    # Add each look-ahead year as a shifted column block, weighted by its plant's spend share
+    AFUDC_schedule = np.zeros_like(capex)
+    for years_ahead, construction_year in ((1, 3), (2, 2), (3, 1)):
+        if years_ahead < capex.shape[1]:
+            AFUDC_schedule[:, :-years_ahead] += capex[:, years_ahead:] * spend_shares[construction_year - 1][:, np.newaxis]
+
+    return pd.DataFrame(AFUDC_schedule, index=new_capex_df.index, columns=new_capex_df.columns)
+
+
+def calculate_AFUDC_with_rate(new_capex_df, new_unit_spend_schedule_with_metadata_df):
+    """
+    Multiplies each plant's CapEx by its 'AFUDC Increase to Capital Cost'.
+
+    Returns:
+    - pd.DataFrame: AFUDC with rate, shaped like new_capex_df.
+    """
+
+    AFUDC_increase_to_cap_cost = new_unit_spend_schedule_with_metadata_df.loc['AFUDC Increase to Capital Cost', new_capex_df.index]
+
+    return new_capex_df.astype(np.float64).mul(AFUDC_increase_to_cap_cost.astype(np.float64).values, axis=0)
+
+
+def calculate_accumulated_AFUDC(new_capex_df, AFUDC_with_rate_df):
+    """
+    Calculates accumulated AFUDC, which is booked in the years a plant has CapEx.
+
+    Each of those years gets all the AFUDC with rate since the previous year with CapEx (including the current year),
+    i.e. the difference between the running total of AFUDC with rate now and at the previous year with CapEx.
+
+    Returns:
+    - pd.DataFrame: Accumulated AFUDC, shaped like new_capex_df.
+    """
+
+    has_capex = new_capex_df.values != 0
+    running_AFUDC = np.cumsum(AFUDC_with_rate_df.values.astype(np.float64), axis=1)
+
+    # Running total as of the previous year with CapEx (0 before the first one)
+    running_AFUDC_at_capex = pd.DataFrame(np.where(has_capex, running_AFUDC, np.nan))
+    previous_running_AFUDC = running_AFUDC_at_capex.shift(1, axis=1).ffill(axis=1).fillna(0).values
+
+    accumulated_AFUDC = np.where(has_capex, running_AFUDC - previous_running_AFUDC, 0)
+
+    return pd.DataFrame(accumulated_AFUDC, index=new_capex_df.index, columns=new_capex_df.columns)
@@ -0,0 +1,108 @@
+import pandas as pd
+import numpy as np
+
+
+def calc_discount_factors(discount_rates, years, start_year):
+    """
+    Calculates the discount factor of each year for one or more discount rates.
+
+    Years are discounted from the year before start_year, so start_year itself is discounted one period (the same as
+    npf.npv with a 0 in front of the cash flows).
+
+    Parameters:
+    - discount_rates (float or np.ndarray): Discount rate, or one per scenario with shape (scenarios,).
+    - years (array-like): Years of the cash flows.
+    - start_year (int): First year that is discounted one period.
+
+    Returns:
+    - np.ndarray: Discount factors with shape (years,) for a single rate, or (scenarios, years).
+    """
+
+    periods = np.asarray(years, dtype=np.float64) - (start_year - 1)
+    discount_rates = np.asarray(discount_rates, dtype=np.float64)
+
+    return (1 + discount_rates[..., np.newaxis]) ** -periods
+
+
+def calc_horizon_mask(years, start_year, horizon_end_years):
+    """
+    Marks which years fall in each NPV horizon (start_year through each end year).
+
+    Returns:
+    - np.ndarray: 1.0 where the year is in the horizon, with shape (years, horizons).
+    """
+
+    years = np.asarray(years, dtype=np.int64)[:, np.newaxis]
+    horizon_end_years = np.asarray(horizon_end_years, dtype=np.int64)[np.newaxis, :]
+
+    return ((years >= start_year) & (years <= horizon_end_years)).astype(np.float64)
+
+
+def calc_npv_matrix(cash_flows, discount_rates, years, start_year, horizon_end_years):
+    """
+    Calculates the NPV of every scenario over every horizon in one matrix product.
+
+    With one discount rate for all scenarios, the discount factors and horizon mask are combined into one
+    (years x horizons) weight matrix, and the NPVs are cash_flows @ weights. With a rate per scenario, each scenario's
+    cash flows are discounted first and then summed over each horizon with the mask.
+
+    Missing cash flows count as 0, the same as leaving those years out of the NPV.
+
+    Parameters:
+    - cash_flows (np.ndarray): Cash flows by scenario and year, with shape (scenarios, years).
+    - discount_rates (float or np.ndarray): Discount rate, or one per scenario with shape (scenarios,).
+    - years (array-like): Years of the cash flow columns.
+    - start_year (int): First year of every horizon (discounted one period).
+    - horizon_end_years (list): Last year of each horizon.
+
+    Returns:
+    - np.ndarray: NPVs with shape (scenarios, horizons).
+    """
+
+    cash_flows = np.nan_to_num(np.atleast_2d(np.asarray(cash_flows, dtype=np.float64)))
+    horizon_mask = calc_horizon_mask(years, start_year, horizon_end_years)
+    discount_factors = calc_discount_factors(discount_rates, years, start_year)
+
+    # One rate for everything: fold the discount factors into the horizon weights
+    if discount_factors.ndim == 1:
+        return cash_flows @ (discount_factors[:, np.newaxis] * horizon_mask)
+
+    # A rate per scenario: discount each scenario, then sum over the horizons
+    return (cash_flows * discount_factors) @ horizon_mask
+
+
+def calc_npv_table(revenue_requirements, discount_rates, start_year, horizons):
+    """
+    Calculates the NPV of the revenue requirement (NPVRR) of every scenario over every horizon as a tidy table.
+
+    Parameters:
+    - revenue_requirements (pd.DataFrame or pd.Series): Total revenue requirement with scenarios as rows and years as
+      columns (a Series by year for a single scenario).
+    - discount_rates (float or pd.Series): Discount rate (e.g. 'After-Tax WACC'), or one per scenario, indexed like
+      revenue_requirements' rows.
+    - start_year (int): First year of every horizon (discounted one period).
+    - horizons (dictionary): Last year of each horizon, by horizon name.
+
+    Returns:
+    - pd.DataFrame: One row per scenario and horizon, with the scenario index, 'horizon', 'start_year', 'end_year'
+      and 'NPVRR' columns.
+    """
+
+    if isinstance(revenue_requirements, pd.Series):
+        revenue_requirements = revenue_requirements.to_frame().T
+    if isinstance(discount_rates, pd.Series):
+        discount_rates = discount_rates.reindex(revenue_requirements.index).values
+
+    cash_flows = revenue_requirements.apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+    npv_matrix = calc_npv_matrix(cash_flows, discount_rates, revenue_requirements.columns, start_year, list(horizons.values()))
+
+    # One row per scenario and horizon
+    scenario_index = revenue_requirements.index.to_frame(index=False)
+    scenario_index.columns = [name if name is not None else 'scenario' for name in revenue_requirements.index.names]
+    npv_table = scenario_index.loc[scenario_index.index.repeat(len(horizons))].reset_index(drop=True)
+    npv_table['horizon'] = np.tile(list(horizons.keys()), len(revenue_requirements))
+    npv_table['start_year'] = start_year
+    npv_table['end_year'] = np.tile(list(horizons.values()), len(revenue_requirements))
+    npv_table['NPVRR'] = npv_matrix.ravel()
+
+    return npv_table
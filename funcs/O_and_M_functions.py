@@ -1,7 +1,8 @@
 import pandas as pd
 import numpy as np
 
-from data_processing_functions import convert_capacity_table_to_cost_table
+from .data_processing_functions import convert_capacity_table_to_cost_table, extend_years
+from .aurora_data_functions import get_aurora_output_store
 
 
 def calc_VOM(run_variables_dict, 
@@ -16,7 +17,7 @@ def calc_VOM(run_variables_dict,
 
     Parameters:
     - run_variables_dict (dictionary): Countains parameter information about which Aurora run to use.
-    - aurora_portfolio_summary (pd.Dataframe): Aurora portflio output
+    - aurora_portfolio_summary (pd.Dataframe or AuroraOutputStore): Aurora portflio output
     - capacity_payments (pd.Dataframe): Capacity payment information
     
     Returns:
@@ -30,44 +31,30 @@ def calc_VOM(run_variables_dict,
     aurora_iteration = run_variables_dict['aurora_iteration']
     case_name = run_variables_dict['case_name']
 
-    # Filter the data
-    condition_mask = aurora_portfolio_summary['Condition'] == aurora_condition
-    aurora_iteration_mask = aurora_portfolio_summary['Run_ID'] == aurora_iteration
-    portfolio_id_mask = aurora_portfolio_summary['Portfolio_ID'] == aurora_portfolio_ID
-    aurora_portfolio_summary_filtered = aurora_portfolio_summary[condition_mask & aurora_iteration_mask & portfolio_id_mask]
+    # Aurora cost columns we pull, and the name they go by in the VOM table
+    aurora_cost_columns = {'Resource_Cost_Total': 'Total Owned Cost',
+                           'Market_Purchases_Cost_Total': 'Market Purchases (Energy)',
+                           'Market_Sales_Cost_Total': 'Market Sales (Energy)',
+                           'Contract_Purchases_Cost_Total': 'Contract Cost',
+                           'Contract_Sales_Cost_Total': 'Contract Sales'}
 
+    # Sum every cost column by year in one groupby (years this run has no data for are 0) and apply multiplier
+    aurora_portfolio_summary = get_aurora_output_store(aurora_portfolio_summary)
+    aurora_years = aurora_portfolio_summary.years
+    yearly_data = aurora_portfolio_summary.yearly_sum(list(aurora_cost_columns.keys()), aurora_condition, aurora_iteration, aurora_portfolio_ID)
+    yearly_data = yearly_data.reindex(aurora_years, fill_value=0).rename(columns=aurora_cost_columns).rename_axis(None) * 1000
+
+    # Capacity payments for this scenario and case
     capacity_payments_filtered = capacity_payments[(capacity_payments.Scenarios == iteration) & 
                                                    (capacity_payments['Case Name'] == case_name)]
+    yearly_data['High Load Capacity Payment'] = capacity_payments_filtered[list(aurora_years)].sum().values
 
-    aurora_years = np.sort(aurora_portfolio_summary.Time_Period.unique())
-        
-    # Create a dictionary to store yearly data
-    yearly_data = {
-        'Total Owned Cost': [],
-        'Market Purchases (Energy)': [],
-        'Market Sales (Energy)': [],
-        'Contract Cost': [],
-        'Contract Sales': [],
-        'High Load Capacity Payment': []
-    }
-
-    for year in aurora_years:
-        # select row for current year
-        curr_year_data = aurora_portfolio_summary_filtered.loc[(aurora_portfolio_summary_filtered['Time_Period'] == year)]
-        curr_year_capacity_payments = capacity_payments_filtered[year]
-        
-        # extract data and apply multiplier
-        yearly_data['Total Owned Cost'].append(curr_year_data["Resource_Cost_Total"].sum() * 1000)
-        yearly_data['Market Purchases (Energy)'].append(curr_year_data['Market_Purchases_Cost_Total'].sum() * 1000)
-        yearly_data['Market Sales (Energy)'].append(curr_year_data['Market_Sales_Cost_Total'].sum() * 1000)
-        yearly_data['Contract Cost'].append(curr_year_data['Contract_Purchases_Cost_Total'].sum() * 1000)
-        yearly_data['Contract Sales'].append(curr_year_data['Contract_Sales_Cost_Total'].sum() * 1000)
-        yearly_data['High Load Capacity Payment'].append(curr_year_capacity_payments.sum())
-
-     # Net market purchases = Purchases + Sales
-    yearly_data['Net Market Purchases'] = [sum(costs) for costs in zip(yearly_data['Market Purchases (Energy)'], yearly_data['Market Sales (Energy)'])]
-   
-    years = list(aurora_years)
+    # Net market purchases = Purchases + Sales
+    yearly_data['Net Market Purchases'] = yearly_data['Market Purchases (Energy)'] + yearly_data['Market Sales (Energy)']
+
+    # Put the data into a table with years as columns
+    VOM_portfolio_cost_df = yearly_data[['Total Owned Cost', 'Market Purchases (Energy)', 'Market Sales (Energy)', 'Contract Cost',
+                                         'Contract Sales', 'High Load Capacity Payment', 'Net Market Purchases']].T
     
     # Account for extension periods
     end_year = run_variables_dict['rev_req_end_year']
@@ -77,31 +64,18 @@ def calc_VOM(run_variables_dict,
         end_year = run_variables_dict['solar_extension_end_year']
     if end_effects or solar_extension:
         # add 0s for any years that don't exist between the end of our aurora data and the start of extension
-        if run_variables_dict['rev_req_end_year'] - aurora_years[-1] > 0:
-            for year in range(aurora_years[-1]+1, run_variables_dict['rev_req_end_year']+1):
-                # Add the missing year and set values to 0
-                for variable in yearly_data.keys():
-                    yearly_data[variable].append(0)
-                years.append(years[-1]+1)
-
-        # add extension data
+        VOM_portfolio_cost_df = extend_years(VOM_portfolio_cost_df, aurora_years[-1] + 1, run_variables_dict['rev_req_end_year'], growth_rule='zero')
+
+        # add extension data: grow the last year by inflation (market purchases and sales are 0)
         variables_to_extend = ['Total Owned Cost', 'Contract Cost', 'Contract Sales', 'High Load Capacity Payment', 'Net Market Purchases']
-        for year in range(run_variables_dict['rev_req_end_year']+1, end_year + 1):
-            # Extend variables
-            for variable in variables_to_extend:
-                yearly_data[variable].append(yearly_data[variable][-1] * (1 + inflation_rate))
-            for variable in ['Market Purchases (Energy)', 'Market Sales (Energy)']:
-                yearly_data[variable].append(0)
-            years.append(years[-1]+1)
+        VOM_portfolio_cost_df = extend_years(VOM_portfolio_cost_df, 
+                                             VOM_portfolio_cost_df.columns[-1] + 1, 
+                                             VOM_portfolio_cost_df.columns[-1] + end_year - run_variables_dict['rev_req_end_year'], 
+                                             inflation_rate, 
+                                             rows=variables_to_extend)
 
     # Summarize the data into yearly lists
-    yearly_data['Total Portfolio Cost'] = [sum(costs) for costs in zip(
-        yearly_data['Total Owned Cost'], yearly_data['Net Market Purchases'],
-        yearly_data['Contract Cost'], yearly_data['Contract Sales']
-    )]
-
-    # Create dataframe of our new data
-    VOM_portfolio_cost_df = pd.DataFrame(yearly_data, index=years).T
+    VOM_portfolio_cost_df.loc['Total Portfolio Cost'] = VOM_portfolio_cost_df.loc[['Total Owned Cost', 'Net Market Purchases', 'Contract Cost', 'Contract Sales']].sum()
 
     return(VOM_portfolio_cost_df)
 
@@ -126,12 +100,6 @@ def calc_FOM(run_variables_dict,
     - pd.DataFrame: Dataframe containing FOM costs by year.
     """
     
-    # Create an empty dictionary to store general, non-resource dependent FOM information
-    FOM_yearly_general_dict = {}
-
-    # Add the 'Year' key and assign the years we have for FOM as its value
-    FOM_yearly_general_dict['Year'] = FOM_years
-
     # Preprocess data for calculations and extra data
     ongoing_capex_by_plant_df = scenario_financials_tables['Ongoing CapEx by Plant Summary']
     FOM_yearly = ongoing_capex_by_plant_df[ongoing_capex_by_plant_df['Category'] == 'FOM']
@@ -151,12 +119,18 @@ def calc_FOM(run_variables_dict,
         tax_equity_costs_CA1_CA2_yearly = [0] * len(FOM_years)
         tax_equity_costs_longterm_solar_yearly = [0] * len(FOM_years)
 
-    # Save data into dictionary
-    FOM_yearly_general_dict['FOM'] = FOM_yearly.tolist()
-    FOM_yearly_general_dict['Transmission Upgrade OpEx'] = Transmission_Upgrade_OpEx_yearly.tolist()
-    FOM_yearly_general_dict['DSM Costs'] = DSM_Costs_yearly.tolist()
-    FOM_yearly_general_dict['Tax Equity Costs - CA1 & CA2'] = tax_equity_costs_CA1_CA2_yearly
-    FOM_yearly_general_dict['Tax Equity Costs - Long-Term Solar'] = tax_equity_costs_longterm_solar_yearly
+    # Save data into a table with years as columns
+    FOM_yearly_general_df = pd.DataFrame([FOM_yearly, 
+                                          Transmission_Upgrade_OpEx_yearly, 
+                                          DSM_Costs_yearly, 
+                                          tax_equity_costs_CA1_CA2_yearly, 
+                                          tax_equity_costs_longterm_solar_yearly],
+                                         index=['FOM', 
+                                                'Transmission Upgrade OpEx', 
+                                                'DSM Costs', 
+                                                'Tax Equity Costs - CA1 & CA2', 
+                                                'Tax Equity Costs - Long-Term Solar'],
+                                         columns=FOM_years).astype(np.float64)
 
     # Account for extension periods
     end_year = FOM_years[-1]
@@ -165,22 +139,7 @@ def calc_FOM(run_variables_dict,
     if solar_extension:
         end_year = run_variables_dict['solar_extension_end_year']
     if end_effects or solar_extension:
-        variables_to_extend = list(FOM_yearly_general_dict.keys())
-        variables_to_extend.remove('Year')
-        for year in range(run_variables_dict['rev_req_end_year']+1, end_year + 1):
-            # Extend variables
-            for variable in variables_to_extend:
-                FOM_yearly_general_dict[variable].append(FOM_yearly_general_dict[variable][-1] * (1 + inflation_rate))
-     
-    years = list(FOM_years) + list(range(run_variables_dict['rev_req_end_year']+1, end_year+1))
-    FOM_yearly_general_dict['Year'] = years
-    
-    # Create a DataFrame from the dictionary
-    FOM_yearly_general_df = pd.DataFrame(FOM_yearly_general_dict)
-
-    # Set 'Year' as the index and transpose the DataFrame
-    FOM_yearly_general_df.set_index('Year', inplace=True)
-    FOM_yearly_general_df = FOM_yearly_general_df.T
+        FOM_yearly_general_df = extend_years(FOM_yearly_general_df, run_variables_dict['rev_req_end_year']+1, end_year, inflation_rate)
     
     return(FOM_yearly_general_df)
 
@@ -204,7 +163,7 @@ def calc_new_resource_FOM(run_variables_dict,
     - FOM_years (array): Array for the years for which to calculate FOM.
     - cumulative_installed_capacity_MW_df (pd.Dataframe): Contains capacity buildout for new resources.
     - FOM_2021_kw_year_df (pd.Dataframe): Contains FOM per kW info for different resource types.
-    - inflation_vector (series): Contains inflation scalar for each year.
+    - inflation_vector (series or EscalationIndex): Contains inflation scalar for each year.
     - CCS_inputs_tables, hydrogen_island_inputs (pd.Dataframe): Contain input information for supporting calculations.
 
     Returns:
@@ -212,13 +171,9 @@ def calc_new_resource_FOM(run_variables_dict,
     """
     
     # Unpack run variables we need to index the data
-    aurora_portfolio_ID = run_variables_dict['aurora_portfolio_ID']
     iteration = run_variables_dict['iteration']
     aurora_iteration = run_variables_dict['aurora_iteration']
-    og_end_year = run_variables_dict['rev_req_end_year'] 
-    
-    # Create an empty dictionary to store yearly FOM costs by resource
-    FOM_yearly_by_resource_dict = {'Year': FOM_years}
+    og_end_year = run_variables_dict['rev_req_end_year']
 
     # Create yearly FOM Table (calculates as FOM * capacity * inflation)
     FOM_yearly_by_resource_df = convert_capacity_table_to_cost_table(cumulative_installed_capacity_MW_df,
@@ -239,27 +194,13 @@ def calc_new_resource_FOM(run_variables_dict,
     FOM_yearly_by_resource_df = pd.concat([pd.DataFrame([new_unit_FOM_yearly_sum], index=['New Unit FOM']), FOM_yearly_by_resource_df])
 
     # Handle extension period
-    def add_new_years(df, start_year, end_year, inflation_rate): 
-        # Create a range of new years
-        new_years = range(start_year, end_year + 1)
-        # Create a new DataFrame with zeros
-        new_data = pd.DataFrame(0, columns=new_years, index=df.index)
-        # Update the "New Unit FOM" row with cumulative inflation rates
-        last_value = df.loc['New Unit FOM'].iloc[-1]
-        for year in new_years:
-            last_value *= (1 + inflation_rate)
-            new_data.at['New Unit FOM', year] = last_value
-        # Concatenate the existing DataFrame with the new DataFrame
-        result_df = pd.concat([df, new_data], axis=1)
-        return result_df    
-    
     if end_effects:
         end_year = run_variables_dict['end_effects_end_year']
     if solar_extension:
         end_year = run_variables_dict['solar_extension_end_year']
 
     if end_effects or solar_extension:
-        FOM_yearly_by_resource_df = add_new_years(FOM_yearly_by_resource_df, og_end_year+1, end_year, inflation_rate)
+        FOM_yearly_by_resource_df = extend_years(FOM_yearly_by_resource_df, og_end_year+1, end_year, inflation_rate, rows=['New Unit FOM'])
         
     return FOM_yearly_by_resource_df
 
@@ -327,13 +268,7 @@ def calc_new_resource_AS_RT(run_variables_dict,
     Returns:
     - pd.DataFrame: Dataframe containing FOM costs by year.
     """
-    
-    # Create an empty dictionary to store yearly AS_RT costs by resource
-    AS_RT_yearly_by_resource_dict = {}
 
-    # Add the 'Year' key and assign the years we have for FOM as its value
-    AS_RT_yearly_by_resource_dict['Year'] = FOM_years
-    
     # Create yearly AS_RT Table (calculates as AS_RT $/kw * capacity * inflation)
     AS_RT_yearly_by_resource_df = convert_capacity_table_to_cost_table(cumulative_installed_capacity_MW_df,
                                             AS_RT_inputs, 
@@ -348,26 +283,13 @@ def calc_new_resource_AS_RT(run_variables_dict,
     AS_RT_yearly_by_resource_df.rename(index={AS_RT_yearly_by_resource_df.index[0]: 'New Unit Subhourly / Ancillary Revenue'}, inplace=True)
    
     # Handle extension period
-    def add_new_years(df, start_year, end_year, inflation_rate): 
-        # Create a range of new years
-        new_years = range(start_year, end_year + 1)
-        # Create a new DataFrame with zeros
-        new_data = pd.DataFrame(0, columns=new_years, index=df.index)
-        # Update the "New Unit FOM" row with cumulative inflation rates
-        last_value = df.loc['New Unit Subhourly / Ancillary Revenue'].iloc[-1]
-        for year in new_years:
-            last_value *= (1 + inflation_rate)
-            new_data.at['New Unit Subhourly / Ancillary Revenue', year] = last_value
-        # Concatenate the existing DataFrame with the new DataFrame
-        result_df = pd.concat([df, new_data], axis=1)
-        return result_df    
-    
     if end_effects:
         end_year = run_variables_dict['end_effects_end_year']
     if solar_extension:
         end_year = run_variables_dict['solar_extension_end_year']
 
     if end_effects or solar_extension:
-        AS_RT_yearly_by_resource_df = add_new_years(AS_RT_yearly_by_resource_df, FOM_years[-1]+1, end_year, inflation_rate)
+        AS_RT_yearly_by_resource_df = extend_years(AS_RT_yearly_by_resource_df, FOM_years[-1]+1, end_year, inflation_rate, 
+                                                   rows=['New Unit Subhourly / Ancillary Revenue'])
         
     return(AS_RT_yearly_by_resource_df)
@@ -0,0 +1,15 @@
+"""
+Functions for the WPL revenue requirement model.
+
+The full calculation is exposed as a graph of stages in pipeline_functions (run_pipeline / run_revenue_requirement).
+stage_cache_functions caches stage results between runs, scenario_sweep_functions runs many scenarios in parallel and
+result_export_functions exports their results to Parquet and a summary workbook. sensitivity_functions reruns the
+stages downstream of perturbed financial scalars to make tornado tables.
+"""
+
+from .revenue_requirement_functions import load_model_inputs
+from .stage_cache_functions import StageCache
+from .pipeline_functions import PIPELINE_STAGES, run_pipeline, run_revenue_requirement, get_downstream_outputs
+from .scenario_sweep_functions import build_scenario_runs, run_scenario_sweep
+from .result_export_functions import export_scenario_results
+from .sensitivity_functions import run_sensitivity_analysis, make_tornado_table
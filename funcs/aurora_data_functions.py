@@ -0,0 +1,59 @@
+import pandas as pd
+import numpy as np
+
+# Columns we look Aurora outputs up by, in index order (Portfolio Summary has no Resource_Name column)
+AURORA_INDEX_COLUMNS = ['Condition', 'Run_ID', 'Portfolio_ID', 'Resource_Name', 'Time_Period']
+
+
+class AuroraOutputStore:
+    """
+    Pre-indexed Aurora output ("Portfolio Summary" or "Portfolio Resource" sheet) for fast run lookups.
+
+    The frame is sorted once on a MultiIndex of (Condition, Run_ID, Portfolio_ID, Resource_Name, Time_Period), so
+    selecting a run is a binary search on the sorted index instead of a boolean mask over every row. This keeps
+    lookups flat as we load Aurora outputs covering all portfolios and iterations.
+
+    Parameters:
+    - aurora_output_df (pd.DataFrame): Aurora output as read from the model inputs workbook.
+    """
+
+    def __init__(self, aurora_output_df):
+
+        self.index_columns = [column for column in AURORA_INDEX_COLUMNS if column in aurora_output_df.columns]
+        self.years = np.sort(aurora_output_df['Time_Period'].unique())
+        self.data = aurora_output_df.set_index(self.index_columns).sort_index()
+
+    def select(self, aurora_condition, aurora_iteration, aurora_portfolio_ID, resource_name=None):
+        """
+        Returns the rows for one Aurora run (and optionally one resource), with the index columns back as columns.
+        """
+
+        run_key = [aurora_condition, aurora_iteration, aurora_portfolio_ID]
+        if resource_name is not None:
+            run_key.append(resource_name)
+
+        try:
+            run_positions = self.data.index.get_locs(run_key)
+        except KeyError:
+            # This run isn't in the Aurora output
+            run_positions = []
+
+        return self.data.iloc[run_positions].reset_index()
+
+    def yearly_sum(self, columns, aurora_condition, aurora_iteration, aurora_portfolio_ID, resource_name=None):
+        """
+        Sums the given columns by Time_Period for one Aurora run (and optionally one resource).
+        """
+
+        run_data = self.select(aurora_condition, aurora_iteration, aurora_portfolio_ID, resource_name)
+
+        return run_data.groupby('Time_Period')[columns].sum()
+
+
+def get_aurora_output_store(aurora_output):
+
+    # Functions accept either the raw Aurora frame or a store that was built once up front
+    if isinstance(aurora_output, AuroraOutputStore):
+        return aurora_output
+
+    return AuroraOutputStore(aurora_output)
@@ -2,13 +2,33 @@ import pandas as pd
 import numpy as np
 from datetime import date
 
-def calculate_capital_charge(financial_scalars_inputs, 
-                             rate_base_df,
-                             end_effects=True, 
-                             solar_extension=True,
-                             inflation_rate=0.021):
-   
-    capital_charge_df = rate_base_df.loc[['Ending Rate Base']].copy()
+from .data_processing_functions import extend_years
+
+# Rows of the capital charge table that hold rates rather than dollars (formatted as percents in the outputs)
+CAPITAL_CHARGE_PERCENT_ROWS = ['Existing Equity Cost', 'Existing Debt Cost', 'New Equity Cost', 'New Debt Cost',
+                               'Return on (WACC)', 'Equity % Ratebase']
+
+# Rows that keep growing with inflation from 2055 on
+CAPITAL_CHARGE_EXTENSION_ROWS = ['Return on Ratebase', 'ROE', 'Debt Check']
+
+
+def calculate_capital_charge_rows(financial_scalars_inputs, ending_rate_base, capex, years):
+    """
+    Calculates every row of the capital charge table for one or more scenarios at once.
+
+    Parameters:
+    - financial_scalars_inputs (pd.DataFrame): 'Scalar Inputs' table indexed by 'Scalar Input'.
+    - ending_rate_base (np.ndarray): Ending rate base, shape (scenarios, years).
+    - capex (np.ndarray): CapEx added to the rate base, shape (scenarios, years).
+    - years (array): Years the columns correspond to.
+
+    Returns:
+    - Dictionary of float64 arrays with shape (scenarios, years), where keys are the capital charge row names.
+    """
+
+    ending_rate_base = np.atleast_2d(np.asarray(ending_rate_base, dtype=np.float64))
+    capex = np.atleast_2d(np.asarray(capex, dtype=np.float64))
+    years = np.asarray(years)
 
     ## Extract values from financial_scalars_inputs
     starting_equity = financial_scalars_inputs.loc['Starting Equity ($)', 'Value']
@@ -19,98 +39,109 @@ def calculate_capital_charge(financial_scalars_inputs,
     existing_debt_cost = financial_scalars_inputs.loc['Cost of Debt (Existing)', 'Value']
     new_equity_cost = financial_scalars_inputs.loc['Return on Equity (New)', 'Value']
     new_debt_cost = financial_scalars_inputs.loc['Cost of Debt (New)', 'Value']
+    first_year = financial_scalars_inputs.loc['Start Year', 'Value'] - 1
 
     ## Calculate intermediate values
-    new_capex_cumsum = rate_base_df.loc['CapEx'].cumsum()
+    new_capex_cumsum = np.cumsum(capex, axis=1)
     new_equity = new_capex_cumsum * equity_rate_base
     new_debt = new_capex_cumsum * debt_rate_base
+    total_capital = starting_equity + starting_debt + new_equity + new_debt
+
+    # Blend the existing and new costs of capital, weighted by the share of capital each makes up
+    return_on_WACC = (starting_equity * existing_equity_cost + starting_debt * existing_debt_cost
+                      + new_equity * new_equity_cost + new_debt * new_debt_cost) / total_capital
+    equity_percent_ratebase = (starting_equity + new_equity) / total_capital
+    equity_cost = (existing_equity_cost * starting_equity + new_equity_cost * new_equity) / (starting_equity + new_equity)
+    debt_cost = (existing_debt_cost * starting_debt + new_debt_cost * new_debt) / (starting_debt + new_debt)
+
+    # Mid-year convention: average this year's and last year's ending rate base (the first year has no prior year)
+    prior_ending_rate_base = np.concatenate((ending_rate_base[:, :1], ending_rate_base[:, :-1]), axis=1)
+    average_rate_base = (ending_rate_base + prior_ending_rate_base) / 2
+    is_first_year = years == first_year
+    average_rate_base[:, is_first_year] = ending_rate_base[:, is_first_year]
+
+    # The first year's ROE and debt check are just the ending rate base
+    ROE = np.where(is_first_year, ending_rate_base, average_rate_base * equity_percent_ratebase * equity_cost)
+    debt_check = np.where(is_first_year, ending_rate_base, average_rate_base * (1 - equity_percent_ratebase) * debt_cost)
+
+    scenario_shape = ending_rate_base.shape
+    capital_charge_rows = {
+        'Ending Rate Base': ending_rate_base,
+        'Starting Equity ($)': np.full(scenario_shape, starting_equity, dtype=np.float64),
+        'Starting Debt ($)': np.full(scenario_shape, starting_debt, dtype=np.float64),
+        'New CapEx ($)': new_capex_cumsum,
+        'New Equity ($)': new_equity,
+        'New Debt ($)': new_debt,
+        'Existing Equity Cost': np.full(scenario_shape, existing_equity_cost, dtype=np.float64),
+        'Existing Debt Cost': np.full(scenario_shape, existing_debt_cost, dtype=np.float64),
+        'New Equity Cost': np.full(scenario_shape, new_equity_cost, dtype=np.float64),
+        'New Debt Cost': np.full(scenario_shape, new_debt_cost, dtype=np.float64),
+        'Return on (WACC)': return_on_WACC,
+        'Return on Ratebase': average_rate_base * return_on_WACC,
+        'Equity % Ratebase': equity_percent_ratebase,
+        'ROE': ROE,
+        'Debt Check': debt_check,
+    }
+
+    return capital_charge_rows
+
+
+def calculate_capital_charge(financial_scalars_inputs, 
+                             rate_base_df,
+                             end_effects=True, 
+                             solar_extension=True,
+                             inflation_rate=0.021):
+    """
+    Calculates the capital charge (return on rate base, ROE and debt check) from the rate base.
+
+    All rows are kept as float64 (rates as fractions); use CAPITAL_CHARGE_PERCENT_ROWS to format the rate rows as
+    percents when writing outputs. rate_base_df can also be a stack of scenarios with a MultiIndex whose last level
+    holds the rate base rows (e.g. (scenario, 'Ending Rate Base')), in which case the result is stacked the same way.
+
+    Parameters:
+    - financial_scalars_inputs (pd.DataFrame): 'Scalar Inputs' table indexed by 'Scalar Input'.
+    - rate_base_df (pd.DataFrame): Rate base with 'Ending Rate Base' and 'CapEx' rows and years as columns.
+    - end_effects (bool, optional): Whether the end effects period is modeled. Default is True.
+    - solar_extension (bool, optional): Whether the solar extension period is modeled. Default is True.
+    - inflation_rate (float, optional): Inflation rate for years from 2055 on. Default is 0.021.
+
+    Returns:
+    - pd.DataFrame: Capital charge table with years as columns.
+    """
+
+    stacked = isinstance(rate_base_df.index, pd.MultiIndex)
+    if stacked:
+        ending_rate_base = rate_base_df.xs('Ending Rate Base', level=-1)
+        capex = rate_base_df.xs('CapEx', level=-1).reindex(ending_rate_base.index)
+    else:
+        ending_rate_base = rate_base_df.loc[['Ending Rate Base']]
+        capex = rate_base_df.loc[['CapEx']]
+
+    capital_charge_rows = calculate_capital_charge_rows(financial_scalars_inputs, 
+                                                        ending_rate_base.values, 
+                                                        capex.values, 
+                                                        rate_base_df.columns)
+
+    # Lay the rows out scenario by scenario, in the same order as the single scenario table
+    row_names = list(capital_charge_rows.keys())
+    capital_charge_values = np.stack(list(capital_charge_rows.values()), axis=1).reshape(-1, len(rate_base_df.columns))
+    if stacked:
+        index = pd.MultiIndex.from_tuples([(scenario if isinstance(scenario, tuple) else (scenario,)) + (row_name,)
+                                           for scenario in ending_rate_base.index for row_name in row_names],
+                                          names=list(ending_rate_base.index.names) + [rate_base_df.index.names[-1]])
+    else:
+        index = row_names
+    capital_charge_df = pd.DataFrame(capital_charge_values, index=index, columns=rate_base_df.columns)
 
-    return_on_WACC = (
-        (starting_equity / (starting_equity + starting_debt + new_equity + new_debt) * existing_equity_cost)
-        + (starting_debt / (starting_equity + starting_debt + new_equity + new_debt) * existing_debt_cost)
-        + (new_equity / (starting_equity + starting_debt + new_equity + new_debt) * new_equity_cost)
-        + (new_debt / (starting_equity + starting_debt + new_equity + new_debt) * new_debt_cost)
-    )
-
-    return_on_ratebase = []
-    for year in capital_charge_df.columns:
-        if year == financial_scalars_inputs.loc['Start Year', 'Value'] - 1:
-            return_on_ratebase.append(capital_charge_df[year]['Ending Rate Base'] * return_on_WACC[year])
-        else:
-            return_on_ratebase.append(
-                np.mean([capital_charge_df[year]['Ending Rate Base'], capital_charge_df[year-1]['Ending Rate Base']])
-                * return_on_WACC[year]
-            )
-    return_on_ratebase = pd.Series(return_on_ratebase, index=capital_charge_df.columns)
-    
-    equity_percent_ratebase = ((starting_equity + new_equity) / (starting_equity + new_equity + starting_debt + new_debt))
-
-    ROE = []
-    for year in capital_charge_df.columns:
-        if year == financial_scalars_inputs.loc['Start Year', 'Value'] - 1:
-            ROE.append(capital_charge_df[year]['Ending Rate Base'])
-        else:
-            ROE.append(
-                np.mean([capital_charge_df[year]['Ending Rate Base'], capital_charge_df[year-1]['Ending Rate Base']])
-                * equity_percent_ratebase[year]
-                * ((existing_equity_cost * starting_equity) / (starting_equity + new_equity[year])
-                + (new_equity_cost * new_equity[year]) / (starting_equity + new_equity[year]))
-            )
-    ROE = pd.Series(ROE, index=capital_charge_df.columns)
-
-    debt_check = []
-    for year in capital_charge_df.columns:
-        if year == financial_scalars_inputs.loc['Start Year', 'Value'] - 1:
-            debt_check.append(capital_charge_df[year]['Ending Rate Base'])
-        else:
-            debt_check.append(
-                np.mean([capital_charge_df[year]['Ending Rate Base'], capital_charge_df[year-1]['Ending Rate Base']])
-                * (1 - equity_percent_ratebase[year])
-                * ((existing_debt_cost * starting_debt) / (starting_debt + new_debt[year])
-                + (new_debt_cost * new_debt[year]) / (starting_debt + new_debt[year]))
-            )
-    debt_check = pd.Series(debt_check, index=capital_charge_df.columns)
-        
-        
-    ## Assign values to capital_charge_df
-    capital_charge_df.loc['Starting Equity ($)'] = starting_equity
-    capital_charge_df.loc['Starting Debt ($)'] = starting_debt
-    capital_charge_df.loc['New CapEx ($)'] = new_capex_cumsum
-    capital_charge_df.loc['New Equity ($)'] = new_equity
-    capital_charge_df.loc['New Debt ($)'] = new_debt
-    capital_charge_df.loc['Existing Equity Cost'] = "{:.2f}%".format((existing_equity_cost * 100))
-    capital_charge_df.loc['Existing Debt Cost'] = "{:.2f}%".format((existing_debt_cost * 100))
-    capital_charge_df.loc['New Equity Cost'] = "{:.2f}%".format((new_equity_cost * 100))
-    capital_charge_df.loc['New Debt Cost'] = "{:.2f}%".format((new_debt_cost * 100))
-    capital_charge_df.loc['Return on (WACC)'] = return_on_WACC.apply(lambda x: "{:.2%}".format(x))
-    capital_charge_df.loc['Return on Ratebase'] = return_on_ratebase
-    capital_charge_df.loc['Equity % Ratebase'] = equity_percent_ratebase.apply(lambda x: "{:.2%}".format(x))
-    capital_charge_df.loc['ROE'] = ROE
-    capital_charge_df.loc['Debt Check'] = debt_check
-    
     # Handle weird change for capital charge that starts at 2055
-    def add_new_years_for_capital_charge(df, start_year, end_year, inflation_rate, row_name): 
-        last_value = df.loc[row_name][start_year-1]
-        years = range(start_year, end_year+1)
-        for year in years:
-            last_value *= (1 + inflation_rate)
-            df.at[row_name, year] = last_value
-        return df    
-    
     if end_effects or solar_extension:
-        capital_charge_df = add_new_years_for_capital_charge(capital_charge_df, 
-                                          2055, 
-                                          capital_charge_df.columns[-1], 
-                                          inflation_rate,
-                                          'Return on Ratebase')
-        capital_charge_df = add_new_years_for_capital_charge(capital_charge_df, 
-                                          2055, 
-                                          capital_charge_df.columns[-1], 
-                                          inflation_rate,
-                                          'ROE')
-        capital_charge_df = add_new_years_for_capital_charge(capital_charge_df, 
-                                          2055, 
-                                          capital_charge_df.columns[-1], 
-                                          inflation_rate,
-                                          'Debt Check')
+        if stacked:
+            rows_to_extend = [row for row in capital_charge_df.index if row[-1] in CAPITAL_CHARGE_EXTENSION_ROWS]
+        else:
+            rows_to_extend = CAPITAL_CHARGE_EXTENSION_ROWS
+        capital_charge_df = extend_years(capital_charge_df, 
+                                         2055, 
+                                         capital_charge_df.columns[-1], 
+                                         inflation_rate,
+                                         rows=rows_to_extend)
     return capital_charge_df
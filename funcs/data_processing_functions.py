@@ -1,60 +1,77 @@
 import pandas as pd
 import numpy as np
 
+from .escalation_functions import get_escalation_index
 
-def read_excel_with_tables(df):
+
+def find_table_boundaries(df):
+    """
+    Find where each table starts and ends in a sheet with multiple tables separated by an empty row.
+    Each table is identified by the word "table" in a cell, and its name is in the next cell.
+
+    Parameters:
+    - df (pd.DataFrame): Sheet read in with header=None.
+
+    Returns:
+    - pd.DataFrame: One row per table with the table name and the (positional) rows the table spans, including its header row.
+    """
+
+    # Find every "table" marker with one vectorized string match over each column
+    marker_mask = df.astype(str).apply(lambda column: column.str.lower().str.contains("table", regex=False)).values
+    marker_rows = np.flatnonzero(marker_mask.any(axis=1))
+    # The name is in the cell next to the first "table" cell in the row
+    name_cols = np.minimum(marker_mask[marker_rows].argmax(axis=1) + 1, df.shape[1] - 1)
+
+    # Each table starts the row after its marker and stops at the empty row before the next marker
+    # (the last table runs to the bottom of the sheet)
+    start_rows = marker_rows + 1
+    end_rows = np.append(marker_rows[1:] - 1, len(df))[:len(marker_rows)]
+
+    table_boundaries = pd.DataFrame({'Table': df.values[marker_rows, name_cols].astype(str),
+                                     'Start Row': start_rows,
+                                     'End Row': end_rows})
+
+    return table_boundaries
+
+
+def read_excel_with_tables(df, table_boundaries=None, return_table_boundaries=False):
     """
     Read a single Excel sheet with multiple tables separated by an empty row.
     Each table is identified by the word "table" in a cell, and its name is in the next cell.
 
     Parameters:
-    - file_path: str, path to the Excel file
-    - sheet_name: str, name of the sheet in the Excel file
+    - df (pd.DataFrame): Sheet read in with header=None.
+    - table_boundaries (pd.DataFrame, optional): Output of find_table_boundaries for this sheet, so we can skip the scan.
+    - return_table_boundaries (bool, optional): Whether to also return the table boundaries (e.g. to cache them).
 
     Returns:
     - Dictionary of DataFrames, where keys are table names and values are corresponding DataFrames
+    - pd.DataFrame: The table boundaries, only if return_table_boundaries is True
     """
 
-    # Initialize variables
+    if table_boundaries is None:
+        table_boundaries = find_table_boundaries(df)
+
+    # Remove trailing or leading white spaces once for the whole sheet rather than table by table
+    df = remove_whitespaces_from_df(df)
+
     tables = {}
-    current_table_name = None
-    current_table_start_row = None
-
-    # Iterate through rows
-    for index, row in df.iterrows():
-        if "table" in str(row.values).lower():
-            # Save the current table if it exists
-            if current_table_name is not None:
-                data_table = df.iloc[current_table_start_row:index - 1, :].reset_index(drop=True)
-                # Set the column names to be the values in the first row
-                data_table.columns = data_table.iloc[0]
-                # Drop the first row, which is now redundant as column headers
-                data_table = data_table[1:]
-                # Drop columns without names
-                data_table = data_table.dropna(axis=1, how='all')
-                # Remove trailing or leading white spaces
-                data_table = remove_whitespaces_from_df(data_table)
-                # Now df contains your data with only columns that have column names
-                tables[current_table_name] = data_table
-
-            # Update variables for the new table
-            current_table_name = str(row[1]) # this takes the value from the cell next to the cell that says "table"
-            current_table_start_row = index + 1  # Assuming the next row is empty
-            
-    # Add the last table
-    if current_table_name is not None:
-        data_table = df.iloc[current_table_start_row:index + 1, :].reset_index(drop=True)
+    for table_name, start_row, end_row in table_boundaries.itertuples(index=False):
+        data_table = df.iloc[start_row:end_row, :].reset_index(drop=True)
         # Set the column names to be the values in the first row
         data_table.columns = data_table.iloc[0]
         # Drop the first row, which is now redundant as column headers
         data_table = data_table[1:]
         # Drop columns without names
         data_table = data_table.dropna(axis=1, how='all')
-        # Remove trailing or leading white spaces
-        data_table = remove_whitespaces_from_df(data_table)
+        # Let numeric columns take numeric dtypes now that they are split from the rest of the sheet
+        data_table = data_table.infer_objects()
         # Now df contains your data with only columns that have column names
-        tables[current_table_name] = data_table
-        
+        tables[table_name] = data_table
+
+    if return_table_boundaries:
+        return tables, table_boundaries
+
     return tables
 
 
@@ -94,8 +111,24 @@ def remove_whitespaces_from_df(df):
     - pd.DataFrame: The DataFrame with cleaned values, column headers, and index values.
     """
     
-    # Remove leading and trailing whitespaces from all values
-    df = df.applymap(lambda x: x.strip() if isinstance(x, str) else x)
+    # Remove leading and trailing whitespaces from all values (only object columns can hold strings)
+    df = df.copy()
+    text_columns = np.flatnonzero([pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype) for dtype in df.dtypes])
+    if len(text_columns) > 0:
+        # Strip every text cell in a single vectorized pass over the flattened values
+        values = df.iloc[:, text_columns].to_numpy(dtype=object)
+        flat_values = pd.Series(values.ravel(), dtype=object)
+        try:
+            stripped_values = flat_values.str.strip()
+        except AttributeError:
+            # No strings in these columns
+            stripped_values = None
+        if stripped_values is not None:
+            # .str returns NaN for non-string cells, so keep the original value there
+            flat_values = flat_values.mask(stripped_values.notna(), stripped_values)
+            df.iloc[:, text_columns] = flat_values.to_numpy(dtype=object).reshape(values.shape)
+    # Let columns that only hold numbers go back to numeric dtypes
+    df = df.infer_objects()
 
     # Check if the column name values are strings, then strip whitespaces
     if all(isinstance(columns, str) for columns in df.columns):
@@ -110,44 +143,150 @@ def remove_whitespaces_from_df(df):
 
     
 
-def stack_dataframes(dfs, print_warnings=True):
+def make_year_axis(dfs):
     """
-    Stack a list of DataFrames vertically, ensuring they have the same columns.
+    Makes the shared column axis for a list of DataFrames: every column any of them has, in sorted order, as int years
+    if all of the columns are (whole number) years.
+
+    Parameters:
+    - dfs (list): List of DataFrames.
+
+    Returns:
+    - pd.Index: Sorted union of the columns (int64 if every column is a year).
+    """
+
+    all_columns = pd.Index(sorted(set().union(*(df.columns for df in dfs))))
+
+    # Years read in from Excel can come through as floats (e.g. 2023.0)
+    if pd.api.types.is_numeric_dtype(all_columns) or all_columns.inferred_type in ('integer', 'floating', 'mixed-integer-float'):
+        numeric_columns = np.asarray(all_columns, dtype=np.float64)
+        if np.array_equal(numeric_columns, np.round(numeric_columns)):
+            all_columns = pd.Index(numeric_columns.astype(np.int64))
+
+    return all_columns
+
+
+def stack_dataframes(dfs, print_warnings=True, year_axis=None, return_missing_mask=False):
+    """
+    Stack a list of DataFrames vertically on a shared year axis.
+
+    Numeric DataFrames are copied as blocks into one preallocated float64 array, so the result stays float64. Values a
+    DataFrame doesn't have (e.g. years it doesn't cover) are NaN, and can also be returned as a separate mask.
 
     Parameters:
     - dfs (list): List of DataFrames to be stacked.
     - print_warnings (bool, optional): Whether to print warnings about missing columns. Default is True.
+    - year_axis (pd.Index, optional): Columns of the result. Default is the (sorted) columns of the DataFrame with
+      the most columns, as the stacked tables have always used. Columns only other DataFrames have are left out.
+    - return_missing_mask (bool, optional): Whether to also return a boolean DataFrame that is True where a DataFrame
+      didn't have the column. Default is False.
 
     Returns:
     - pd.DataFrame: Vertically stacked DataFrame.
+    - pd.DataFrame (if return_missing_mask): Missing column mask, shaped like the stacked DataFrame.
     """
-    
-    # Find the DataFrame with the most columns
-    max_columns_df = max(dfs, key=lambda x: len(x.columns))
 
-    # Find the union of all columns
-    all_columns = set(max_columns_df.columns)
+    # Stack on the columns of the widest DataFrame (not the union of all columns, so no years are added)
+    if year_axis is None:
+        year_axis = make_year_axis([max(dfs, key=lambda df: len(df.columns))])
 
     # Print a message about missing columns for each DataFrame
     if print_warnings == True:
         df_names = [f"df{i}" for i in range(1, len(dfs) + 1)]
         for df_name, df in zip(df_names, dfs):
-            missing_columns = all_columns - set(df.columns)
-            if missing_columns:
-                missing_columns_as_strings = {str(value) for value in missing_columns}
+            missing_columns = year_axis.difference(df.columns)
+            if len(missing_columns) > 0:
+                missing_columns_as_strings = [str(value) for value in missing_columns]
                 print(f"{df_name} is missing columns: {', '.join(missing_columns_as_strings)}")
 
-    # Ensure that all DataFrames have the same columns
-    dfs = [df.reindex(columns=all_columns) for df in dfs]
+    # Where each DataFrame's columns go on the year axis
+    column_positions = [year_axis.get_indexer(df.columns) for df in dfs]
+    index = dfs[0].index.append([df.index for df in dfs[1:]]) if len(dfs) > 1 else dfs[0].index
+
+    missing_mask = np.ones((len(index), len(year_axis)), dtype=bool)
+    all_numeric = all(all(pd.api.types.is_numeric_dtype(dtype) for dtype in df.dtypes) for df in dfs)
+
+    if all_numeric:
+        # Copy each DataFrame into its block of one preallocated float64 array
+        stacked_values = np.full((len(index), len(year_axis)), np.nan, dtype=np.float64)
+        start_row = 0
+        for df, positions in zip(dfs, column_positions):
+            end_row = start_row + len(df)
+            kept = positions >= 0
+            stacked_values[start_row:end_row, positions[kept]] = df.to_numpy(dtype=np.float64, na_value=np.nan)[:, kept]
+            missing_mask[start_row:end_row, positions[kept]] = False
+            start_row = end_row
+        concatenated_df = pd.DataFrame(stacked_values, index=index, columns=year_axis)
+    else:
+        # Tables with text in them keep their own dtypes
+        concatenated_df = pd.concat([df.reindex(columns=year_axis) for df in dfs])
+        start_row = 0
+        for df, positions in zip(dfs, column_positions):
+            missing_mask[start_row:start_row + len(df), positions[positions >= 0]] = False
+            start_row += len(df)
+
+    if return_missing_mask:
+        return concatenated_df, pd.DataFrame(missing_mask, index=index, columns=year_axis)
+    return concatenated_df
+
+
+
+def extend_years(df, start_year, end_year, growth_rate=0.021, rows=None, growth_rule='compound'):
+    """
+    Extend yearly values out to end_year (e.g. for the end-effects and solar extension periods) in one vectorized step.
 
-    # Concatenate the DataFrames vertically
-    concatenated_df = pd.concat(dfs)[sorted(list(all_columns))]
-    
-    # Replace NaN values with None (to make it clear we are missing values rather than have compromised data)
-    concatenated_df.replace({np.nan: None}, inplace=True)
-   
-    return(concatenated_df)
+    Each extended row grows from its last value before start_year, so year k of the extension is
+    last_value * (1 + growth_rate) ** k. Years that are not columns yet are added, and rows that are not
+    extended are 0 in those years. Years that already exist are overwritten for the extended rows only.
+
+    Parameters:
+    - df (pd.DataFrame): Data with years as the column names.
+    - start_year (int): First year to fill in.
+    - end_year (int): Last year to fill in.
+    - growth_rate (float, list, or pd.Series, optional): Yearly growth rate, either one rate for all rows or one per row
+      (a Series is matched to rows by index). Default is 0.021.
+    - rows (list, optional): Rows to extend. Default is all rows.
+    - growth_rule (str, optional): 'compound' grows by (1 + growth_rate) each year, 'flat' holds the last value,
+      and 'zero' fills in 0. Default is 'compound'.
 
+    Returns:
+    - pd.DataFrame: Copy of df with the years filled in.
+    """
+
+    new_years = np.arange(start_year, end_year + 1)
+    df = df.copy()
+    if len(new_years) == 0:
+        return df
+    rows = list(df.index) if rows is None else list(rows)
+
+    # Add any years that don't exist yet (filled with 0)
+    missing_years = new_years[~np.isin(new_years, df.columns)]
+    if len(missing_years) > 0:
+        df = pd.concat([df, pd.DataFrame(0.0, index=df.index, columns=missing_years)], axis=1)
+
+    # Growth factor for every row and extension year as one outer product
+    years_into_extension = np.arange(1, len(new_years) + 1)
+    if growth_rule == 'compound':
+        if isinstance(growth_rate, pd.Series):
+            growth_rate = growth_rate.reindex(rows).values
+        growth_rate = np.broadcast_to(np.asarray(growth_rate, dtype=np.float64), (len(rows),))
+        growth_factors = (1 + growth_rate[:, np.newaxis]) ** years_into_extension[np.newaxis, :]
+    elif growth_rule == 'flat':
+        growth_factors = np.ones((len(rows), len(new_years)))
+    elif growth_rule == 'zero':
+        growth_factors = np.zeros((len(rows), len(new_years)))
+    else:
+        raise ValueError(f"Unknown growth rule: {growth_rule}")
+
+    # Grow each row from its last value before the extension starts
+    if growth_rule == 'zero':
+        df.loc[rows, list(new_years)] = growth_factors
+    else:
+        base_year = df.columns[np.flatnonzero(np.asarray(df.columns < start_year))[-1]]
+        last_values = df.loc[rows, base_year].values.astype(np.float64)
+        df.loc[rows, list(new_years)] = last_values[:, np.newaxis] * growth_factors
+
+    return df
 
 
 def convert_capacity_table_to_cost_table(capacity_df, 
@@ -175,11 +314,15 @@ def convert_capacity_table_to_cost_table(capacity_df,
     # If you are adding inflation, multipy your cost dataframe by the infaltion vector
     if inflation_vector is not None:
         
-        # Filter the Inflation Vector to include only values that exist in DataFrame columns
-        filtered_inflation_vector = inflation_vector[inflation_vector.index.isin(total_cost_df.columns)]
+        # Line the inflation vector up with the DataFrame columns. Only the input years are used, not the extrapolated
+        # tail of the escalation index, so years past the inflation input are NaN (and zeroed below) as before
+        escalation_index = get_escalation_index(inflation_vector)
+        cost_years = np.asarray(total_cost_df.columns, dtype=np.float64)
+        aligned_inflation = np.where(cost_years <= escalation_index.last_input_year,
+                                     escalation_index.aligned(total_cost_df.columns), np.nan)
         
         # Multiply each row of the DataFrame by the inflation vector 
-        total_cost_df = total_cost_df * filtered_inflation_vector
+        total_cost_df = total_cost_df * aligned_inflation
         total_cost_df = total_cost_df.fillna(0)
 
     # Add a string to the existing index names
@@ -1,44 +1,47 @@
 import pandas as pd
 import numpy as np
 
-from data_processing_functions import stack_dataframes
+from .data_processing_functions import stack_dataframes
 
 def sum_annual_depreciation(depreciation_dict):
-    
-    # List to store individual dataframes
-    dfs = []
-
-    # Get all unique columns across all dataframes
-    all_columns = set()
-    for df in depreciation_dict.values():
-        if isinstance(df, pd.DataFrame):
-            all_columns.update(df.columns)
-    all_columns.remove('Annual CapEx')   
-
-    # Iterate through the values in the dictionary
-    for df in depreciation_dict.values():
-        # Check if the value is a DataFrame
-        if isinstance(df, pd.DataFrame):
-            # Remove 'Annual CapEx' column if it exists
-            df = df.drop('Annual CapEx', axis=1)
-
-            # Extract the sum row that is the last row of each df
-            depreciation_row = df.iloc[-1]
-            
-            # Append the row as a new DataFrame with all columns
-            full_row = pd.Series(index=all_columns)
-            full_row[depreciation_row.index] = depreciation_row
-            dfs.append(full_row)
-            
-    # Concatenate all the individual dataframes along the columns
-    concatenated_df = pd.concat(dfs, axis=1, ignore_index=True)
-
-    # Take the sum of each column
-    result_df = pd.DataFrame(concatenated_df.sum(axis=1), columns=['Sum Annual Depreciation']).transpose()
-
-    # Convert column names to numeric and then sort
-    result_df.columns = pd.to_numeric(result_df.columns, errors='coerce').astype('Int64')
-    result_df = result_df.sort_index(axis=1)
+    """
+    Sums the annual depreciation row (the last row) of every depreciation table into one row.
+
+    Each table's row is scattered into one float64 array over the years any table covers, so tables with different
+    year ranges are added up without building a row per table. A stacked (plant, vintage) x year frame (e.g. from
+    calc_depreciation_tables) is summed over its rows in one step instead.
+
+    Parameters:
+    - depreciation_dict (dictionary or pd.DataFrame): Depreciation tables by plant (values that aren't DataFrames are
+      skipped), or stacked depreciation with a row per plant and vintage.
+
+    Returns:
+    - pd.DataFrame: 'Sum Annual Depreciation' row with int years as columns.
+    """
+
+    # Stacked depreciation: every vintage of every plant is already on one year axis
+    if isinstance(depreciation_dict, pd.DataFrame):
+        total_depreciation = np.nan_to_num(depreciation_dict.to_numpy(dtype=np.float64)).sum(axis=0)
+        return pd.DataFrame([total_depreciation], index=['Sum Annual Depreciation'],
+                            columns=pd.Index(depreciation_dict.columns, dtype=np.int64))
+
+    # Annual depreciation row of each table, without the 'Annual CapEx' column
+    depreciation_rows = [df.iloc[-1].drop('Annual CapEx', errors='ignore')
+                         for df in depreciation_dict.values() if isinstance(df, pd.DataFrame)]
+
+    # Global year axis across all tables
+    years_by_row = [np.asarray(row.index, dtype=np.int64) for row in depreciation_rows]
+    years = np.unique(np.concatenate(years_by_row)) if years_by_row else np.array([], dtype=np.int64)
+
+    # Scatter every row into the year axis (missing values count as 0)
+    total_depreciation = np.zeros(len(years), dtype=np.float64)
+    if depreciation_rows:
+        year_positions = np.concatenate([np.searchsorted(years, row_years) for row_years in years_by_row])
+        depreciation_values = np.concatenate([pd.to_numeric(row, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+                                              for row in depreciation_rows])
+        np.add.at(total_depreciation, year_positions, np.nan_to_num(depreciation_values))
+
+    result_df = pd.DataFrame([total_depreciation], index=['Sum Annual Depreciation'], columns=pd.Index(years, dtype=np.int64))
 
     return result_df
 
@@ -55,13 +58,33 @@ def calc_deferred_taxes(tax_rate,
                         blended_tax_rate = False, 
                         blended_deferred_tax_new_capital=None,
                         blended_deferred_tax_existing_capital=None,
-                        blended_deferred_tax_liability=None):
+                        blended_deferred_tax_liability=None,
+                        book_depreciation_new_capital=None,
+                        tax_depreciation_new_capital=None):
+    """
+    Calculates deferred taxes on new and existing capital for one tax rate (or blended rates).
+
+    Parameters:
+    - tax_rate (float): Tax rate to calculate deferred taxes at.
+    - BOY_tax, EOY_tax (pd.DataFrame): Existing capital tax value at the beginning and end of each year ('Total' row).
+    - book_depreciation_tables_dict, tax_depreciation_tables_dict (dictionary): Depreciation tables by plant. Not used
+      if book_depreciation_new_capital and tax_depreciation_new_capital are given (can be None then).
+    - existing_plant_depreciation, total_existing_plant_summary, existing_plant_NPV_BOY (pd.DataFrame): Existing plant tables.
+    - blended_tax_rate (bool, optional): Whether to use the blended deferred taxes given below instead of tax_rate.
+    - book_depreciation_new_capital, tax_depreciation_new_capital (pd.DataFrame, optional): Totals from
+      sum_annual_depreciation, so several calls can share one aggregation.
+
+    Returns:
+    - pd.DataFrame: Deferred tax calculations with years as columns.
+    """
     
     ### 1. Calculations 
     
     # New Capital Tax
-    book_depreciation_new_capital = sum_annual_depreciation(book_depreciation_tables_dict)
-    tax_depreciation_new_capital = sum_annual_depreciation(tax_depreciation_tables_dict)
+    if book_depreciation_new_capital is None:
+        book_depreciation_new_capital = sum_annual_depreciation(book_depreciation_tables_dict)
+    if tax_depreciation_new_capital is None:
+        tax_depreciation_new_capital = sum_annual_depreciation(tax_depreciation_tables_dict)
     net_new_capital = tax_depreciation_new_capital - book_depreciation_new_capital 
         
     if blended_tax_rate is False:
@@ -69,34 +92,33 @@ def calc_deferred_taxes(tax_rate,
     else:
         deferred_tax_new_capital = blended_deferred_tax_new_capital
     cumulative_deferred_income_taxes_new_capital = deferred_tax_new_capital.cumsum(axis=1)
-    starting_deferred_tax_liability = pd.DataFrame(0, index=['total'], columns=deferred_tax_new_capital.columns)
-    ending_deferred_tax_liability = pd.DataFrame(0, index=['total'], columns=deferred_tax_new_capital.columns)
-    for year in deferred_tax_new_capital.columns[1:]:
-        ending_deferred_tax_liability[year - 1] = starting_deferred_tax_liability[year - 1][0] + deferred_tax_new_capital[year - 1][0]
-        starting_deferred_tax_liability[year] = ending_deferred_tax_liability[year - 1][0]
+
+    # Ending liability is the running total of deferred taxes, and each year starts where the previous year ended
+    ending_deferred_tax_liability = pd.DataFrame([np.cumsum(deferred_tax_new_capital.values[0].astype(np.float64))],
+                                                 index=['total'], 
+                                                 columns=deferred_tax_new_capital.columns)
+    starting_deferred_tax_liability = ending_deferred_tax_liability.shift(1, axis=1, fill_value=0)
 
     # Existing Capital Tax Value
     tax_depreciation_existing = BOY_tax - EOY_tax
 
     # Deferred Tax Liability Existing 
-    existing_plant_total_depreciation = existing_plant_depreciation.loc[['Total Depreciation']]
-    existing_plant_total_depreciation.index.values[0] = 'Total'
-    depreciation_credit_back = total_existing_plant_summary.loc[['Depreciation "Credit Back"']]
-    depreciation_credit_back.index.values[0] = 'Total'
+    existing_plant_total_depreciation = existing_plant_depreciation.loc[['Total Depreciation']].rename(index={'Total Depreciation': 'Total'})
+    depreciation_credit_back = total_existing_plant_summary.loc[['Depreciation "Credit Back"']].rename(index={'Depreciation "Credit Back"': 'Total'})
     book_depreciation_existing_capital = existing_plant_total_depreciation - depreciation_credit_back.fillna(0)
     deferred_tax_existing_capital = (tax_depreciation_existing - book_depreciation_existing_capital) * tax_rate
     if blended_tax_rate is True:
         deferred_tax_existing_capital = blended_deferred_tax_existing_capital
         
-    # initialize deferred_tax_liability_existing's first year's value and fill in next years
-    existing_plant_NPV_BOY_total = existing_plant_NPV_BOY.loc[['Total NPV BOY']]
-    existing_plant_NPV_BOY_total.index.values[0] = 'Total'
+    # initialize deferred_tax_liability_existing's first year's value and add each prior year's deferred taxes
     if blended_tax_rate is False:
-        deferred_tax_liability_existing = pd.DataFrame(0, index=['total'], columns=BOY_tax.columns)
-        earliest_year = existing_plant_NPV_BOY_total.columns.intersection(BOY_tax.columns)[0]
-        deferred_tax_liability_existing.iloc[0,0] = (existing_plant_NPV_BOY_total.loc[:, earliest_year][0] - BOY_tax.loc[:, earliest_year][0]) * tax_rate
-        for year in deferred_tax_liability_existing.columns[1:]:
-            deferred_tax_liability_existing[year] = deferred_tax_liability_existing[year-1][0] + deferred_tax_existing_capital[year-1][0]
+        existing_plant_NPV_BOY_total = existing_plant_NPV_BOY.loc['Total NPV BOY']
+        earliest_year = existing_plant_NPV_BOY_total.index.intersection(BOY_tax.columns)[0]
+        starting_liability = (existing_plant_NPV_BOY_total[earliest_year] - BOY_tax.loc[:, earliest_year].iloc[0]) * tax_rate
+        prior_year_deferred_taxes = deferred_tax_existing_capital.reindex(columns=BOY_tax.columns).values[0, :-1]
+        deferred_tax_liability_existing = pd.DataFrame([np.cumsum(np.concatenate(([starting_liability], prior_year_deferred_taxes)).astype(np.float64))],
+                                                       index=['total'], 
+                                                       columns=BOY_tax.columns)
     else:
         deferred_tax_liability_existing = blended_deferred_tax_liability
         
@@ -133,3 +155,54 @@ def calc_deferred_taxes(tax_rate,
     deferred_tax_df.index = index_names_list
     
     return deferred_tax_df
+
+
+
+def calc_state_federal_blended_deferred_taxes(state_tax_rate,
+                                              federal_tax_rate,
+                                              BOY_state_tax,
+                                              EOY_state_tax,
+                                              BOY_federal_tax,
+                                              EOY_federal_tax,
+                                              book_depreciation_tables_dict,
+                                              tax_depreciation_df,
+                                              existing_plant_depreciation,
+                                              total_existing_plant_summary,
+                                              existing_plant_NPV_BOY):
+    """
+    Calculates state, federal and blended (state weighted by 1 - federal tax rate) deferred taxes in one call, summing
+    the book depreciation tables and the stacked tax depreciation only once for all three.
+
+    Returns:
+    - deferred_tax_state_df, deferred_tax_federal_df, deferred_tax_blended_df
+    """
+
+    # Shared by all three calculations
+    book_depreciation_new_capital = sum_annual_depreciation(book_depreciation_tables_dict)
+    tax_depreciation_new_capital = sum_annual_depreciation(tax_depreciation_df)
+    existing_plant_inputs = [existing_plant_depreciation, total_existing_plant_summary, existing_plant_NPV_BOY]
+    new_capital_totals = {'book_depreciation_new_capital': book_depreciation_new_capital,
+                          'tax_depreciation_new_capital': tax_depreciation_new_capital}
+
+    ### State Deferred Taxes Only
+    deferred_tax_state_df = calc_deferred_taxes(state_tax_rate, BOY_state_tax, EOY_state_tax, None, None,
+                                                *existing_plant_inputs, **new_capital_totals)
+
+    ### Federal Deferred Taxes Only
+    deferred_tax_federal_df = calc_deferred_taxes(federal_tax_rate, BOY_federal_tax, EOY_federal_tax, None, None,
+                                                  *existing_plant_inputs, **new_capital_totals)
+
+    ### Blended State and Federal Deferred Taxes
+    blended_deferred_tax_new_capital = deferred_tax_federal_df.loc[['Deferred Tax - New Capital']] + deferred_tax_state_df.loc[['Deferred Tax - New Capital']]*(1 - federal_tax_rate)
+    blended_deferred_tax_existing_capital = deferred_tax_federal_df.loc[['Deferred Tax - Existing Capital']] + deferred_tax_state_df.loc[['Deferred Tax - Existing Capital']]*(1 - federal_tax_rate)
+    blended_deferred_tax_liability = deferred_tax_federal_df.loc[['Deferred Tax Liability - Existing']] + deferred_tax_state_df.loc[['Deferred Tax Liability - Existing']]*(1 - federal_tax_rate)
+
+    deferred_tax_blended_df = calc_deferred_taxes(federal_tax_rate, BOY_federal_tax, EOY_federal_tax, None, None,
+                                                  *existing_plant_inputs,
+                                                  blended_tax_rate = True,
+                                                  blended_deferred_tax_new_capital = blended_deferred_tax_new_capital,
+                                                  blended_deferred_tax_existing_capital = blended_deferred_tax_existing_capital,
+                                                  blended_deferred_tax_liability = blended_deferred_tax_liability,
+                                                  **new_capital_totals)
+
+    return deferred_tax_state_df, deferred_tax_federal_df, deferred_tax_blended_df
@@ -1,107 +1,207 @@
 import pandas as pd
 import numpy as np
+import re
 
 
-def create_book_depreciation_schedule(cost_vector, depreciation_length, fixed_start_year = None):
+def build_depreciation_matrix(capex, depreciation_rates):
+    """
+    Builds a vintage-by-year depreciation matrix in a single NumPy operation.
+
+    Row i is the capex placed in service in year i of the horizon and column j is the year the depreciation lands in.
+    Each vintage depreciates capex[i] * depreciation_rates[j - i] for as many years as there are rates, which gives a
+    banded (Toeplitz-style) matrix. Leading axes are broadcast, so a (plants x years) capex matrix with a
+    (plants x life) rate matrix returns a (plants x vintages x years) array.
+
+    Parameters:
+    - capex (array): Capex by year on the depreciation horizon, shape (..., years).
+    - depreciation_rates (array): Share of the capex depreciated in each year of the asset's life, shape (..., life).
+
+    Returns:
+    - np.ndarray: float64 depreciation matrix, shape (..., years, years).
+    """
+
+    capex = np.asarray(capex, dtype=np.float64)
+    depreciation_rates = np.asarray(depreciation_rates, dtype=np.float64)
+    horizon_length = capex.shape[-1]
+    life = depreciation_rates.shape[-1]
+
+    # Offset of every (vintage, year) cell from the vintage's in-service year
+    offsets = np.arange(horizon_length)[np.newaxis, :] - np.arange(horizon_length)[:, np.newaxis]
+    in_band = (offsets >= 0) & (offsets < life)
+
+    # Look up the rate for each cell and scale it by that vintage's capex
+    banded_rates = np.where(in_band, depreciation_rates[..., np.clip(offsets, 0, life - 1)], 0.0)
+
+    return capex[..., :, np.newaxis] * banded_rates
+
+
+def find_depreciation_start_years(cost_vector, fixed_start_year = None):
 
     # Extract years during which depreciations will come in from the column names of the cost_vector DataFrame
     depreciation_start_years = cost_vector.loc[:, (cost_vector != 0).any(axis=0)].columns.astype(int)
-    
+
     # If we have a set start year we want to use for depreciation, clip the depreciation years to start with that year
+    # (by value, so the columns don't have to be in order; if no year is that late, every year is kept)
     if fixed_start_year is not None:
-        # Find the index of the start_year in the array
-        start_index = np.argmax(depreciation_start_years >= fixed_start_year)
-        # Return the filtered array from the start_year onwards
-        depreciation_start_years = depreciation_start_years[start_index:]
+        after_fixed_start = depreciation_start_years >= fixed_start_year
+        if after_fixed_start.any():
+            depreciation_start_years = depreciation_start_years[after_fixed_start]
+
+    return depreciation_start_years
+
+
+def format_depreciation_schedule(depreciation_matrix, full_range_of_years, cost_vector, total_row_name):
+
+    # Line the capex stream up with the schedule's years (years outside the capex stream have no capex)
+    annual_capex = pd.Series(cost_vector.iloc[0].values, index=cost_vector.columns.astype(int))
+    annual_capex = annual_capex.reindex(full_range_of_years).fillna(0).values.astype(np.float64)
+
+    # Put "Annual CapEx" in the first column and add a row at the bottom that sums every column
+    schedule_values = np.column_stack((annual_capex, depreciation_matrix))
+    schedule_values = np.vstack((schedule_values, schedule_values.sum(axis=0)))
+
+    depreciation_schedule = pd.DataFrame(schedule_values,
+                                         index=list(full_range_of_years) + [total_row_name],
+                                         columns=["Annual CapEx"] + list(full_range_of_years))
+
+    return(depreciation_schedule)
+
+
+def create_book_depreciation_schedule(cost_vector, depreciation_length, fixed_start_year = None):
+
+    depreciation_start_years = find_depreciation_start_years(cost_vector, fixed_start_year)
 
     # Make a vector of years during which depreciation will occur
     # To do, we take the last year we have depreciation come in and extend that by the depreciation length
-    depreciation_years = np.concatenate((depreciation_start_years, 
-                                         np.arange(depreciation_start_years[-1] + 1, depreciation_start_years[-1] + depreciation_length, 1))) 
-
-    # Initialize an empty DataFrame
-    depreciation_schedule = pd.DataFrame(index=depreciation_start_years, columns=depreciation_years)
-    
-    # Fill in the depreciation values for each year
-    for year in depreciation_start_years:
-        # Calculate the amount we depreciate by each year (total depreciation / depreciation period)
-        depreciation_value = (cost_vector[year] / depreciation_length).values 
-        # Fill in each year's line
-        for i in range(year, year + depreciation_length):
-            depreciation_schedule.at[year, i] = depreciation_value
-            
-    # Reindex to include missing years, fill NaN values with 0, and sort annually
-    full_range_of_years = np.arange(depreciation_years.min(), depreciation_years.max() + 1)
-    depreciation_schedule = depreciation_schedule.reindex(index=full_range_of_years, columns=full_range_of_years, fill_value=0)
-    depreciation_schedule = depreciation_schedule[depreciation_schedule.columns.sort_values()]
-    
-    # Insert a new column "Annual CapEx" at the start
-    depreciation_schedule.insert(0, "Annual CapEx", cost_vector.squeeze())
-    
-    # Fill NaN values with 0
-    depreciation_schedule = depreciation_schedule.fillna(0)
-    
-    # Add a row at the bottom that sums every column
-    depreciation_schedule.loc["Annual Book Depreciation"] = depreciation_schedule.sum()
+    full_range_of_years = np.arange(depreciation_start_years.min(), depreciation_start_years.max() + depreciation_length)
 
-    return(depreciation_schedule)
+    # Only vintages in our depreciation start years get depreciated
+    capex = cost_vector.iloc[0][cost_vector.columns.astype(int).isin(depreciation_start_years)]
+    capex.index = capex.index.astype(int)
+    capex = capex.reindex(full_range_of_years, fill_value=0)
 
+    # Straight-line depreciation: each vintage depreciates (total depreciation / depreciation period) every year
+    straight_line_rates = np.full(depreciation_length, 1 / depreciation_length)
+    depreciation_matrix = build_depreciation_matrix(capex.values, straight_line_rates)
 
-def create_tax_depreciation_schedule(cost_vector, depreciation_length, tax_depreciation_schedules, fixed_start_year = None):
+    return format_depreciation_schedule(depreciation_matrix, full_range_of_years, cost_vector, "Annual Book Depreciation")
 
-    # Find the correct tax depreciation schedule
-    curr_tax_depreciation_schedule = tax_depreciation_schedules[tax_depreciation_schedules['Depreciation Schedule'].str.contains(str(depreciation_length))]
-    curr_tax_depreciation_schedule = curr_tax_depreciation_schedule.drop(columns='Depreciation Schedule')
-    curr_tax_depreciation_schedule = curr_tax_depreciation_schedule.values[0]
 
-    # Extract years during which depreciations will come in from the column names of the cost_vector DataFrame
-    depreciation_start_years = cost_vector.loc[:, (cost_vector != 0).any(axis=0)].columns.astype(int)
+def index_tax_depreciation_schedules(tax_depreciation_schedules):
+    """
+    Pre-indexes the MACRS tables by tax life so we only search the schedule labels once per run.
 
-    # If we have a set start year we want to use for depreciation, clip the depreciation years to start with that year
-    if fixed_start_year is not None:
-        # Find the index of the start_year in the array
-        start_index = np.argmax(depreciation_start_years >= fixed_start_year)
-        # Return the filtered array from the start_year onwards
-        depreciation_start_years = depreciation_start_years[start_index:]
+    Parameters:
+    - tax_depreciation_schedules (pd.DataFrame): 'Tax Depreciation Schedules - Half Year Convention' input table.
+
+    Returns:
+    - Dictionary of float64 rate vectors, where keys are tax lives (years) and values are the MACRS percent for each year.
+    """
+
+    indexed_schedules = {}
+    for _, schedule in tax_depreciation_schedules.iterrows():
+        # Pull the tax life out of the schedule label (e.g. "5-Year MACRS" -> 5)
+        tax_life = re.search(r'\d+', str(schedule['Depreciation Schedule']))
+        if tax_life is None or int(tax_life.group()) in indexed_schedules:
+            continue
+        rates = pd.to_numeric(schedule.drop('Depreciation Schedule'), errors='coerce').fillna(0).values.astype(np.float64)
+        indexed_schedules[int(tax_life.group())] = np.trim_zeros(rates, 'b')
+
+    return indexed_schedules
+
+
+def create_tax_depreciation_schedule(cost_vector, depreciation_length, tax_depreciation_schedules, fixed_start_year = None):
+
+    # Find the correct tax depreciation schedule (accepts the input table or the output of index_tax_depreciation_schedules)
+    if not isinstance(tax_depreciation_schedules, dict):
+        tax_depreciation_schedules = index_tax_depreciation_schedules(tax_depreciation_schedules)
+    curr_tax_depreciation_schedule = tax_depreciation_schedules[depreciation_length]
+
+    depreciation_start_years = find_depreciation_start_years(cost_vector, fixed_start_year)
 
     # Make a vector of years during which depreciation will occur
     # To do, we take the last year we have depreciation come in and extend that by the depreciation length
-    depreciation_years = np.arange(min(depreciation_start_years), max(depreciation_start_years) + depreciation_length + 1, 1)
-   
-    # Initialize an empty DataFrame
-    depreciation_schedule = pd.DataFrame(index=depreciation_start_years, columns=depreciation_years)
-
-    # Fill in the depreciation values for each year
-    for year in depreciation_start_years:
-
-        # Calculate the amount we depreciate by each year (total depreciation * MACRS percent for each year)
-        depreciation_values = cost_vector[year].values * curr_tax_depreciation_schedule
-        # Put the values in a format we can insert into the depreciation table
-        data_to_insert = np.trim_zeros(depreciation_values)
-        data_to_insert = np.array([data_to_insert]).astype('f')
-
-        # Specify the first column name and the row name where you want to insert the array
-        first_col_name_to_insert = year  # Adjust as needed
-        row_name_to_insert = year  # Adjust as needed
-
-        # Get the index of the first column to determine the insertion location
-        col_index_to_insert = depreciation_schedule.columns.get_loc(first_col_name_to_insert)
-
-        # Insert the array into the DataFrame at the specified location
-        depreciation_schedule.loc[row_name_to_insert, depreciation_schedule.columns[col_index_to_insert]:depreciation_schedule.columns[col_index_to_insert + data_to_insert.shape[1] - 1]] = data_to_insert
-       
-    # Reindex to include missing years, fill NaN values with 0, and sort annually
-    full_range_of_years = np.arange(depreciation_years.min(), depreciation_years.max() + 1)
-    depreciation_schedule = depreciation_schedule.reindex(index=full_range_of_years, columns=full_range_of_years, fill_value=0)
-    depreciation_schedule = depreciation_schedule[depreciation_schedule.columns.sort_values()]
-
-    # Fill NaN values with 0
-    depreciation_schedule = depreciation_schedule.fillna(0)
-    
-    # Insert a new column "Annual CapEx" at the start
-    depreciation_schedule.insert(0, "Annual CapEx", cost_vector.squeeze())
-
-    # Add a row at the bottom that sums every column
-    depreciation_schedule.loc["Annual Tax Depreciation"] = depreciation_schedule.sum()
+    # (half year convention means MACRS schedules have one more year than the tax life)
+    full_range_of_years = np.arange(depreciation_start_years.min(), depreciation_start_years.max() + depreciation_length + 1)
 
-    return(depreciation_schedule)
+    # Only vintages in our depreciation start years get depreciated
+    capex = cost_vector.iloc[0][cost_vector.columns.astype(int).isin(depreciation_start_years)]
+    capex.index = capex.index.astype(int)
+    capex = capex.reindex(full_range_of_years, fill_value=0)
+
+    # Each vintage depreciates by total depreciation * MACRS percent for each year
+    depreciation_matrix = build_depreciation_matrix(capex.values, curr_tax_depreciation_schedule)
+
+    return format_depreciation_schedule(depreciation_matrix, full_range_of_years, cost_vector, "Annual Tax Depreciation")
+
+
+def create_tax_depreciation_schedules(new_capex_df, tax_lives, tax_depreciation_schedules, fixed_start_year = None):
+    """
+    Calculates MACRS tax depreciation for every plant in one vectorized pass.
+
+    Each plant's annual tax depreciation is the convolution of its capex stream with its MACRS rate vector. We build
+    the full (plants x vintages x years) depreciation array at once on a shared year axis and slice the per-plant
+    tables out of it.
+
+    Parameters:
+    - new_capex_df (pd.DataFrame): Capex by plant (rows) and year (columns).
+    - tax_lives (dict or pd.Series): Tax life (MACRS years) for each plant in new_capex_df.
+    - tax_depreciation_schedules (pd.DataFrame or dict): MACRS input table, or the output of index_tax_depreciation_schedules.
+    - fixed_start_year (int, optional): Vintages before this year are not depreciated.
+
+    Returns:
+    - Dictionary of tax depreciation tables by plant (same layout as create_tax_depreciation_schedule).
+    - pd.DataFrame: Stacked depreciation indexed by (Plant, Vintage) with a column for every year on the shared axis.
+    """
+
+    if not isinstance(tax_depreciation_schedules, dict):
+        tax_depreciation_schedules = index_tax_depreciation_schedules(tax_depreciation_schedules)
+
+    plants = list(new_capex_df.index)
+    capex_years = new_capex_df.columns.astype(int).values
+    capex_values = new_capex_df.fillna(0).values.astype(np.float64)
+    plant_tax_lives = np.array([int(tax_lives[plant]) for plant in plants])
+
+    # Stack each plant's MACRS rate vector into one zero-padded rate matrix
+    plant_rates = [tax_depreciation_schedules[tax_life] for tax_life in plant_tax_lives]
+    rate_length = max([len(rates) for rates in plant_rates] + [plant_tax_lives.max() + 1])
+    rate_matrix = np.zeros((len(plants), rate_length))
+    for i, rates in enumerate(plant_rates):
+        rate_matrix[i, :len(rates)] = rates
+
+    # Find each plant's depreciation start years (same fixed start year clipping as find_depreciation_start_years)
+    has_capex = capex_values != 0
+    start_year_mask = has_capex
+    if fixed_start_year is not None:
+        after_fixed_start = has_capex & (capex_years >= fixed_start_year)[np.newaxis, :]
+        start_year_mask = np.where(after_fixed_start.any(axis=1)[:, np.newaxis], after_fixed_start, has_capex)
+
+    # Shared year axis from the first capex year through the last year any vintage can depreciate in
+    year_axis = np.arange(capex_years.min(), capex_years.max() + rate_length)
+    capex_matrix = np.zeros((len(plants), len(year_axis)))
+    capex_matrix[:, capex_years - year_axis[0]] = np.where(start_year_mask, capex_values, 0)
+
+    # (plants x vintages x years) depreciation; summing over vintages gives each plant's convolution
+    depreciation_array = build_depreciation_matrix(capex_matrix, rate_matrix)
+
+    # Slice out the per-plant tables the notebook displays and aggregates
+    tax_depreciation_tables_dict = {}
+    for i, plant in enumerate(plants):
+        if not start_year_mask[i].any():
+            tax_depreciation_tables_dict[plant] = "None because no CapEx provided"
+            continue
+        plant_start_years = capex_years[start_year_mask[i]]
+        full_range_of_years = np.arange(plant_start_years.min(), plant_start_years.max() + plant_tax_lives[i] + 1)
+        year_positions = full_range_of_years - year_axis[0]
+        depreciation_matrix = depreciation_array[i][np.ix_(year_positions, year_positions)]
+        tax_depreciation_tables_dict[plant] = format_depreciation_schedule(depreciation_matrix,
+                                                                           full_range_of_years,
+                                                                           new_capex_df.loc[[plant]],
+                                                                           "Annual Tax Depreciation")
+
+    # The whole array as one (plant, vintage) x year frame, so totals across plants are a single sum
+    depreciation_df = pd.DataFrame(depreciation_array.reshape(-1, len(year_axis)),
+                                   index=pd.MultiIndex.from_product([plants, year_axis], names=['Plant', 'Vintage']),
+                                   columns=year_axis)
+
+    return tax_depreciation_tables_dict, depreciation_df
@@ -0,0 +1,76 @@
+import pandas as pd
+import numpy as np
+
+
+class EscalationIndex:
+    """
+    Inflation (escalation) index by year, built once per run over the full horizon.
+
+    The input inflation vector is kept as is, and years after it grow from its last value at inflation_rate, the same
+    way extend_years grows the other tables. Values are stored in one array by year, so looking up a year or lining
+    the index up with a table's columns is just array indexing.
+
+    Parameters:
+    - inflation_vector (pd.Series): Inflation scalar by year (e.g. 'Inflation Vector - Base Year 2021$').
+    - end_year (int, optional): Last year of the horizon. Default is the last year of inflation_vector.
+    - inflation_rate (float, optional): Inflation rate for years after inflation_vector. Default is 0.021.
+    """
+
+    def __init__(self, inflation_vector, end_year=None, inflation_rate=0.021):
+
+        inflation_vector = inflation_vector.sort_index()
+        input_years = np.asarray(inflation_vector.index, dtype=np.int64)
+
+        self.first_year = int(input_years[0])
+        self.last_input_year = int(input_years[-1])
+        self.end_year = self.last_input_year if end_year is None else max(int(end_year), self.last_input_year)
+        self.inflation_rate = inflation_rate
+
+        # Input vector first, then the extrapolated tail
+        self.values = np.full(self.end_year - self.first_year + 1, np.nan, dtype=np.float64)
+        self.values[input_years - self.first_year] = inflation_vector.values.astype(np.float64)
+        tail_length = self.end_year - self.last_input_year
+        self.values[len(self.values) - tail_length:] = (self.values[self.last_input_year - self.first_year]
+                                                        * (1 + inflation_rate) ** np.arange(1, tail_length + 1))
+
+    def __getitem__(self, year):
+
+        position = int(year) - self.first_year
+        if position < 0 or position >= len(self.values):
+            raise KeyError(year)
+
+        return self.values[position]
+
+    def aligned(self, years, fill_value=np.nan):
+        """
+        Returns the index for each of the given years (e.g. a table's columns), with fill_value for years outside
+        the horizon.
+        """
+
+        positions = np.asarray(years, dtype=np.float64).astype(np.int64) - self.first_year
+        in_horizon = (positions >= 0) & (positions < len(self.values))
+
+        aligned_values = np.full(len(positions), fill_value, dtype=np.float64)
+        aligned_values[in_horizon] = self.values[positions[in_horizon]]
+
+        return aligned_values
+
+    def to_series(self, end_year=None):
+        """
+        Returns the index as a Series by year, through end_year (default is the end of the horizon).
+        """
+
+        end_year = self.end_year if end_year is None else end_year
+        years = np.arange(self.first_year, end_year + 1)
+
+        return pd.Series(self.aligned(years), index=pd.Index(years, name='Year'), name='Scalar')
+
+
+def get_escalation_index(inflation_vector):
+
+    # Functions accept either the raw inflation vector or an index that was built once up front
+    if isinstance(inflation_vector, EscalationIndex):
+        return inflation_vector
+
+    return EscalationIndex(inflation_vector)
+
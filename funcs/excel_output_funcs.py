@@ -1,24 +1,33 @@
+import itertools
 import pandas as pd
 import numpy as np
-from openpyxl.styles import PatternFill, Font, Alignment, Border, Side
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import PatternFill, Font, Alignment, Border, Side, NamedStyle
 import re
 from openpyxl.styles import numbers
 
+from .capital_charge_functions import CAPITAL_CHARGE_PERCENT_ROWS
+
 ### Formatting Functions
 
 # Function to format a DataFrame with currency values
-def style_dataframe_with_currency(df):
+def style_dataframe_with_currency(df, percent_rows=None):
     """
     Styles DataFrame with currency format.
 
     Parameters:
         df (DataFrame): Input DataFrame.
+        percent_rows (list): Rows holding rates, which are formatted as percents instead.
 
     Returns:
         DataFrame: Styled DataFrame with currency format.
     """
     styled_df = df.copy()
     styled_df = styled_df.applymap(lambda x: '${:,.0f}'.format(x) if pd.notna(x) and np.issubdtype(type(x), np.number) else x)
+    if percent_rows is not None:
+        percent_rows = [row for row in percent_rows if row in df.index]
+        styled_df.loc[percent_rows] = df.loc[percent_rows].applymap(lambda x: '{:.2%}'.format(x) if pd.notna(x) and np.issubdtype(type(x), np.number) else x)
     return styled_df
 
 # Function to apply color fill to a row in a worksheet
@@ -257,7 +266,10 @@ def add_data_to_worksheet(ws, df,
                           formatting_type=None, 
                           use_cols_as_header=False, 
                           bold_last_row=False,
-                          bold_first_row=False):
+                          bold_first_row=False,
+                          money_format=False,
+                          percent_rows=None,
+                          label_columns=None):
     """
     Adds data to a worksheet.
 
@@ -268,6 +280,9 @@ def add_data_to_worksheet(ws, df,
         use_cols_as_header (bool): Whether to use DataFrame columns as header row.
         bold_last_row (bool): Whether to bold the last row.
         bold_first_row (bool): Whether to bold the first row.
+        money_format (bool): Whether to give raw numbers the currency format (see get_number_formats).
+        percent_rows (list): Rows holding rates, which get the percent format. Default is PERCENT_ROW_NAMES.
+        label_columns (list): Columns holding labels, which are never given a number format.
 
     Returns:
         None
@@ -282,12 +297,22 @@ def add_data_to_worksheet(ws, df,
         ws.append(header_row)
         curr_row_val += 1
     
+    # Number format of each cell, picked from the column dtypes and row names
+    number_formats = get_number_formats(df, percent_rows=percent_rows, money_format=money_format,
+                                        label_columns=label_columns)
+
     # Add the data rows
-    for index, row in df.iterrows():
-        ws.append(list(row))
-        # Apply currency formatting only to cells with "$" sign in the row
+    for row_number, (index, row) in enumerate(df.iterrows()):
+        # Missing values are written as empty cells
+        ws.append([None if pd.api.types.is_scalar(value) and pd.isna(value) else value for value in row])
         for col_num, value in enumerate(row, start=1):
-            if isinstance(value, str) and '$' in value:
+            # Raw numbers get their number format directly
+            if number_formats[row_number, col_num - 1] != 'General':
+                cell = ws.cell(row=curr_row_val, column=col_num)
+                cell.number_format = number_formats[row_number, col_num - 1]
+                cell.alignment = Alignment(horizontal='center')
+            # Apply currency formatting to cells already styled with a "$" sign
+            elif isinstance(value, str) and '$' in value:
                 apply_currency_format(ws, curr_row_val, col_num)
         curr_row_val += 1
 
@@ -339,12 +364,14 @@ def display_alternating_dict_dataframes_with_headers(worksheet, book_dict, tax_d
 
         book_value = book_dict[book_key]
         if isinstance(book_value, pd.DataFrame):
-            book_value_styled = style_dataframe_with_currency(book_value).reset_index().rename(columns={'index': 'Book Depreciation'})
+            book_value_df = book_value.reset_index().rename(columns={'index': 'Book Depreciation'})
             add_data_to_worksheet(worksheet,
-                                  book_value_styled,
+                                  book_value_df,
                                   use_cols_as_header=True,
                                   formatting_type="Normal Text and Blue Money",
-                                  bold_last_row=True)
+                                  bold_last_row=True,
+                                  money_format=True,
+                                  label_columns=[book_value_df.columns[0]])
         else:
             # If not a DataFrame, create a single-row DataFrame with the string value
             single_row_df = pd.DataFrame([book_value], columns=['Component'])
@@ -356,12 +383,14 @@ def display_alternating_dict_dataframes_with_headers(worksheet, book_dict, tax_d
 
         tax_value = tax_dict[tax_key]
         if isinstance(tax_value, pd.DataFrame):
-            tax_value_styled = style_dataframe_with_currency(tax_value).reset_index().rename(columns={'index': 'Tax Depreciation'})
+            tax_value_df = tax_value.reset_index().rename(columns={'index': 'Tax Depreciation'})
             add_data_to_worksheet(worksheet,
-                                  tax_value_styled,
+                                  tax_value_df,
                                   use_cols_as_header=True,
                                   formatting_type="Normal Text and Blue Money",
-                                  bold_last_row=True)
+                                  bold_last_row=True,
+                                  money_format=True,
+                                  label_columns=[tax_value_df.columns[0]])
         else:
             # If not a DataFrame, create a single-row DataFrame with the string value
             single_row_df = pd.DataFrame([tax_value], columns=['Component'])
@@ -370,3 +399,254 @@ def display_alternating_dict_dataframes_with_headers(worksheet, book_dict, tax_d
                                   use_cols_as_header=True,
                                   formatting_type="Normal Text and Blue Money",
                                   bold_last_row=True)
+
+
+###### Number Format Schema
+
+# Number formats for money and rate cells
+CURRENCY_FORMAT = numbers.BUILTIN_FORMATS[44]
+PERCENT_FORMAT = '0.00%'
+
+# Rows holding rates (as fractions) rather than dollars, formatted as percents in every table they appear in
+PERCENT_ROW_NAMES = ['Return on %'] + CAPITAL_CHARGE_PERCENT_ROWS
+
+
+def get_number_formats(df, percent_rows=None, money_format=True, label_columns=None):
+    """
+    Picks the Excel number format of every cell of a DataFrame from its dtypes and row names, so numbers can be
+    written as raw values instead of pre-formatted strings.
+
+    Numeric columns are numbers all the way down and take their format as a whole; only object columns (e.g. text
+    mixed with numbers) are checked cell by cell. Numbers in percent rows get PERCENT_FORMAT, other numbers get
+    CURRENCY_FORMAT, and text and missing values stay 'General'.
+
+    Parameters:
+        df (DataFrame): Table to be written, with row names as the index.
+        percent_rows (list): Rows holding rates. Default is PERCENT_ROW_NAMES.
+        money_format (bool): Whether to give numbers outside the percent rows the currency format.
+        label_columns (list): Columns holding labels rather than amounts (e.g. an index moved into the table by
+            reset_index), which are left unformatted.
+
+    Returns:
+        np.ndarray: Number format of each cell, shaped like df.
+    """
+    percent_rows = PERCENT_ROW_NAMES if percent_rows is None else percent_rows
+
+    # Format by row name
+    is_percent_row = df.index.isin(percent_rows)
+    row_formats = np.where(is_percent_row, PERCENT_FORMAT, CURRENCY_FORMAT if money_format else 'General')
+
+    # Which cells hold numbers, by column dtype
+    is_number = np.zeros(df.shape, dtype=bool)
+    label_columns = [] if label_columns is None else label_columns
+    for col_position, dtype in enumerate(df.dtypes):
+        column = df.iloc[:, col_position]
+        if df.columns[col_position] in label_columns:
+            continue
+        if pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype):
+            is_number[:, col_position] = column.notna().values
+        elif dtype == object:
+            is_number[:, col_position] = [isinstance(value, (int, float, np.number)) and not isinstance(value, (bool, np.bool_))
+                                          and not pd.isna(value) for value in column.values]
+
+    return np.where(is_number, row_formats[:, np.newaxis], 'General').astype(object)
+
+
+###### Streaming Report Writer
+
+# Every header row is filled out to this many columns
+HEADER_ROW_COLUMNS = 100
+
+
+class ReportWriter:
+    """
+    Writes the model results workbook row by row in openpyxl's write-only mode.
+
+    Rows are streamed to the file instead of kept in memory, numbers are written as numbers with currency or percent
+    number formats (rather than pre-formatted strings), and each combination of formatting is registered once as a
+    named style that every cell using it shares. The methods mirror add_header_row, add_data_to_worksheet and
+    display_alternating_dict_dataframes_with_headers, but take the unstyled DataFrames.
+
+    Parameters:
+        output_filename (str): Path to save the workbook to.
+        sheet_title (str): Title of the results sheet.
+    """
+
+    def __init__(self, output_filename, sheet_title='Sheet'):
+
+        self.output_filename = output_filename
+        self.workbook = Workbook(write_only=True)
+        self.worksheet = self.workbook.create_sheet(sheet_title)
+        self.styles = {}
+
+        # Column widths have to be set before any rows are written
+        self.worksheet.column_dimensions['A'].width = 40
+        self.worksheet.column_dimensions['B'].width = 25
+        for col_letter in range(ord('C'), ord('Z')+1):
+            self.worksheet.column_dimensions[chr(col_letter)].width = 18
+
+    def get_style(self, bold=False, color=None, center=False, border=False, fill_color=None, number_format='General'):
+        """
+        Returns the name of the named style with this formatting, registering it with the workbook the first time.
+        """
+
+        style_key = (bold, color, center, border, fill_color, number_format)
+        if style_key not in self.styles:
+            style_name = f'Report Style {len(self.styles) + 1}'
+            style = NamedStyle(name=style_name, number_format=number_format)
+            style.font = Font(bold=bold, color=color)
+            if center:
+                style.alignment = Alignment(horizontal='center')
+            if border:
+                thin_side = Side(style='thin')
+                style.border = Border(left=thin_side, right=thin_side, top=thin_side, bottom=thin_side)
+            if fill_color is not None:
+                style.fill = PatternFill(start_color=fill_color, end_color=fill_color, fill_type="solid")
+            self.workbook.add_named_style(style)
+            self.styles[style_key] = style_name
+
+        return self.styles[style_key]
+
+    def register_styles(self, header_colors=("F2F2F2",)):
+        """
+        Registers every style add_header_row (in header_colors) and add_data can use, in a fixed order, before any rows
+        are written. Workbooks written separately then share one identical style table, so their sheets can be merged
+        into one workbook (see merge_workbooks in result_export_functions).
+
+        Returns:
+        - list: Position of each style's cell format in the workbook's cell style table, in registration order.
+        """
+
+        style_names = [self.get_style(bold=True, fill_color=color) for color in header_colors]
+        for formatting_type in (None, "Bold Text", "Bold Text and Green Money", "Normal Text and Blue Money"):
+            for col_num, bold_row, number_format in itertools.product((1, 2), (False, True),
+                                                                       ('General', CURRENCY_FORMAT, PERCENT_FORMAT)):
+                style_names.append(self.get_cell_style(0, col_num, formatting_type, bold_row, number_format))
+
+        # A style's cell format is only added to the workbook's cell style table when a cell's style_id is read
+        # (normally when its row is written), so read it here for every style and keep the positions it returns
+        style_ids = []
+        for style_name in style_names:
+            cell = WriteOnlyCell(self.worksheet)
+            cell.style = style_name
+            style_ids.append(cell.style_id)
+
+        return style_ids
+
+    def write_row(self, values, style_names):
+
+        cells = []
+        for value, style_name in zip(values, style_names):
+            cell = WriteOnlyCell(self.worksheet, value=value)
+            if style_name is not None:
+                cell.style = style_name
+            cells.append(cell)
+        self.worksheet.append(cells)
+
+    def add_header_row(self, header_row, color="F2F2F2"):
+        """
+        Adds a bold header row, filled with color out to HEADER_ROW_COLUMNS columns.
+        """
+
+        header_values = list(header_row) + [None] * (HEADER_ROW_COLUMNS - len(header_row))
+        header_style = self.get_style(bold=True, fill_color=color)
+        self.write_row(header_values, [header_style] * len(header_values))
+
+    def get_cell_style(self, value, col_num, formatting_type, bold_row, number_format):
+
+        if value is None:
+            return None
+
+        # Formatting types match add_data_to_worksheet
+        bold = False
+        color = None
+        center = number_format != 'General'
+        border = False
+        if formatting_type == "Bold Text":
+            bold, center = True, True
+        elif formatting_type == "Bold Text and Green Money":
+            bold, center = True, True
+            if col_num != 1:
+                color, border = "11AD11", True
+        elif formatting_type == "Normal Text and Blue Money" and col_num != 1:
+            color, center = "0067A7", True
+
+        # Bold rows are plain bold text
+        if bold_row:
+            bold, color = True, None
+
+        return self.get_style(bold=bold, color=color, center=center, border=border, number_format=number_format)
+
+    def add_data(self, df,
+                 formatting_type=None,
+                 use_cols_as_header=False,
+                 bold_last_row=False,
+                 bold_first_row=False,
+                 money_format=True,
+                 percent_rows=None,
+                 index_label=None):
+        """
+        Adds a DataFrame (with its index as the first column) to the worksheet.
+
+        Parameters:
+            df (DataFrame): DataFrame containing data to be added.
+            formatting_type (str): Type of formatting to be applied (see add_data_to_worksheet).
+            use_cols_as_header (bool): Whether to use DataFrame columns as header row.
+            bold_last_row (bool): Whether to bold the last row.
+            bold_first_row (bool): Whether to bold the first row.
+            money_format (bool): Whether to give numbers the currency format.
+            percent_rows (list): Rows holding rates, which get the percent format instead. Default is PERCENT_ROW_NAMES.
+            index_label (str): Header of the index column. Default is the index name.
+
+        Returns:
+            None
+        """
+
+        if index_label is None:
+            index_label = df.index.name if df.index.name is not None else 'index'
+
+        # Add the column header row if needed
+        if use_cols_as_header:
+            header_values = [index_label] + list(df.columns)
+            self.write_row(header_values, [self.get_cell_style(value, col_num, formatting_type, True, 'General')
+                                           for col_num, value in enumerate(header_values, start=1)])
+
+        # Raw values (as Python scalars, with missing values as empty cells) and their number formats
+        values = df.astype(object).where(df.notna(), None).to_numpy(dtype=object)
+        number_formats = get_number_formats(df, percent_rows=percent_rows, money_format=money_format)
+
+        # Add the data rows, looking up each row's styles once per number format
+        last_row_number = len(df) - 1
+        for row_number, index in enumerate(df.index):
+            bold_row = (bold_first_row and row_number == 0) or (bold_last_row and row_number == last_row_number)
+            row_styles = {number_format: self.get_cell_style(0, 2, formatting_type, bold_row, number_format)
+                          for number_format in set(number_formats[row_number])}
+            row_values = [value.item() if isinstance(value, np.generic) else value for value in values[row_number]]
+            style_names = [None if value is None else row_styles[number_format]
+                           for value, number_format in zip(row_values, number_formats[row_number])]
+            self.write_row([index] + row_values,
+                           [self.get_cell_style(index, 1, formatting_type, bold_row, 'General')] + style_names)
+
+    def add_alternating_dict_tables(self, book_dict, tax_dict, subhead_color):
+        """
+        Adds book and tax tables (e.g. depreciation tables by plant) one after the other, each under a subheader.
+        """
+
+        for book_key, tax_key in zip(book_dict.keys(), tax_dict.keys()):
+            self.add_header_row([book_key], color=subhead_color)
+            for value, index_label in ((book_dict[book_key], 'Book Depreciation'), (tax_dict[tax_key], 'Tax Depreciation')):
+                if not isinstance(value, pd.DataFrame):
+                    # If not a DataFrame, write the string value as a single row table
+                    value = pd.DataFrame(index=pd.Index([value], name='Component'))
+                self.add_data(value,
+                              use_cols_as_header=True,
+                              formatting_type="Normal Text and Blue Money",
+                              bold_last_row=True,
+                              index_label=value.index.name or index_label)
+
+    def save(self):
+        """
+        Writes the workbook to output_filename (a write-only workbook can only be saved once).
+        """
+
+        self.workbook.save(self.output_filename)
@@ -0,0 +1,220 @@
+import os
+import re
+import json
+import pickle
+import shutil
+import hashlib
+import tempfile
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+
+from .data_processing_functions import read_excel_with_tables
+
+# Cache files are stored next to the workbook unless a cache folder is given
+DEFAULT_CACHE_FOLDER_NAME = '.model_input_cache'
+
+# Workbook hashes and open Excel files we already have for this session, keyed by (path, size, modified time)
+_workbook_hashes = {}
+_excel_files = {}
+
+
+def hash_workbook(workbook_path):
+    """
+    Hashes the contents of a workbook so cached inputs are tied to the exact file they were parsed from.
+
+    Parameters:
+    - workbook_path (str): Path to the Excel workbook.
+
+    Returns:
+    - str: sha256 hex digest of the workbook's bytes.
+    """
+
+    file_stats = os.stat(workbook_path)
+    file_key = (os.path.abspath(workbook_path), file_stats.st_size, file_stats.st_mtime_ns)
+
+    # Only re-read the file if it changed since we last hashed it
+    if file_key not in _workbook_hashes:
+        workbook_hash = hashlib.sha256()
+        with open(workbook_path, 'rb') as workbook_file:
+            for chunk in iter(lambda: workbook_file.read(1024 * 1024), b''):
+                workbook_hash.update(chunk)
+        _workbook_hashes[file_key] = workbook_hash.hexdigest()
+
+    return _workbook_hashes[file_key]
+
+
+def read_sheet_cached(workbook_path, sheet_name, header=0, with_tables=False, cache_folder=None):
+    """
+    Reads a sheet from the model inputs workbook, using columnar cache files when the workbook hasn't changed.
+
+    The first read of a sheet parses it with pandas/openpyxl and saves the result as Arrow (Feather) files keyed by the
+    workbook's content hash and the sheet name. Later reads memory map those files instead of opening the workbook.
+    Any change to the workbook changes its hash, so stale cache files are never used (and are cleared out).
+
+    Parameters:
+    - workbook_path (str): Path to the Excel workbook.
+    - sheet_name (str): Name of the sheet to read.
+    - header (int or None, optional): Row to use for column names, as in pd.ExcelFile.parse. Default is 0.
+    - with_tables (bool, optional): Whether to split the sheet into tables with read_excel_with_tables. Default is False.
+    - cache_folder (str, optional): Folder to keep cache files in. Default is a folder next to the workbook.
+
+    Returns:
+    - pd.DataFrame of the sheet, or a dictionary of DataFrames by table name if with_tables is True.
+    """
+
+    workbook_hash = hash_workbook(workbook_path)
+    entry_folder = os.path.join(get_workbook_cache_folder(workbook_path, cache_folder),
+                                workbook_hash,
+                                f"{make_safe_file_name(sheet_name)}-header{header}-{'tables' if with_tables else 'sheet'}")
+
+    # Warm start: load straight from the cache files
+    if os.path.exists(os.path.join(entry_folder, 'manifest.json')):
+        with open(os.path.join(entry_folder, 'manifest.json')) as manifest_file:
+            manifest = json.load(manifest_file)
+        dfs = [read_df_from_arrow(os.path.join(entry_folder, file_name)) for file_name in manifest['files']]
+        if with_tables:
+            return dict(zip(manifest['tables'], dfs))
+        return dfs[0]
+
+    # Cold start: parse the sheet and save it for next time
+    sheet_df = get_excel_file(workbook_path).parse(sheet_name, header=header)
+    if with_tables:
+        tables = read_excel_with_tables(sheet_df)
+        table_names = list(tables.keys())
+        dfs = list(tables.values())
+    else:
+        table_names = [sheet_name]
+        dfs = [sheet_df]
+
+    remove_stale_cache_entries(workbook_path, workbook_hash, cache_folder)
+    save_cache_entry(entry_folder, table_names, dfs)
+
+    if with_tables:
+        return tables
+    return sheet_df
+
+
+def get_excel_file(workbook_path):
+
+    # Only open (and fully parse) the workbook once per session, and only when something isn't cached
+    workbook_hash = hash_workbook(workbook_path)
+    if workbook_hash not in _excel_files:
+        _excel_files[workbook_hash] = pd.ExcelFile(workbook_path)
+
+    return _excel_files[workbook_hash]
+
+
+def get_workbook_cache_folder(workbook_path, cache_folder=None):
+
+    if cache_folder is None:
+        cache_folder = os.path.join(os.path.dirname(os.path.abspath(workbook_path)), DEFAULT_CACHE_FOLDER_NAME)
+
+    return os.path.join(cache_folder, make_safe_file_name(os.path.basename(workbook_path)))
+
+
+def make_safe_file_name(name):
+
+    return re.sub(r'[^\w\-.]', '_', str(name))
+
+
+def remove_stale_cache_entries(workbook_path, workbook_hash, cache_folder=None):
+
+    # Cache entries for any other version of this workbook can no longer be used
+    workbook_cache_folder = get_workbook_cache_folder(workbook_path, cache_folder)
+    if os.path.isdir(workbook_cache_folder):
+        for old_hash in os.listdir(workbook_cache_folder):
+            if old_hash != workbook_hash:
+                shutil.rmtree(os.path.join(workbook_cache_folder, old_hash), ignore_errors=True)
+
+
+def save_cache_entry(entry_folder, table_names, dfs):
+
+    # Write into a temporary folder first and move it into place, so a half-written entry is never read
+    os.makedirs(os.path.dirname(entry_folder), exist_ok=True)
+    temp_folder = tempfile.mkdtemp(dir=os.path.dirname(entry_folder))
+    file_names = []
+    for i, df in enumerate(dfs):
+        file_names.append(f'{i}.arrow')
+        write_df_to_arrow(df, os.path.join(temp_folder, file_names[-1]))
+    with open(os.path.join(temp_folder, 'manifest.json'), 'w') as manifest_file:
+        json.dump({'tables': table_names, 'files': file_names}, manifest_file)
+
+    try:
+        os.rename(temp_folder, entry_folder)
+    except OSError:
+        # Another run cached this sheet first
+        shutil.rmtree(temp_folder, ignore_errors=True)
+
+
+def write_df_to_arrow(df, file_path):
+    """
+    Saves a DataFrame as an uncompressed Arrow IPC (Feather v2) file that can be memory mapped when read back.
+
+    Excel inputs often have mixed-type columns (e.g. a 'Value' column holding numbers and "Yes"/"No") and non-string
+    column names (years), which Arrow can't store directly. Columns are saved by position, labels are kept in the file
+    metadata, and mixed-type columns are saved cell by cell as pickled values.
+    """
+
+    arrays = []
+    column_kinds = []
+    for position in range(df.shape[1]):
+        column = df.iloc[:, position]
+        column_kind = 'native'
+        if pd.api.types.is_object_dtype(column.dtype):
+            inferred_type = pd.api.types.infer_dtype(column, skipna=True)
+            column_kind = 'string' if inferred_type == 'string' else 'pickled'
+        if column_kind == 'native':
+            try:
+                arrays.append(pa.array(column.values, from_pandas=True))
+            except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+                column_kind = 'pickled'
+        if column_kind == 'string':
+            arrays.append(pa.array(column.values, type=pa.string(), from_pandas=True))
+        elif column_kind == 'pickled':
+            arrays.append(pa.array([pickle.dumps(value) for value in column.values], type=pa.binary()))
+        column_kinds.append(column_kind)
+
+    # Keep a simple RangeIndex as metadata only, otherwise store the index labels
+    if isinstance(df.index, pd.RangeIndex):
+        index_info = ('range', df.index.start, df.index.stop, df.index.step)
+    else:
+        index_info = ('labels', df.index)
+
+    metadata = {b'column_labels': pickle.dumps(df.columns),
+                b'column_kinds': json.dumps(column_kinds).encode(),
+                b'index': pickle.dumps(index_info)}
+    table = pa.Table.from_arrays(arrays, names=[str(position) for position in range(df.shape[1])], metadata=metadata)
+
+    with pa.OSFile(file_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def read_df_from_arrow(file_path):
+    """
+    Loads a DataFrame saved with write_df_to_arrow, memory mapping the file so numeric columns are not copied.
+    """
+
+    table = pa.ipc.open_file(pa.memory_map(file_path, 'r')).read_all()
+    metadata = table.schema.metadata
+    column_kinds = json.loads(metadata[b'column_kinds'])
+
+    df = table.to_pandas(split_blocks=True)
+
+    # Put back what Arrow can't hold natively
+    for position, column_kind in enumerate(column_kinds):
+        if column_kind == 'string':
+            column = df.iloc[:, position]
+            df.isetitem(position, column.where(column.notna(), np.nan))
+        elif column_kind == 'pickled':
+            df.isetitem(position, pd.Series([pickle.loads(value) for value in df.iloc[:, position]], index=df.index, dtype=object))
+
+    df.columns = pickle.loads(metadata[b'column_labels'])
+    index_info = pickle.loads(metadata[b'index'])
+    if index_info[0] == 'range':
+        df.index = pd.RangeIndex(*index_info[1:])
+    else:
+        df.index = index_info[1]
+
+    return df
@@ -0,0 +1,297 @@
+import hashlib
+
+from .stage_cache_functions import hash_value
+from .plant_specific_functions import calc_existing_plant_summary
+from .rate_base_functions import calc_rate_base
+from .capital_charge_functions import calculate_capital_charge
+from .escalation_functions import EscalationIndex
+from .revenue_requirement_functions import (select_scenario_financials, prepare_scenario_inputs, calc_O_and_M_summary,
+                                            calc_new_capex, calc_ongoing_capex, calc_AFUDC, calc_depreciation_tables,
+                                            calc_deferred_tax_tables, calc_tax_credits, calc_retired_plants,
+                                            calc_revenue_requirement, calc_NPVRR)
+
+# Options every run takes, with their defaults
+PIPELINE_OPTIONS = {'end_effects': True,
+                    'solar_extension': True,
+                    'inflation_rate': 0.021,
+                    'fixed_start_year': 2022,
+                    'print_warnings': True}
+
+# Options that don't change any results (left out of cache keys)
+DISPLAY_OPTIONS = ['print_warnings']
+
+# Run variables stages can also take on their own (they are always available through run_variables_dict)
+RUN_VARIABLE_NAMES = ['case_name', 'iteration', 'aurora_iteration', 'aurora_condition', 'use_IRA', 'year', 'aurora_portfolio_ID',
+                      'rev_req_start_year', 'rev_req_end_year', 'end_effects_end_year', 'solar_extension_end_year']
+
+# Revenue requirement calculation as a graph of stages, in an order where every stage comes after the stages it needs.
+# 'inputs' are passed by position and 'options' by keyword, both looked up by name in the model inputs, run variables,
+# run options and the outputs of earlier stages. 'outputs' name what the stage returns (in order, for tuples).
+# 'scalar_inputs' lists the rows of financial_scalars_inputs a stage uses. The stage only gets those rows, so changing
+# any other scalar doesn't invalidate its cached results.
+PIPELINE_STAGES = [
+    {'name': 'scenario_financials',
+     'function': select_scenario_financials,
+     'inputs': ['scenario_financials_tables_by_case', 'case_name'],
+     'options': [],
+     'outputs': ['scenario_financials_tables']},
+    {'name': 'scenario_inputs',
+     'function': prepare_scenario_inputs,
+     'inputs': ['scenario_financials_tables', 'AS_RT_inputs', 'iteration'],
+     'options': [],
+     'outputs': ['cumulative_installed_capacity_MW_df', 'FOM_2021_kw_year_df', 'AS_RT_curr_inputs', 'FOM_years',
+                 'new_capacity_additions_annual_df']},
+    {'name': 'escalation_index',
+     'function': EscalationIndex,
+     'inputs': ['inflation_vector', 'solar_extension_end_year'],
+     'options': ['inflation_rate'],
+     'outputs': ['escalation_index']},
+    {'name': 'O_and_M',
+     'function': calc_O_and_M_summary,
+     'inputs': ['run_variables_dict', 'aurora_portfolio_summary', 'capacity_payments', 'scenario_financials_tables',
+                'FOM_years', 'financial_scalars_inputs', 'cumulative_installed_capacity_MW_df', 'FOM_2021_kw_year_df',
+                'escalation_index', 'CCS_inputs_tables', 'hydrogen_island_inputs', 'AS_RT_curr_inputs'],
+     'options': ['end_effects', 'solar_extension', 'inflation_rate', 'print_warnings'],
+     'scalar_inputs': ['Long-term solar projects ITCs or PTCs?'],
+     'outputs': ['VOM_portfolio_cost_df', 'FOM_yearly_general_df', 'FOM_portfolio_cost_df', 'AS_RT_portfolio_cost_df',
+                 'O_and_M_summary']},
+    {'name': 'existing_plant',
+     'function': calc_existing_plant_summary,
+     'inputs': ['run_variables_dict', 'scenario_financials_tables', 'financial_scalars_inputs'],
+     'options': ['end_effects', 'solar_extension', 'inflation_rate'],
+     'scalar_inputs': ['Start Year'],
+     'outputs': ['existing_plant_NPV_BOY', 'existing_plant_NPV_EOY', 'existing_plant_depreciation',
+                 'total_existing_plant_summary']},
+    {'name': 'new_capex',
+     'function': calc_new_capex,
+     'inputs': ['new_capacity_additions_annual_df', 'capital_costs', 'escalation_index', 'AGP_inputs', 'iteration'],
+     'options': [],
+     'outputs': ['new_capex_df']},
+    {'name': 'ongoing_capex',
+     'function': calc_ongoing_capex,
+     'inputs': ['run_variables_dict', 'scenario_financials_tables', 'cumulative_installed_capacity_MW_df', 'escalation_index'],
+     'options': ['end_effects', 'inflation_rate', 'print_warnings'],
+     'outputs': ['ongoing_capex_df']},
+    {'name': 'AFUDC',
+     'function': calc_AFUDC,
+     'inputs': ['new_capex_df', 'financial_inputs_tables'],
+     'options': [],
+     'outputs': ['AFUDC_schedule_df', 'AFUDC_with_rate_df', 'AFUDC_accumulated_df', 'new_capex_with_accumulated_AFUDC']},
+    {'name': 'depreciation',
+     'function': calc_depreciation_tables,
+     'inputs': ['new_capex_with_accumulated_AFUDC', 'ongoing_capex_df', 'financial_inputs_tables', 'use_IRA'],
+     'options': ['fixed_start_year'],
+     'outputs': ['book_depreciation_tables_dict', 'tax_depreciation_tables_dict', 'tax_depreciation_df']},
+    {'name': 'deferred_taxes',
+     'function': calc_deferred_tax_tables,
+     'inputs': ['run_variables_dict', 'scenario_financials_tables', 'financial_scalars_inputs', 'book_depreciation_tables_dict',
+                'tax_depreciation_df', 'existing_plant_depreciation', 'total_existing_plant_summary',
+                'existing_plant_NPV_BOY'],
+     'options': ['end_effects', 'solar_extension', 'inflation_rate'],
+     'scalar_inputs': ['State Income Tax Rate', 'Federal Income Tax Rate'],
+     'outputs': ['deferred_tax_state_df', 'deferred_tax_federal_df', 'deferred_tax_blended_df']},
+    {'name': 'tax_credits',
+     'function': calc_tax_credits,
+     'inputs': ['run_variables_dict', 'escalation_index', 'financial_inputs_tables', 'financial_scalars_inputs',
+                'ptcs_and_itcs_tables', 'aurora_portfolio_resource', 'hydrogen_island_inputs',
+                'cumulative_installed_capacity_MW_df', 'CCS_inputs_tables'],
+     'options': [],
+     'scalar_inputs': ['Income Tax Rate', 'Long-term solar projects ITCs or PTCs?'],
+     'outputs': ['PTC_df', 'generation_df', 'old_tax_policy_PTC_generated', 'IRA_PTC_df', 'total_grossed_up_ptc', 'NOL', 'ITC']},
+    {'name': 'rate_base',
+     'function': calc_rate_base,
+     'inputs': ['new_capex_with_accumulated_AFUDC', 'ongoing_capex_df', 'book_depreciation_tables_dict',
+                'deferred_tax_blended_df', 'ITC', 'existing_plant_depreciation', 'total_existing_plant_summary',
+                'existing_plant_NPV_BOY'],
+     'options': ['rate_base_start_year'],
+     'outputs': ['rate_base_df']},
+    {'name': 'capital_charge',
+     'function': calculate_capital_charge,
+     'inputs': ['financial_scalars_inputs', 'rate_base_df'],
+     'options': ['end_effects', 'solar_extension', 'inflation_rate'],
+     'scalar_inputs': ['Start Year', 'Starting Equity ($)', 'Starting Debt ($)', 'Equity % Rate Base', 'Debt % Rate Base',
+                       'Return on Equity (Existing)', 'Cost of Debt (Existing)', 'Return on Equity (New)', 'Cost of Debt (New)'],
+     'outputs': ['capital_charge_df']},
+    {'name': 'retired_plants',
+     'function': calc_retired_plants,
+     'inputs': ['run_variables_dict', 'scenario_financials_tables', 'ongoing_capex_df', 'existing_plant_NPV_EOY',
+                'financial_scalars_inputs', 'capital_charge_df'],
+     'options': ['end_effects', 'solar_extension', 'inflation_rate'],
+     'scalar_inputs': ['Start Year', 'Property Tax Rate', 'Income Tax Rate', 'Equity % Rate Base', 'Return on Equity (Existing)',
+                       'Income Tax Credit Back?', 'Property Tax Credit Back?', 'Retired Units Earn Return On?'],
+     'outputs': ['retired_plants_df']},
+    {'name': 'revenue_requirement',
+     'function': calc_revenue_requirement,
+     'inputs': ['rate_base_df', 'total_existing_plant_summary', 'O_and_M_summary', 'capital_charge_df', 'retired_plants_df',
+                'total_grossed_up_ptc', 'ITC', 'financial_scalars_inputs'],
+     'options': [],
+     'scalar_inputs': ['Income Tax Rate', 'License Fee'],
+     'outputs': ['revenue_requirement_df']},
+    {'name': 'NPVRR',
+     'function': calc_NPVRR,
+     'inputs': ['revenue_requirement_df', 'financial_scalars_inputs', 'run_variables_dict'],
+     'options': [],
+     'scalar_inputs': ['After-Tax WACC'],
+     'outputs': ['npv_df']},
+]
+
+# Stage that produces each output
+STAGE_BY_OUTPUT = {output: stage for stage in PIPELINE_STAGES for output in stage['outputs']}
+
+
+def get_stages_to_run(targets, available_names):
+    """
+    Finds the stages needed to calculate the targets, skipping any stage whose outputs we already have.
+
+    Parameters:
+    - targets (list): Names of the outputs we want.
+    - available_names (set): Names we already have values for (inputs, run variables, options or earlier results).
+
+    Returns:
+    - List of stages to run, in pipeline order.
+    """
+
+    needed_stage_names = set()
+    names_to_resolve = list(targets)
+    while names_to_resolve:
+        name = names_to_resolve.pop()
+        if name in available_names:
+            continue
+        if name not in STAGE_BY_OUTPUT:
+            raise ValueError(f"'{name}' is not a model input, run variable or output of any pipeline stage")
+        stage = STAGE_BY_OUTPUT[name]
+        if stage['name'] not in needed_stage_names:
+            needed_stage_names.add(stage['name'])
+            names_to_resolve.extend(stage['inputs'] + stage['options'])
+
+    return [stage for stage in PIPELINE_STAGES if stage['name'] in needed_stage_names]
+
+
+def get_downstream_outputs(changed_names):
+    """
+    Finds every stage output that depends (directly or through other stages) on the changed names, e.g. to drop
+    those from saved results before rerunning a what-if.
+
+    Parameters:
+    - changed_names (list): Names of inputs, run variables, options, outputs or financial_scalars_inputs rows that changed.
+
+    Returns:
+    - Set of output names that have to be recalculated.
+    """
+
+    stale_names = set(changed_names)
+    # A changed run variable also changes the run variables dictionary (and the rate base start year)
+    if stale_names.intersection(RUN_VARIABLE_NAMES):
+        stale_names.add('run_variables_dict')
+    if 'rev_req_start_year' in stale_names:
+        stale_names.add('rate_base_start_year')
+    downstream_outputs = set()
+    for stage in PIPELINE_STAGES:
+        if stale_names.intersection(stage['inputs'] + stage['options'] + stage.get('scalar_inputs', [])):
+            stale_names.update(stage['outputs'])
+            downstream_outputs.update(stage['outputs'])
+
+    return downstream_outputs
+
+
+def get_stage_input(stage, name, available):
+
+    # Stages that list their scalar inputs only get (and are only cached on) those rows
+    if name == 'financial_scalars_inputs' and 'scalar_inputs' in stage:
+        return available[name].loc[stage['scalar_inputs']]
+
+    return available[name]
+
+
+def make_stage_key(stage, stage_inputs, stage_options, value_hashes, cache):
+
+    input_hashes = []
+    for name, value in zip(stage['inputs'], stage_inputs):
+        if name == 'financial_scalars_inputs' and 'scalar_inputs' in stage:
+            input_hashes.append(hash_value(value))
+        else:
+            # Each input is hashed once per run (stage outputs get the hash of the key of the stage that made them)
+            if name not in value_hashes:
+                value_hashes[name] = hash_value(value)
+            input_hashes.append(value_hashes[name])
+    for name, value in stage_options.items():
+        if name not in DISPLAY_OPTIONS:
+            input_hashes.append(hash_value((name, value)))
+
+    return cache.make_key(stage['name'], input_hashes)
+
+
+def run_pipeline(model_inputs, run_variables_dict, targets=None, results=None, cache=None, **options):
+    """
+    Runs the stages of the revenue requirement calculation needed for the targets.
+
+    Nothing is read from or written to globals: every stage gets its inputs by name and returns new outputs, so a runner
+    can cache stage results, run scenarios in parallel or rerun only the stages downstream of a change.
+
+    Parameters:
+    - model_inputs (dictionary): Inputs as returned by load_model_inputs. They are only read, never modified.
+    - run_variables_dict (dictionary): Scenario and run variables, in the same format as the notebook's run_variables_dict.
+    - targets (list, optional): Names of the outputs to calculate. Default is every stage output.
+    - results (dictionary, optional): Outputs already calculated for this run. Stages whose outputs are all here are skipped.
+    - cache (StageCache, optional): Cache of stage results by the contents of their inputs. When given, a stage is only
+      recalculated if one of its inputs changed, so a what-if only reruns the stages downstream of what was changed.
+    - options: Run options (end_effects, solar_extension, inflation_rate, fixed_start_year, print_warnings). Defaults
+      are in PIPELINE_OPTIONS.
+
+    Returns:
+    - Dictionary of the given results plus every output calculated, where keys are the names the notebook uses.
+    """
+
+    unknown_options = set(options) - set(PIPELINE_OPTIONS)
+    if unknown_options:
+        raise ValueError(f"Unknown pipeline options: {sorted(unknown_options)}")
+    if targets is None:
+        targets = list(STAGE_BY_OUTPUT.keys())
+    results = dict(results) if results is not None else {}
+
+    # Everything a stage can take as an input
+    available = dict(model_inputs)
+    available.update(run_variables_dict)
+    available['run_variables_dict'] = run_variables_dict
+    available.update(PIPELINE_OPTIONS)
+    available.update(options)
+    # the rate base starts the year prior to the revenue requirement start year
+    available['rate_base_start_year'] = run_variables_dict['rev_req_start_year'] - 1
+    available.update(results)
+
+    value_hashes = {}
+    for stage in get_stages_to_run(targets, set(available.keys())):
+        stage_inputs = [get_stage_input(stage, name, available) for name in stage['inputs']]
+        stage_options = {name: available[name] for name in stage['options']}
+
+        # Reuse the cached outputs if this stage already ran on the same inputs
+        found = False
+        if cache is not None:
+            stage_key = make_stage_key(stage, stage_inputs, stage_options, value_hashes, cache)
+            found, stage_outputs = cache.get(stage_key)
+        if not found:
+            stage_outputs = stage['function'](*stage_inputs, **stage_options)
+            if len(stage['outputs']) == 1:
+                stage_outputs = (stage_outputs,)
+            if cache is not None:
+                cache.put(stage_key, stage_outputs)
+
+        for name, value in zip(stage['outputs'], stage_outputs):
+            available[name] = value
+            results[name] = value
+            if cache is not None:
+                value_hashes[name] = hashlib.sha256(f'{stage_key}:{name}'.encode()).hexdigest()
+
+    return results
+
+
+def run_revenue_requirement(model_inputs, run_variables_dict, cache=None, **options):
+    """
+    Runs the full revenue requirement calculation for one scenario: O&M, existing plant, CapEx, AFUDC, depreciation,
+    deferred taxes, tax credits, rate base, capital charge, retired plants, revenue requirement and NPVRR.
+
+    Returns:
+    - Dictionary of results, where keys are the names the notebook uses for each table.
+    """
+
+    return run_pipeline(model_inputs, run_variables_dict, cache=cache, **options)
@@ -0,0 +1,158 @@
+import pandas as pd
+import numpy as np
+
+from .data_processing_functions import stack_dataframes
+from .deferred_tax_functions import sum_annual_depreciation
+
+# Rows added to the rate base each year (+1) or taken out of it (-1)
+RATE_BASE_COMPONENT_SIGNS = {'CapEx': 1,
+                             'Depreciation - New': -1,
+                             'Change in Deferred Tax Liability': -1,
+                             'Depreciation - Existing': -1,
+                             'Additions to Existing Book': 1}
+
+
+def roll_forward_rate_base(starting_rate_base, net_additions):
+    """
+    Rolls the rate base forward for one or more scenarios at once, where each year's ending rate base is
+    max(starting rate base + net additions, 0) and each year starts where the previous year ended.
+
+    The clamp at 0 is solved in closed form instead of year by year: with running totals C_t = starting rate base +
+    cumulative net additions, the ending rate base is C_t - min(0, min(C_0, ..., C_t)). Every time the rate base hits 0
+    the running minimum drops with it, which resets the roll-forward from 0.
+
+    Parameters:
+    - starting_rate_base (float or np.ndarray): Starting rate base in the first year, shape (scenarios,).
+    - net_additions (np.ndarray): Net additions to the rate base by year, shape (years,) or (scenarios, years).
+
+    Returns:
+    - np.ndarray: Starting rate base by year, in the same shape as net_additions.
+    - np.ndarray: Ending rate base by year, in the same shape as net_additions.
+    """
+
+    net_additions = np.asarray(net_additions, dtype=np.float64)
+    single_scenario = net_additions.ndim == 1
+    net_additions = np.atleast_2d(net_additions)
+    starting_rate_base = np.asarray(starting_rate_base, dtype=np.float64).reshape(-1, 1)
+
+    # Running totals before the clamp, and how far they've dropped below 0 so far
+    unclamped_rate_base = starting_rate_base + np.cumsum(net_additions, axis=1)
+    running_minimum = np.minimum(np.minimum.accumulate(unclamped_rate_base, axis=1), 0)
+    ending_rate_base = unclamped_rate_base - running_minimum
+
+    # Each year starts where the previous year ended
+    starting_rate_base_by_year = np.concatenate((np.broadcast_to(starting_rate_base, (net_additions.shape[0], 1)),
+                                                 ending_rate_base[:, :-1]), axis=1)
+
+    if single_scenario:
+        return starting_rate_base_by_year[0], ending_rate_base[0]
+    return starting_rate_base_by_year, ending_rate_base
+
+
+def roll_forward_rate_base_df(rate_base_components_df, starting_rate_base):
+    """
+    Adds 'Starting Rate Base' and 'Ending Rate Base' rows to a table of rate base components.
+
+    rate_base_components_df can also be a stack of scenarios with a MultiIndex whose last level holds the component
+    rows (e.g. (scenario, 'CapEx')), in which case starting_rate_base is a Series by scenario and every scenario is
+    rolled forward in one call.
+
+    Parameters:
+    - rate_base_components_df (pd.DataFrame): Rows in RATE_BASE_COMPONENT_SIGNS with years as columns.
+    - starting_rate_base (float or pd.Series): Starting rate base in the first year (by scenario if stacked).
+
+    Returns:
+    - pd.DataFrame: Components plus starting and ending rate base rows (for each scenario, if stacked).
+    """
+
+    stacked = isinstance(rate_base_components_df.index, pd.MultiIndex)
+    years = rate_base_components_df.columns
+
+    if not stacked:
+        net_additions = sum(sign * rate_base_components_df.loc[component].fillna(0).values
+                            for component, sign in RATE_BASE_COMPONENT_SIGNS.items())
+        starting_rate_base_by_year, ending_rate_base = roll_forward_rate_base(starting_rate_base, net_additions)
+
+        rate_base_df = rate_base_components_df.astype(np.float64)
+        rate_base_df.loc['Starting Rate Base'] = starting_rate_base_by_year
+        rate_base_df.loc['Ending Rate Base'] = ending_rate_base
+        return rate_base_df
+
+    # Component values by scenario (rows) and year (columns)
+    scenarios = rate_base_components_df.index.droplevel(-1).unique()
+    component_values = [rate_base_components_df.xs(component, level=-1).reindex(scenarios).fillna(0).values
+                        for component in RATE_BASE_COMPONENT_SIGNS]
+    net_additions = sum(sign * values for sign, values in zip(RATE_BASE_COMPONENT_SIGNS.values(), component_values))
+    starting_rate_base_by_year, ending_rate_base = roll_forward_rate_base(pd.Series(starting_rate_base, index=scenarios).values,
+                                                                          net_additions)
+
+    # Lay the rows out scenario by scenario, in the same order as the single scenario table
+    row_names = list(RATE_BASE_COMPONENT_SIGNS.keys()) + ['Starting Rate Base', 'Ending Rate Base']
+    rate_base_values = np.stack(component_values + [starting_rate_base_by_year, ending_rate_base], axis=1).reshape(-1, len(years))
+    index = pd.MultiIndex.from_tuples([(scenario if isinstance(scenario, tuple) else (scenario,)) + (row_name,)
+                                       for scenario in scenarios for row_name in row_names],
+                                      names=rate_base_components_df.index.names)
+
+    return pd.DataFrame(rate_base_values, index=index, columns=years)
+
+
+def calc_rate_base(new_capex_with_accumulated_AFUDC,
+                   ongoing_capex_df,
+                   book_depreciation_tables_dict,
+                   deferred_tax_blended_df,
+                   ITC,
+                   existing_plant_depreciation,
+                   total_existing_plant_summary,
+                   existing_plant_NPV_BOY,
+                   rate_base_start_year=2022):
+    """
+    Rolls the rate base forward from the existing plant's starting rate base.
+
+    Ending Rate Base = Starting Rate Base + CapEx - Depreciation (new and existing) - Change in Deferred Tax Liability
+    + Additions to Existing Book, and can never be negative. Each year starts where the previous year ended.
+
+    Returns:
+    - pd.DataFrame: Rate base components, starting and ending rate base with years as columns.
+    """
+
+    # Depreciation - new
+    new_depreciation = sum_annual_depreciation(book_depreciation_tables_dict)
+    new_depreciation = new_depreciation.rename(index={new_depreciation.index[0]: 'Depreciation - New'})
+
+    # Change in Deferred Tax Liability
+    changed_in_deferred_tax_liability = (deferred_tax_blended_df.loc['Deferred Tax - New Capital']
+        + deferred_tax_blended_df.loc['Deferred Tax - Existing Capital'].fillna(0)
+        + ITC.loc['Change in Net Deferred Tax - ITC'])
+    changed_in_deferred_tax_liability = changed_in_deferred_tax_liability.to_frame().T
+    changed_in_deferred_tax_liability = changed_in_deferred_tax_liability.rename(index={changed_in_deferred_tax_liability.index[0]: 'Change in Deferred Tax Liability'})
+
+    # Depreciation Existing
+    depreciation_existing = existing_plant_depreciation.loc[['Total Depreciation']].copy()
+    depreciation_existing = depreciation_existing.rename(index={depreciation_existing.index[0]: 'Depreciation - Existing'})
+
+    # Additions to Existing Book
+    additions_to_existing_book = total_existing_plant_summary.loc[['Additions to Existing Book']].copy()
+
+    # CapEx
+    new_capex_with_accumulated_AFUDC_sum = new_capex_with_accumulated_AFUDC.sum()
+    new_capex_with_accumulated_AFUDC_sum = new_capex_with_accumulated_AFUDC_sum.reindex(ongoing_capex_df.columns, fill_value=0)
+    total_capex = new_capex_with_accumulated_AFUDC_sum + ongoing_capex_df.drop('Ongoing CapEx - New - Total').sum()
+    total_capex = total_capex.to_frame().T
+    total_capex = total_capex.rename(index={total_capex.index[0]: 'CapEx'})
+
+    # Make DF of rate base components
+    dfs_to_stack = [total_capex, new_depreciation, changed_in_deferred_tax_liability, depreciation_existing, additions_to_existing_book]
+    rate_base_components_df = stack_dataframes(dfs_to_stack, print_warnings=False).fillna(0)
+
+    # make sure the start year of the rate base is the year prior to the revenue requirement start year
+    rate_base_components_df = rate_base_components_df.loc[:, np.asarray(rate_base_components_df.columns, dtype=int) >= rate_base_start_year]
+
+    # Initialize starting rate base
+    first_year = rate_base_components_df.columns[0]
+    starting_rate_base = (existing_plant_NPV_BOY.loc['Total NPV BOY', first_year]
+                          - deferred_tax_blended_df.loc['Deferred Tax Liability - Existing', first_year])
+
+    # Fill in Starting and Ending rate base values
+    rate_base_df = roll_forward_rate_base_df(rate_base_components_df, starting_rate_base)
+
+    return rate_base_df
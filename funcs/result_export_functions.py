@@ -0,0 +1,280 @@
+import os
+import re
+import shutil
+import zipfile
+import tempfile
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from concurrent.futures import ProcessPoolExecutor
+
+from .excel_output_funcs import ReportWriter
+from .scenario_sweep_functions import SCENARIO_COLUMNS
+
+# Results exported for every scenario: table name in the export -> name of the result
+EXPORT_TABLES = {'revenue_requirement': 'revenue_requirement_df',
+                 'rate_base': 'rate_base_df',
+                 'capital_charge': 'capital_charge_df',
+                 'npv': 'npv_df'}
+
+# Columns the Parquet dataset is partitioned by (one folder per case and iteration)
+PARTITION_COLUMNS = ['case_name', 'iteration']
+
+# Header colors used on the summary sheets
+SUMMARY_HEADER_COLORS = ("F2F2F2", "FAE650")
+
+# Excel limits sheet names to 31 characters and doesn't allow these characters in them
+MAX_SHEET_NAME_LENGTH = 31
+INVALID_SHEET_NAME_CHARACTERS = r'[\[\]:*?/\\]'
+
+# Parts of a workbook package that are rebuilt when merging
+WORKSHEET_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml'
+WORKSHEET_RELATIONSHIP_TYPE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet'
+REBUILT_PARTS = ['[Content_Types].xml', 'xl/workbook.xml', 'xl/_rels/workbook.xml.rels', 'xl/worksheets/sheet1.xml']
+
+
+def make_results_long_df(scenario_results):
+    """
+    Stacks the exported tables of every scenario into one long table, with one row per scenario, table, row and year.
+
+    Parameters:
+    - scenario_results (list): (run_variables_dict, results) pairs, where results is the dictionary of results
+      returned by run_revenue_requirement (or run_scenario_sweep with result_names).
+
+    Returns:
+    - pd.DataFrame: SCENARIO_COLUMNS plus 'table', 'row', 'year' (missing for NPVRRs) and 'value' columns.
+    """
+
+    long_dfs = []
+    for run_variables_dict, results in scenario_results:
+        for table_name, result_name in EXPORT_TABLES.items():
+            df = results[result_name]
+
+            # NPVRRs are one row with an NPV per column and no year
+            if table_name == 'npv':
+                df = df.iloc[[0]].T.set_axis([np.nan], axis=1)
+
+            # Every cell of the table becomes one row, read row by row
+            values = df.apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+            long_df = pd.DataFrame({'table': table_name,
+                                    'row': np.repeat(df.index.astype(str), df.shape[1]),
+                                    'year': pd.array(np.tile(np.asarray(df.columns, dtype=np.float64), df.shape[0]), dtype='Int64'),
+                                    'value': values.ravel()})
+            for column in reversed(SCENARIO_COLUMNS):
+                long_df.insert(0, column, run_variables_dict[column])
+            long_dfs.append(long_df)
+
+    return pd.concat(long_dfs, ignore_index=True)
+
+
+def export_results_to_parquet(scenario_results, output_folder):
+    """
+    Writes the exported tables of every scenario to a Parquet dataset, partitioned by case name and iteration.
+
+    Partitions being exported replace any data already in them, so re-running a scenario doesn't duplicate its rows.
+    The dataset can be read back with pd.read_parquet(output_folder).
+
+    Parameters:
+    - scenario_results (list): (run_variables_dict, results) pairs (see make_results_long_df).
+    - output_folder (str): Root folder of the dataset.
+
+    Returns:
+    - pd.DataFrame: The long results table that was written.
+    """
+
+    results_long_df = make_results_long_df(scenario_results)
+
+    table = pa.Table.from_pandas(results_long_df, preserve_index=False)
+    pq.write_to_dataset(table, output_folder, partition_cols=PARTITION_COLUMNS, existing_data_behavior='delete_matching')
+
+    return results_long_df
+
+
+def make_sheet_names(run_variables_dicts):
+    """
+    Makes a unique, valid Excel sheet name for every scenario from its case, Aurora iteration and IRA option.
+    """
+
+    sheet_names = []
+    for run_variables_dict in run_variables_dicts:
+        sheet_name = f"{run_variables_dict['case_name']} {run_variables_dict['aurora_iteration']}"
+        if not run_variables_dict['use_IRA']:
+            sheet_name += ' no IRA'
+        sheet_name = re.sub(INVALID_SHEET_NAME_CHARACTERS, '_', sheet_name)[:MAX_SHEET_NAME_LENGTH]
+
+        # Number any repeats so every sheet name is unique
+        unique_sheet_name = sheet_name
+        repeat = 1
+        while unique_sheet_name in sheet_names:
+            repeat += 1
+            suffix = f' ({repeat})'
+            unique_sheet_name = sheet_name[:MAX_SHEET_NAME_LENGTH - len(suffix)] + suffix
+        sheet_names.append(unique_sheet_name)
+
+    return sheet_names
+
+
+def write_scenario_sheet(run_variables_dict, results, output_filename, sheet_name):
+    """
+    Writes one scenario's run variables, NPVRRs, revenue requirement, rate base and capital charge to a one-sheet
+    workbook, laid out like the notebook's results workbook.
+
+    Runs in the worker processes of write_summary_workbook, so the styles are registered up front and every sheet
+    shares the same style table.
+
+    Returns:
+    - str: output_filename.
+    - list: Style ids from ReportWriter.register_styles, so the caller can check every sheet registered the same ones.
+    """
+
+    report_writer = ReportWriter(output_filename, sheet_title=sheet_name)
+    style_ids = report_writer.register_styles(SUMMARY_HEADER_COLORS)
+
+    # Details about the run
+    report_writer.add_header_row(['Model Run Variables', 'Value'])
+    run_vars_df = pd.DataFrame.from_dict(run_variables_dict, orient='index', columns=['Value'])
+    report_writer.add_data(run_vars_df, formatting_type='Bold Text', money_format=False)
+
+    # NPVRR
+    report_writer.add_header_row(['Net Present Value of Revenue Requirement (NPV RR)'], color="FAE650")
+    report_writer.add_data(results['npv_df'].T, formatting_type="Bold Text and Green Money", bold_last_row=True)
+
+    # Revenue requirement, rate base and capital charge
+    report_writer.add_header_row(['Revenue Requirement Calculation'])
+    report_writer.add_data(results['revenue_requirement_df'], use_cols_as_header=True, index_label='Calculation Components')
+
+    report_writer.add_header_row(['Rate Base Calculation'])
+    report_writer.add_data(results['rate_base_df'], use_cols_as_header=True, formatting_type="Normal Text and Blue Money",
+                           index_label='Rate Base Components')
+
+    report_writer.add_header_row(['Capital Charge Calculation'])
+    report_writer.add_data(results['capital_charge_df'], use_cols_as_header=True, formatting_type="Normal Text and Blue Money",
+                           index_label='Component')
+
+    report_writer.save()
+
+    return output_filename, style_ids
+
+
+def merge_workbooks(workbook_paths, output_filename):
+    """
+    Merges one-sheet workbooks written by ReportWriter into one workbook, with the sheets in the same order.
+
+    The sheets are copied over as they are (no cells are read or re-written), and the workbook, relationship and
+    content type parts are rebuilt to list every sheet. Cells refer to styles by position, so every workbook must have
+    the same style table (see ReportWriter.register_styles); a ValueError is raised if they don't.
+
+    Parameters:
+    - workbook_paths (list): Paths to the one-sheet workbooks.
+    - output_filename (str): Path to save the merged workbook to.
+
+    Returns:
+    - None
+    """
+
+    with zipfile.ZipFile(workbook_paths[0]) as first_workbook:
+        styles = first_workbook.read('xl/styles.xml')
+        content_types = first_workbook.read('[Content_Types].xml').decode('utf-8')
+        workbook_xml = first_workbook.read('xl/workbook.xml').decode('utf-8')
+        workbook_rels = first_workbook.read('xl/_rels/workbook.xml.rels').decode('utf-8')
+
+    sheet_names = []
+    with zipfile.ZipFile(output_filename, 'w', compression=zipfile.ZIP_DEFLATED) as merged_workbook:
+
+        # Everything but the sheet and the parts listing the sheets comes from the first workbook
+        with zipfile.ZipFile(workbook_paths[0]) as first_workbook:
+            for part_name in first_workbook.namelist():
+                if part_name not in REBUILT_PARTS:
+                    merged_workbook.writestr(part_name, first_workbook.read(part_name))
+
+        # Copy each workbook's sheet in as the next sheet
+        for sheet_number, workbook_path in enumerate(workbook_paths, start=1):
+            with zipfile.ZipFile(workbook_path) as workbook:
+                if workbook.read('xl/styles.xml') != styles:
+                    raise ValueError(f"{workbook_path} doesn't have the same styles as {workbook_paths[0]}, so it can't be merged")
+                sheet_names.append(re.search(r'<sheet name="([^"]*)"', workbook.read('xl/workbook.xml').decode('utf-8')).group(1))
+                with workbook.open('xl/worksheets/sheet1.xml') as sheet_source, \
+                        merged_workbook.open(f'xl/worksheets/sheet{sheet_number}.xml', 'w') as sheet_target:
+                    shutil.copyfileobj(sheet_source, sheet_target)
+
+        # List every sheet in the content types, workbook and workbook relationships
+        sheet_numbers = range(1, len(sheet_names) + 1)
+        content_types = re.sub(r'<Override PartName="/xl/worksheets/sheet1\.xml"[^>]*/>', '', content_types)
+        content_types = content_types.replace('</Types>', ''.join(
+            f'<Override PartName="/xl/worksheets/sheet{sheet_number}.xml" ContentType="{WORKSHEET_CONTENT_TYPE}" />'
+            for sheet_number in sheet_numbers) + '</Types>')
+        workbook_xml = re.sub(r'<sheets>.*</sheets>', '<sheets>' + ''.join(
+            f'<sheet name="{sheet_name}" sheetId="{sheet_number}" state="visible" r:id="rIdSheet{sheet_number}" />'
+            for sheet_number, sheet_name in zip(sheet_numbers, sheet_names)) + '</sheets>', workbook_xml)
+        workbook_rels = re.sub(r'<Relationship Type="' + re.escape(WORKSHEET_RELATIONSHIP_TYPE) + r'"[^>]*/>', '', workbook_rels)
+        workbook_rels = workbook_rels.replace('</Relationships>', ''.join(
+            f'<Relationship Type="{WORKSHEET_RELATIONSHIP_TYPE}" Target="/xl/worksheets/sheet{sheet_number}.xml" Id="rIdSheet{sheet_number}" />'
+            for sheet_number in sheet_numbers) + '</Relationships>')
+
+        merged_workbook.writestr('[Content_Types].xml', content_types)
+        merged_workbook.writestr('xl/workbook.xml', workbook_xml)
+        merged_workbook.writestr('xl/_rels/workbook.xml.rels', workbook_rels)
+
+
+def write_summary_workbook(scenario_results, output_filename, max_workers=None):
+    """
+    Writes a summary workbook with one sheet per scenario (see write_scenario_sheet).
+
+    Each sheet is written to its own workbook in a worker process, and the workbooks are then merged into one, so
+    the time it takes scales with the number of cores rather than the number of scenarios.
+
+    Parameters:
+    - scenario_results (list): (run_variables_dict, results) pairs (see make_results_long_df).
+    - output_filename (str): Path to save the workbook to.
+    - max_workers (int, optional): Number of worker processes. Default is the number of CPUs (capped at the number of scenarios).
+
+    Returns:
+    - None
+    """
+
+    if max_workers is None:
+        max_workers = min(os.cpu_count() or 1, len(scenario_results))
+
+    sheet_names = make_sheet_names([run_variables_dict for run_variables_dict, results in scenario_results])
+
+    with tempfile.TemporaryDirectory() as temp_folder:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            # Only send the workers the tables that go on the sheet
+            futures = [executor.submit(write_scenario_sheet,
+                                       run_variables_dict,
+                                       {result_name: results[result_name] for result_name in EXPORT_TABLES.values()},
+                                       os.path.join(temp_folder, f'sheet_{sheet_number}.xlsx'),
+                                       sheet_name)
+                       for sheet_number, ((run_variables_dict, results), sheet_name) in enumerate(zip(scenario_results, sheet_names))]
+            sheet_paths, sheet_style_ids = zip(*[future.result() for future in futures])
+
+        # Cells refer to styles by position, so every worker must have registered the same styles in the same order
+        for sheet_path, style_ids in zip(sheet_paths, sheet_style_ids):
+            if style_ids != sheet_style_ids[0]:
+                raise ValueError(f"{sheet_path} registered different styles than {sheet_paths[0]}, so it can't be merged")
+
+        merge_workbooks(list(sheet_paths), output_filename)
+
+
+def export_scenario_results(scenario_results, output_folder, summary_workbook=None, max_workers=None):
+    """
+    Exports the revenue requirement, rate base, capital charge and NPVRR of many scenarios: a Parquet dataset
+    partitioned by case name and iteration, plus an optional summary workbook with one sheet per scenario.
+
+    Parameters:
+    - scenario_results (list): (run_variables_dict, results) pairs (see make_results_long_df).
+    - output_folder (str): Root folder of the Parquet dataset.
+    - summary_workbook (str, optional): Path to save the summary workbook to. Default is no workbook.
+    - max_workers (int, optional): Number of worker processes for the summary workbook.
+
+    Returns:
+    - pd.DataFrame: The long results table written to the Parquet dataset.
+    """
+
+    results_long_df = export_results_to_parquet(scenario_results, output_folder)
+
+    if summary_workbook is not None:
+        write_summary_workbook(scenario_results, summary_workbook, max_workers=max_workers)
+
+    return results_long_df
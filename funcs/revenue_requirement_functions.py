@@ -0,0 +1,576 @@
+import pandas as pd
+import numpy as np
+
+from .data_processing_functions import stack_dataframes, extend_years, convert_capacity_table_to_cost_table, remove_whitespaces_from_df
+from .input_cache_functions import read_sheet_cached
+from .aurora_data_functions import AuroraOutputStore
+from .escalation_functions import get_escalation_index
+from .O_and_M_functions import calc_VOM, calc_FOM, calc_new_resource_FOM, calc_new_resource_AS_RT
+from .plant_specific_functions import calc_existing_plant_summary, process_retired_plants
+from .AFUDC_functions import calculate_AFUDC_schedule, calculate_AFUDC_with_rate, calculate_accumulated_AFUDC
+from .depreciation_functions import create_book_depreciation_schedule, create_tax_depreciation_schedules
+from .deferred_tax_functions import calc_state_federal_blended_deferred_taxes
+from .tax_credit_functions import calculate_ptc, calculate_generation, calculate_old_tax_policy_PTC_generated, calculate_ira_ptc, calculate_ITC
+from .capital_charge_functions import calculate_capital_charge
+from .NPV_functions import calc_npv_table
+
+# Sheet in the model inputs workbook with the financials for each case
+SCENARIO_FINANCIALS_SHEETS = {'Baseline': 'Baseline',
+                              'Datacenter': 'Datacenter Scenario Financials',
+                              'Datacenter_no_ext': 'Datacenter No Ext Scenario'}
+
+
+def load_model_inputs(model_inputs_path):
+    """
+    Reads every input the revenue requirement calculation needs from the model inputs workbook.
+
+    Parameters:
+    - model_inputs_path (str): Path to the 'Direct Model Inputs' workbook.
+
+    Returns:
+    - Dictionary of inputs, where keys are the names the notebook uses for them. Scenario financials are stored by case
+      name under 'scenario_financials_tables_by_case'.
+    """
+
+    model_inputs = {}
+
+    # scalar financial inputs
+    model_inputs['financial_inputs_tables'] = read_sheet_cached(model_inputs_path, "Financial Inputs", header=None, with_tables=True)
+    model_inputs['financial_scalars_inputs'] = model_inputs['financial_inputs_tables']['Scalar Inputs'].set_index('Scalar Input')
+    # inflation vector
+    model_inputs['inflation_vector'] = model_inputs['financial_inputs_tables']['Inflation Vector - Base Year 2021$'].set_index('Year')['Scalar']
+
+    # AURORA output files
+    model_inputs['aurora_portfolio_summary'] = AuroraOutputStore(read_sheet_cached(model_inputs_path, "Portfolio Summary"))
+    model_inputs['aurora_portfolio_resource'] = AuroraOutputStore(read_sheet_cached(model_inputs_path, "Portfolio Resource"))
+
+    # financials for each case
+    model_inputs['scenario_financials_tables_by_case'] = {case_name: read_sheet_cached(model_inputs_path, sheet_name, header=None, with_tables=True)
+                                                          for case_name, sheet_name in SCENARIO_FINANCIALS_SHEETS.items()}
+
+    # capacity payment, CCS, hydrogen island, ancillary revenue, capital cost, PTC/ITC and AGP inputs
+    model_inputs['capacity_payments'] = read_sheet_cached(model_inputs_path, "Capacity Payments")
+    model_inputs['CCS_inputs_tables'] = read_sheet_cached(model_inputs_path, "CCS", header=None, with_tables=True)
+    model_inputs['hydrogen_island_inputs'] = read_sheet_cached(model_inputs_path, "Hydrogen Island", header=None, with_tables=True)
+    model_inputs['AS_RT_inputs'] = remove_whitespaces_from_df(read_sheet_cached(model_inputs_path, "AS_RT Value"))
+    model_inputs['capital_costs'] = remove_whitespaces_from_df(read_sheet_cached(model_inputs_path, "Capital Costs"))
+    model_inputs['ptcs_and_itcs_tables'] = read_sheet_cached(model_inputs_path, "PTCs and ITCs", header=None, with_tables=True)
+    model_inputs['AGP_inputs'] = remove_whitespaces_from_df(read_sheet_cached(model_inputs_path, "AGP"))
+
+    return model_inputs
+
+
+def select_scenario_financials(scenario_financials_tables_by_case, case_name):
+    """
+    Returns the scenario financials tables for the case being run.
+    """
+
+    if case_name not in scenario_financials_tables_by_case:
+        raise ValueError(f"No scenario financials for case '{case_name}'. Cases are: {list(scenario_financials_tables_by_case.keys())}")
+
+    return scenario_financials_tables_by_case[case_name]
+
+
+def prepare_scenario_inputs(scenario_financials_tables, AS_RT_inputs, iteration):
+    """
+    Reformats the scenario inputs we use across the O&M, CapEx and tax credit calculations.
+
+    Returns:
+    - cumulative_installed_capacity_MW_df, FOM_2021_kw_year_df, AS_RT_curr_inputs, FOM_years, new_capacity_additions_annual_df
+    """
+
+    cumulative_installed_capacity_MW_df = scenario_financials_tables['Cumulative Installed Capacity (MW)'].set_index('Category')
+    FOM_2021_kw_year_df = scenario_financials_tables['Fixed O&M ($2021/kW-yr)'].set_index('Category')
+
+    AS_RT_curr_inputs = AS_RT_inputs[AS_RT_inputs.Scenario == iteration]
+    AS_RT_curr_inputs = AS_RT_curr_inputs.drop(columns = 'Scenario').set_index('Year').T
+
+    FOM_years = cumulative_installed_capacity_MW_df.columns.values
+
+    # capacity additions inputs
+    new_capacity_additions_annual_df = scenario_financials_tables['New Capacity Additions Annual (MW)'].set_index('Year').T
+
+    return cumulative_installed_capacity_MW_df, FOM_2021_kw_year_df, AS_RT_curr_inputs, FOM_years, new_capacity_additions_annual_df
+
+
+def calc_O_and_M_summary(run_variables_dict,
+                         aurora_portfolio_summary,
+                         capacity_payments,
+                         scenario_financials_tables,
+                         FOM_years,
+                         financial_scalars_inputs,
+                         cumulative_installed_capacity_MW_df,
+                         FOM_2021_kw_year_df,
+                         inflation_vector,
+                         CCS_inputs_tables,
+                         hydrogen_island_inputs,
+                         AS_RT_curr_inputs,
+                         end_effects=True,
+                         solar_extension=True,
+                         inflation_rate=0.021,
+                         print_warnings=True):
+    """
+    Calculates Variable O&M, Fixed O&M and Subhourly / Ancillary revenue from new builds and totals them.
+
+    Returns:
+    - VOM_portfolio_cost_df, FOM_yearly_general_df, FOM_portfolio_cost_df, AS_RT_portfolio_cost_df, O_and_M_summary
+    """
+
+    VOM_portfolio_cost_df = calc_VOM(run_variables_dict,
+                                     aurora_portfolio_summary,
+                                     capacity_payments,
+                                     end_effects=end_effects,
+                                     solar_extension=solar_extension,
+                                     inflation_rate=inflation_rate)
+
+    FOM_yearly_general_df = calc_FOM(run_variables_dict,
+                                     scenario_financials_tables,
+                                     FOM_years,
+                                     financial_scalars_inputs,
+                                     end_effects=end_effects,
+                                     solar_extension=solar_extension,
+                                     inflation_rate=inflation_rate)
+
+    FOM_portfolio_cost_df = calc_new_resource_FOM(run_variables_dict,
+                                                  FOM_years,
+                                                  cumulative_installed_capacity_MW_df,
+                                                  FOM_2021_kw_year_df,
+                                                  inflation_vector,
+                                                  CCS_inputs_tables,
+                                                  hydrogen_island_inputs,
+                                                  end_effects=end_effects,
+                                                  solar_extension=solar_extension,
+                                                  inflation_rate=inflation_rate)
+
+    AS_RT_portfolio_cost_df = calc_new_resource_AS_RT(run_variables_dict,
+                                                      FOM_years,
+                                                      AS_RT_curr_inputs,
+                                                      cumulative_installed_capacity_MW_df,
+                                                      end_effects=end_effects,
+                                                      solar_extension=solar_extension,
+                                                      inflation_rate=inflation_rate)
+
+    # Combine all O&M data
+    O_and_M_summary = stack_dataframes([VOM_portfolio_cost_df, FOM_yearly_general_df, FOM_portfolio_cost_df, AS_RT_portfolio_cost_df],
+                                       print_warnings=print_warnings)
+
+    # calculate total O&M and put it into summary
+    total_O_and_M_costs = O_and_M_summary.loc[['Total Portfolio Cost',
+                                               'High Load Capacity Payment',
+                                               'FOM',
+                                               'Transmission Upgrade OpEx',
+                                               'DSM Costs',
+                                               'Tax Equity Costs - CA1 & CA2',
+                                               'New Unit FOM',
+                                               'New Unit Subhourly / Ancillary Revenue']].sum(axis=0, skipna=True)
+
+    # Insert total O&M cost row into first row of dataframe
+    O_and_M_summary = pd.concat([O_and_M_summary.iloc[:0], pd.DataFrame([total_O_and_M_costs]), O_and_M_summary.iloc[0:]])
+    O_and_M_summary.rename(index={O_and_M_summary.index[0]: 'Total O&M Costs'}, inplace=True)
+
+    return VOM_portfolio_cost_df, FOM_yearly_general_df, FOM_portfolio_cost_df, AS_RT_portfolio_cost_df, O_and_M_summary
+
+
+def calc_new_capex(new_capacity_additions_annual_df, capital_costs, inflation_vector, AGP_inputs, iteration):
+    """
+    Calculates New CapEx by resource as capacity * 1000 * capital costs * inflation, plus the AGP adjustments.
+
+    Returns:
+    - pd.DataFrame: New CapEx by resource (rows) and year (columns).
+    """
+
+    # Prepare capital costs
+    curr_capital_costs = capital_costs[capital_costs.Scenario == iteration].drop(columns = 'Scenario')
+    curr_capital_costs = curr_capital_costs.set_index('Year').T
+
+    # Create New CapEx Table
+    escalation_index = get_escalation_index(inflation_vector)
+    new_capex_df = convert_capacity_table_to_cost_table(new_capacity_additions_annual_df,
+                                                        curr_capital_costs,
+                                                        escalation_index,
+                                                        name_adjuster = 'New CapEx -')
+
+    # AGP specific adjustments requested by client
+    sheb_neenah_units = ['Neenah CT1', 'Neenah CT2', 'Sheboygan CT1', 'Sheboygan CT2']
+    AGP_sheb_neenah_inputs = AGP_inputs[AGP_inputs['Unit'].isin(sheb_neenah_units)]
+    new_capex_df.loc['New CapEx - AGP Neenah & Sheboygan', 2026] = AGP_sheb_neenah_inputs['Cap Costs ($2021)'].sum() * escalation_index[2026]
+
+    return new_capex_df
+
+
+def calc_ongoing_capex(run_variables_dict,
+                       scenario_financials_tables,
+                       cumulative_installed_capacity_MW_df,
+                       inflation_vector,
+                       end_effects=True,
+                       inflation_rate=0.021,
+                       print_warnings=True):
+    """
+    Calculates Ongoing CapEx for existing resources (by plant) and new resources (by resource type).
+
+    Returns:
+    - pd.DataFrame: Stacked Ongoing CapEx with years as columns.
+    """
+
+    ### Existing Resource Ongoing CapEx
+    ongoing_capex_by_plant_df = scenario_financials_tables['Ongoing CapEx by Plant Summary'].set_index('Category')
+    ongoing_capex_by_plant_df = ongoing_capex_by_plant_df.drop(['Decomissioning', 'FOM', 'DSM Costs'])
+    # we hard code ongoing capex for transmission upgrade cost as 0
+    ongoing_capex_by_plant_df.loc['Transmission Upgrade OpEx'] = 0
+
+    # Account for extension period
+    if end_effects:
+        ongoing_capex_by_plant_df = extend_years(ongoing_capex_by_plant_df,
+                                                 ongoing_capex_by_plant_df.columns[-1] + 1,
+                                                 run_variables_dict['end_effects_end_year'],
+                                                 inflation_rate)
+
+    ### New Resource Ongoing CapEx
+    new_resource_ongoing_capex = scenario_financials_tables['Ongoing CapEx ($2021/kW-yr)'].set_index('Category')
+    new_resource_ongoing_capex = new_resource_ongoing_capex.drop('New4') # Drop New4 line
+
+    # Calculate total ongoing capex by resource
+    ongoing_capex_by_new_resource_df = convert_capacity_table_to_cost_table(cumulative_installed_capacity_MW_df,
+                                                                            new_resource_ongoing_capex,
+                                                                            inflation_vector,
+                                                                            name_adjuster = 'Ongoing CapEx -')
+
+    # Add total to dataframe
+    total_new_resource_ongoing_capex = ongoing_capex_by_new_resource_df.sum(axis=0)
+    ongoing_capex_by_new_resource_df = pd.concat([ongoing_capex_by_new_resource_df.iloc[:0], pd.DataFrame([total_new_resource_ongoing_capex]), ongoing_capex_by_new_resource_df.iloc[0:]])
+    ongoing_capex_by_new_resource_df.rename(index={ongoing_capex_by_new_resource_df.index[0]: 'Ongoing CapEx - New - Total'}, inplace=True)
+
+    ### Stack
+    ongoing_capex_df = stack_dataframes([ongoing_capex_by_plant_df, ongoing_capex_by_new_resource_df], print_warnings=print_warnings)
+
+    return ongoing_capex_df
+
+
+def calc_AFUDC(new_capex_df, financial_inputs_tables):
+    """
+    Calculates the AFUDC schedule, AFUDC with rate and accumulated AFUDC, and adds accumulated AFUDC to New CapEx.
+
+    Returns:
+    - AFUDC_schedule_df, AFUDC_with_rate_df, AFUDC_accumulated_df, new_capex_with_accumulated_AFUDC
+    """
+
+    # Create a version of the capex table to use for calcs
+    new_capex_df_copy = new_capex_df.copy()
+    new_capex_df_copy.index = new_capex_df_copy.index.str.replace('New CapEx - ', '')
+
+    # Get unit spend schedules
+    new_unit_spend_schedule_df = remove_whitespaces_from_df(financial_inputs_tables['New Unit Spend Schedule (% of total spend)'])
+    new_unit_spend_schedule_with_metadata_df = remove_whitespaces_from_df(financial_inputs_tables['New Unit Spend Schedule with Metadata'])
+    new_unit_spend_schedule_with_metadata_df = new_unit_spend_schedule_with_metadata_df.set_index('Year of Construction')
+
+    ### Calculate AFUDC Schedule
+    AFUDC_schedule_df = calculate_AFUDC_schedule(new_capex_df_copy, new_unit_spend_schedule_df)
+
+    ### Calculate AFUDC with Rate
+    AFUDC_with_rate_df = calculate_AFUDC_with_rate(new_capex_df_copy, new_unit_spend_schedule_with_metadata_df)
+
+    ### Calculate Accumulated AFUDC
+    AFUDC_accumulated_df = calculate_accumulated_AFUDC(new_capex_df_copy, AFUDC_with_rate_df)
+
+    new_capex_with_accumulated_AFUDC = new_capex_df_copy.copy() + AFUDC_accumulated_df.copy()
+
+    return AFUDC_schedule_df, AFUDC_with_rate_df, AFUDC_accumulated_df, new_capex_with_accumulated_AFUDC
+
+
+def calc_depreciation_tables(new_capex_with_accumulated_AFUDC, ongoing_capex_df, financial_inputs_tables, use_IRA, fixed_start_year=2022):
+    """
+    Makes book and tax depreciation tables for every depreciation category.
+
+    Returns:
+    - Dictionary of book depreciation tables by plant (or a note when there is no CapEx).
+    - Dictionary of tax depreciation tables by plant (or a note when there is no CapEx).
+    - pd.DataFrame: Tax depreciation stacked by (Plant, Vintage) with the years the tax tables cover as columns.
+    """
+
+    plant_book_and_tax_life = financial_inputs_tables['Book and Tax Life by Plant']
+    tax_depreciation_schedules = financial_inputs_tables['Tax Depreciation Schedules - Half Year Convention']
+    IRA_noIRA_depreciation_categories = financial_inputs_tables['Book and Tax Life - Depreciation Category']
+
+    # Get list of depreciation categories to make depeciaition tables for
+    depreciation_plants = list(plant_book_and_tax_life['Plant'])
+
+    book_depreciation_tables_dict = {}
+    tax_depreciation_tables_dict = {}
+
+    # Determine depreciaiton categories based on whether IRA is being modeled
+    if use_IRA == True:
+        depreciation_categories = IRA_noIRA_depreciation_categories.drop(columns='With Tax Equity (no IRA)')
+    else:
+        depreciation_categories = IRA_noIRA_depreciation_categories.drop(columns='Without Tax Equity (refundable through IRA)')
+    depreciation_categories = depreciation_categories.rename(columns={depreciation_categories.columns[0]: "Plant Type",
+                                                                      depreciation_categories.columns[1]: "Depreciation Category"})
+
+    # Reformat New CapEx DF that contains IRA/no-IRA dependent labeling
+    new_capex_by_depreciation_df = new_capex_with_accumulated_AFUDC.copy()
+    new_capex_by_depreciation_df['Plant Type'] = new_capex_by_depreciation_df.index.str.replace('New CapEx - ', '')
+    new_capex_by_depreciation_df = pd.merge(new_capex_by_depreciation_df, depreciation_categories, on='Plant Type', how='left')
+    new_capex_by_depreciation_df = new_capex_by_depreciation_df.drop(columns=['Plant Type'])
+    new_capex_by_depreciation_df = new_capex_by_depreciation_df.set_index('Depreciation Category')
+
+    # For "Other Gen" depreciation, we use the sum of ongoing capex of "Ongoing CapEx - Other Gen" and "New resources capex"
+    ongoing_capex_df_adjusted = ongoing_capex_df.copy()
+    ongoing_capex_df_adjusted.loc['Ongoing CapEx - Other Gen'] = (ongoing_capex_df_adjusted.loc['Ongoing CapEx - Other Gen'] +
+                                                                  ongoing_capex_df_adjusted.loc['Ongoing CapEx - New - Total'].fillna(0))
+
+    # Build one capex matrix (plants x years) with the ongoing or new CapEx for every plant we make depreciation tables for
+    capex_streams = []
+    for plant in depreciation_plants:
+        if 'Ongoing' in plant:
+            capex_stream = ongoing_capex_df_adjusted.loc[ongoing_capex_df_adjusted.index == plant]
+        # Go to new CapEx table (plants without new CapEx get a zero row)
+        else:
+            capex_stream = new_capex_by_depreciation_df[new_capex_by_depreciation_df.index == plant].groupby(level=0).sum()
+        capex_streams.append(capex_stream.sum().rename(plant))
+    capex_by_plant_df = pd.concat(capex_streams, axis=1).T.fillna(0).sort_index(axis=1)
+
+    # Book and tax lives by plant
+    book_lives = plant_book_and_tax_life.set_index('Plant')['Book'].astype(int)
+    tax_lives = plant_book_and_tax_life.set_index('Plant')['Tax'].astype(int)
+
+    # Book depreciation tables (if sum of capex is 0, there is no depreciation we can do)
+    for plant in depreciation_plants:
+        if capex_by_plant_df.loc[plant].sum() == 0:
+            book_depreciation_tables_dict[plant] = "None because no CapEx provided"
+        else:
+            book_depreciation_tables_dict[plant] = create_book_depreciation_schedule(capex_by_plant_df.loc[[plant]], book_lives[plant], fixed_start_year)
+
+    # Tax depreciation tables: depreciate every MACRS plant at once using the MACRS schedules
+    macrs_plants = [plant for plant in depreciation_plants if tax_lives[plant] != 0]
+    (macrs_tax_depreciation_tables_dict,
+     macrs_tax_depreciation_df) = create_tax_depreciation_schedules(capex_by_plant_df.loc[macrs_plants],
+                                                                    tax_lives,
+                                                                    tax_depreciation_schedules,
+                                                                    fixed_start_year)
+
+    # If tax depreciation is 0, use the book depreciation as tax depreciation
+    tax_depreciation_by_plant = {}
+    for plant in depreciation_plants:
+        if tax_lives[plant] == 0 or capex_by_plant_df.loc[plant].sum() == 0:
+            tax_depreciation_tables_dict[plant] = book_depreciation_tables_dict[plant]
+            if isinstance(book_depreciation_tables_dict[plant], pd.DataFrame):
+                tax_depreciation_by_plant[plant] = book_depreciation_tables_dict[plant].iloc[:-1].drop(columns='Annual CapEx')
+        else:
+            tax_depreciation_tables_dict[plant] = macrs_tax_depreciation_tables_dict[plant]
+            tax_depreciation_by_plant[plant] = macrs_tax_depreciation_df.loc[plant]
+
+    # Stack the tax depreciation of every plant by vintage on the years the tax tables cover (the MACRS rows outside
+    # those years are all 0), so the deferred taxes can sum it in one step
+    tax_years = sorted({year for table in tax_depreciation_tables_dict.values() if isinstance(table, pd.DataFrame)
+                        for year in table.columns.drop('Annual CapEx')})
+    tax_depreciation_df = pd.concat(tax_depreciation_by_plant, names=['Plant', 'Vintage'])
+    tax_depreciation_df = tax_depreciation_df.reindex(columns=tax_years).fillna(0)
+
+    return book_depreciation_tables_dict, tax_depreciation_tables_dict, tax_depreciation_df
+
+
+def calc_deferred_tax_tables(run_variables_dict,
+                             scenario_financials_tables,
+                             financial_scalars_inputs,
+                             book_depreciation_tables_dict,
+                             tax_depreciation_df,
+                             existing_plant_depreciation,
+                             total_existing_plant_summary,
+                             existing_plant_NPV_BOY,
+                             end_effects=True,
+                             solar_extension=True,
+                             inflation_rate=0.021):
+    """
+    Calculates state, federal and blended (state weighted by 1 - federal tax rate) deferred taxes.
+
+    Returns:
+    - deferred_tax_state_df, deferred_tax_federal_df, deferred_tax_blended_df
+    """
+
+    BOY_state_tax = scenario_financials_tables['Existing Capital - Tax Value - State - BOY'].set_index('Plant Name').loc[['Total']]
+    EOY_state_tax = scenario_financials_tables['Existing Capital - Tax Value - State - EOY'].set_index('Plant Name').loc[['Total']]
+    BOY_federal_tax = scenario_financials_tables['Existing Capital - Tax Value - Federal - BOY'].set_index('Plant Name').loc[['Total']]
+    EOY_federal_tax = scenario_financials_tables['Existing Capital - Tax Value - Federal - EOY'].set_index('Plant Name').loc[['Total']]
+
+    # Handle extension period
+    if end_effects:
+        end_year = run_variables_dict['end_effects_end_year']
+    if solar_extension:
+        end_year = run_variables_dict['solar_extension_end_year']
+    if end_effects or solar_extension:
+        BOY_state_tax = extend_years(BOY_state_tax, BOY_state_tax.columns[-1]+1, end_year, inflation_rate, rows=['Total'])
+        EOY_state_tax = extend_years(EOY_state_tax, EOY_state_tax.columns[-1]+1, end_year, inflation_rate, rows=['Total'])
+        BOY_federal_tax = extend_years(BOY_federal_tax, BOY_federal_tax.columns[-1]+1, end_year, inflation_rate, rows=['Total'])
+        EOY_federal_tax = extend_years(EOY_federal_tax, EOY_federal_tax.columns[-1]+1, end_year, inflation_rate, rows=['Total'])
+
+    ### State, Federal and Blended Deferred Taxes
+    state_tax_rate = financial_scalars_inputs.loc['State Income Tax Rate'][0]
+    federal_tax_rate = financial_scalars_inputs.loc['Federal Income Tax Rate'][0]
+    (deferred_tax_state_df,
+     deferred_tax_federal_df,
+     deferred_tax_blended_df) = calc_state_federal_blended_deferred_taxes(state_tax_rate,
+                                                                          federal_tax_rate,
+                                                                          BOY_state_tax,
+                                                                          EOY_state_tax,
+                                                                          BOY_federal_tax,
+                                                                          EOY_federal_tax,
+                                                                          book_depreciation_tables_dict,
+                                                                          tax_depreciation_df,
+                                                                          existing_plant_depreciation,
+                                                                          total_existing_plant_summary,
+                                                                          existing_plant_NPV_BOY)
+
+    return deferred_tax_state_df, deferred_tax_federal_df, deferred_tax_blended_df
+
+
+def calc_tax_credits(run_variables_dict,
+                     inflation_vector,
+                     financial_inputs_tables,
+                     financial_scalars_inputs,
+                     ptcs_and_itcs_tables,
+                     aurora_portfolio_resource,
+                     hydrogen_island_inputs,
+                     cumulative_installed_capacity_MW_df,
+                     CCS_inputs_tables):
+    """
+    Calculates PTCs (old tax policy and IRA) and the normalized ITC.
+
+    Returns:
+    - PTC_df, generation_df, old_tax_policy_PTC_generated, IRA_PTC_df, total_grossed_up_ptc, NOL, ITC
+    """
+
+    use_IRA = run_variables_dict['use_IRA']
+
+    PTC_df = calculate_ptc(inflation_vector, financial_inputs_tables)
+
+    generation_df = calculate_generation(ptcs_and_itcs_tables,
+                                         aurora_portfolio_resource,
+                                         run_variables_dict['aurora_condition'],
+                                         run_variables_dict['aurora_iteration'],
+                                         run_variables_dict['aurora_portfolio_ID'],
+                                         hydrogen_island_inputs,
+                                         cumulative_installed_capacity_MW_df,
+                                         run_variables_dict['iteration'],
+                                         CCS_inputs_tables)
+
+    old_tax_policy_PTC_generated = calculate_old_tax_policy_PTC_generated(PTC_df, generation_df, financial_inputs_tables,
+                                                                          use_IRA, financial_scalars_inputs)
+
+    IRA_PTC_df = calculate_ira_ptc(generation_df, PTC_df, financial_scalars_inputs, use_IRA)
+
+    ### Total Grossed Up PTC Payment
+    if use_IRA == True:
+        total_grossed_up_ptc = old_tax_policy_PTC_generated.loc[['Grossed Up PTC']] + IRA_PTC_df.loc[['Grossed Up PTC']]
+    else:
+        total_grossed_up_ptc = old_tax_policy_PTC_generated.loc[['Grossed Up PTC']]
+
+    ### NOL
+    NOL = financial_inputs_tables['Alliant Projected NOL?'].set_index('Year').T
+
+    ITC = calculate_ITC(NOL, financial_inputs_tables, financial_scalars_inputs, ptcs_and_itcs_tables, run_variables_dict)
+
+    return PTC_df, generation_df, old_tax_policy_PTC_generated, IRA_PTC_df, total_grossed_up_ptc, NOL, ITC
+
+
+def calc_retired_plants(run_variables_dict,
+                        scenario_financials_tables,
+                        ongoing_capex_df,
+                        existing_plant_NPV_EOY,
+                        financial_scalars_inputs,
+                        capital_charge_df,
+                        end_effects=True,
+                        solar_extension=True,
+                        inflation_rate=0.021):
+    """
+    Processes retired plants and adds the WACC calculated in the capital charge section as their 'Return on %'.
+
+    Returns:
+    - pd.DataFrame: Retired plants summary with years as columns.
+    """
+
+    retired_plants_df = process_retired_plants(run_variables_dict,
+                                               scenario_financials_tables,
+                                               ongoing_capex_df,
+                                               existing_plant_NPV_EOY,
+                                               financial_scalars_inputs,
+                                               end_effects=end_effects,
+                                               solar_extension=solar_extension,
+                                               inflation_rate=inflation_rate)
+
+    # add in WACC to retired plants df as calculated in the capital charge section
+    retired_plants_df.loc['Return on %'] = capital_charge_df.loc['Return on (WACC)'].to_dict()
+
+    return retired_plants_df
+
+
+def calc_revenue_requirement(rate_base_df,
+                             total_existing_plant_summary,
+                             O_and_M_summary,
+                             capital_charge_df,
+                             retired_plants_df,
+                             total_grossed_up_ptc,
+                             ITC,
+                             financial_scalars_inputs):
+    """
+    Adds up book depreciation, O&M, capital charge, taxes and license fee into the revenue requirement.
+
+    Returns:
+    - pd.DataFrame: Revenue requirement components and total with years as columns.
+    """
+
+    # Book Depreciation
+    book_depreciation = (rate_base_df.loc['Depreciation - New']
+                        + rate_base_df.loc['Depreciation - Existing']
+                        - total_existing_plant_summary.loc['Depreciation "Credit Back"'].fillna(0))
+    revenue_requirement_df = book_depreciation.to_frame().T
+    revenue_requirement_df.rename(index={revenue_requirement_df.index[0]: 'Book Deprecitation'}, inplace=True)
+
+    # Total O&M
+    total_gen_o_m = pd.Series(O_and_M_summary.loc['Total O&M Costs'], index=revenue_requirement_df.columns)
+    revenue_requirement_df.loc['Total Generation O&M'] = total_gen_o_m
+
+    # Capital Charge (- return on retired assets if not allowed reutrn)
+    capital_charge = pd.Series(capital_charge_df.loc['Return on Ratebase'] - retired_plants_df.loc['Earn Return on $'], index=revenue_requirement_df.columns)
+    revenue_requirement_df.loc['Capital Charge'] = capital_charge
+
+    # Taxes
+    income_tax_rate = financial_scalars_inputs.loc['Income Tax Rate', 'Value']
+    taxes = (
+        (capital_charge_df.loc['ROE'] / (1 - income_tax_rate)) * income_tax_rate
+        - (retired_plants_df.loc['Income Tax'] + retired_plants_df.loc['Property Tax'])
+        - total_grossed_up_ptc.loc['Grossed Up PTC'].reindex(capital_charge_df.loc['ROE'].index, fill_value=0)
+        - ITC.loc['Total Grossed Up IRA ITC Benefit'].reindex(capital_charge_df.loc['ROE'].index, fill_value=0)
+    )
+    revenue_requirement_df.loc['Taxes'] = taxes
+
+    # License Fee
+    revenue_requirement_df.loc['License Fee'] = revenue_requirement_df.sum() * financial_scalars_inputs.loc['License Fee', 'Value']
+
+    # Total Revenue Requirement
+    revenue_requirement_df.loc['Total Revenue Requirement'] = revenue_requirement_df.sum()
+    revenue_requirement_df = revenue_requirement_df.replace(np.nan, None)
+
+    return revenue_requirement_df
+
+
+def calc_NPVRR(revenue_requirement_df, financial_scalars_inputs, run_variables_dict):
+    """
+    Calculates the net present value of the revenue requirement (NPVRR) over the study, long-term and end effects periods.
+
+    Returns:
+    - pd.DataFrame: One row with a column for each NPVRR.
+    """
+
+    discount_rate = financial_scalars_inputs.loc['After-Tax WACC', 'Value']
+    start_year = run_variables_dict['rev_req_start_year']
+    total_revenue_requirement = revenue_requirement_df.loc['Total Revenue Requirement']
+
+    # Discount from the year before the start year, so the first year is discounted one period
+    npv_periods = {
+        f'Net Present Value of All Costs ({start_year}-{run_variables_dict["rev_req_end_year"]})': run_variables_dict['rev_req_end_year'],
+        f'Long-Term NPVRR ({start_year}-{run_variables_dict["end_effects_end_year"]})': run_variables_dict['end_effects_end_year'],
+        f'End Effects NPVRR ({start_year}-{run_variables_dict["solar_extension_end_year"]})': run_variables_dict['solar_extension_end_year'],
+    }
+    npv_table = calc_npv_table(total_revenue_requirement, discount_rate, start_year, npv_periods)
+    npv_df = pd.DataFrame([npv_table['NPVRR'].values], columns=npv_table['horizon'].values)
+
+    return npv_df
@@ -0,0 +1,201 @@
+import os
+import itertools
+import argparse
+import traceback
+import warnings
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+from .revenue_requirement_functions import load_model_inputs
+from .pipeline_functions import run_revenue_requirement
+
+# Aurora iteration that goes with each model iteration
+ITERATIONS = {'Continue_Change': 'CIC',
+              'Market_Stagnation': 'MS_AGP',
+              'New_Regulation': 'NR_AGP',
+              'Advanced_Customers': 'ACT_AGP',
+              'Accelerated_Decarbonization': 'AD_AGP'}
+
+# Aurora portfolio ID for each case
+CASE_PORTFOLIO_IDS = {'Baseline': 1,
+                      'Datacenter': 2,
+                      'Datacenter_no_ext': 5}
+
+# Columns describing each run in the results table
+SCENARIO_COLUMNS = ['case_name', 'iteration', 'aurora_iteration', 'aurora_portfolio_ID', 'use_IRA']
+
+# Inputs for the runs in this worker process, loaded once when the worker starts
+_worker_model_inputs = None
+
+
+def build_scenario_runs(case_names=None,
+                        iterations=None,
+                        use_IRA_options=(True,),
+                        aurora_condition='ATC',
+                        year=2023,
+                        rev_req_start_year=2023,
+                        rev_req_end_year=2047,
+                        end_effects_end_year=2057,
+                        solar_extension_end_year=2072):
+    """
+    Makes a run variables dictionary for every combination of case, iteration and IRA option.
+
+    Parameters:
+    - case_names (list, optional): Cases to run. Default is every case in CASE_PORTFOLIO_IDS.
+    - iterations (list, optional): Iterations to run. Default is every iteration in ITERATIONS.
+    - use_IRA_options (tuple, optional): IRA options to run. Default is (True,).
+    - Remaining parameters are the run variables shared by every run, as set in the notebook.
+
+    Returns:
+    - List of run variables dictionaries, in the same format as the notebook's run_variables_dict.
+    """
+
+    if case_names is None:
+        case_names = list(CASE_PORTFOLIO_IDS.keys())
+    if iterations is None:
+        iterations = list(ITERATIONS.keys())
+
+    runs = []
+    for case_name, iteration, use_IRA in itertools.product(case_names, iterations, use_IRA_options):
+        runs.append({
+            'case_name': case_name,
+            'iteration': iteration,
+            'aurora_iteration': ITERATIONS[iteration],
+            'aurora_condition': aurora_condition,
+            'use_IRA': use_IRA,
+            'year': year,
+            'aurora_portfolio_ID': CASE_PORTFOLIO_IDS[case_name],
+            'rev_req_start_year': rev_req_start_year,
+            'rev_req_end_year': rev_req_end_year,
+            'end_effects_end_year': end_effects_end_year,
+            'solar_extension_end_year': solar_extension_end_year})
+
+    return runs
+
+
+def init_sweep_worker(model_inputs_path):
+
+    global _worker_model_inputs
+
+    # Pause future warnings for cleaner output, as in the notebook
+    warnings.simplefilter(action='ignore', category=FutureWarning)
+
+    # Load from the input cache the parent process already built (memory mapped, so nothing is re-parsed)
+    _worker_model_inputs = load_model_inputs(model_inputs_path)
+
+
+def run_sweep_scenario(run_variables_dict, end_effects=True, solar_extension=True, inflation_rate=0.021, result_names=None):
+
+    scenario_row = {column: run_variables_dict[column] for column in SCENARIO_COLUMNS}
+
+    try:
+        results = run_revenue_requirement(_worker_model_inputs,
+                                          run_variables_dict,
+                                          end_effects=end_effects,
+                                          solar_extension=solar_extension,
+                                          inflation_rate=inflation_rate,
+                                          print_warnings=False)
+        npv_df = results['npv_df']
+        scenario_row.update(npv_df.iloc[0].to_dict())
+        scenario_row['error'] = None
+        # Send back the full results that were asked for (e.g. to export them)
+        if result_names is not None:
+            scenario_row['results'] = {result_name: results[result_name] for result_name in result_names}
+    except Exception:
+        # Keep the sweep going and report which scenario failed
+        scenario_row['error'] = traceback.format_exc(limit=3)
+
+    return scenario_row
+
+
+def run_scenario_sweep(model_inputs_path,
+                       runs=None,
+                       max_workers=None,
+                       end_effects=True,
+                       solar_extension=True,
+                       inflation_rate=0.021,
+                       result_names=None):
+    """
+    Runs the full revenue requirement calculation (O&M through NPVRR) for many scenarios in parallel.
+
+    The model inputs are parsed once into the input cache before any worker starts. Each worker process then loads
+    them from the cache a single time and only reads them, so every run in that worker shares the same inputs.
+
+    Parameters:
+    - model_inputs_path (str): Path to the 'Direct Model Inputs' workbook.
+    - runs (list, optional): Run variables dictionaries to run. Default is build_scenario_runs().
+    - max_workers (int, optional): Number of worker processes. Default is the number of CPUs (capped at the number of runs).
+    - end_effects (bool, optional): Whether to model the end effects period. Default is True.
+    - solar_extension (bool, optional): Whether to model the solar extension period. Default is True.
+    - inflation_rate (float, optional): Inflation rate for extension periods. Default is 0.021.
+    - result_names (list, optional): Results to keep for every scenario (e.g. list(EXPORT_TABLES.values()) from
+      result_export_functions). Default is to only keep the NPVRRs.
+
+    Returns:
+    - pd.DataFrame: One row per scenario with the scenario variables and its NPVRRs.
+    - list: Only if result_names is given, (run_variables_dict, results) pairs for the scenarios that ran, which
+      export_scenario_results takes.
+    """
+
+    if runs is None:
+        runs = build_scenario_runs()
+    if max_workers is None:
+        max_workers = min(os.cpu_count() or 1, len(runs))
+
+    # Parse the workbook once up front so the workers only read the cache
+    load_model_inputs(model_inputs_path)
+
+    with ProcessPoolExecutor(max_workers=max_workers,
+                             initializer=init_sweep_worker,
+                             initargs=(model_inputs_path,)) as executor:
+        futures = [executor.submit(run_sweep_scenario, run_variables_dict, end_effects, solar_extension, inflation_rate, result_names)
+                   for run_variables_dict in runs]
+        scenario_rows = [future.result() for future in futures]
+
+    # Print any scenarios that failed
+    for scenario_row in scenario_rows:
+        if scenario_row['error'] is not None:
+            print(f"Warning: scenario {scenario_row['case_name']} / {scenario_row['iteration']} failed:\n{scenario_row['error']}")
+
+    # Full results of the scenarios that ran
+    scenario_results = [(run_variables_dict, scenario_row.pop('results'))
+                        for run_variables_dict, scenario_row in zip(runs, scenario_rows) if 'results' in scenario_row]
+
+    sweep_results_df = pd.DataFrame(scenario_rows)
+    npv_columns = [column for column in sweep_results_df.columns if column not in SCENARIO_COLUMNS + ['error']]
+    sweep_results_df[npv_columns] = sweep_results_df[npv_columns].astype(float)
+
+    sweep_results_df = sweep_results_df[SCENARIO_COLUMNS + npv_columns + ['error']]
+
+    if result_names is not None:
+        return sweep_results_df, scenario_results
+    return sweep_results_df
+
+
+# Run from the model folder with: python -m funcs.scenario_sweep_functions "Direct Model Inputs.xlsx"
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Run the revenue requirement model for every scenario and save the NPVRRs.')
+    parser.add_argument('model_inputs_path', help="Path to the 'Direct Model Inputs' workbook")
+    parser.add_argument('--output', default='Scenario Sweep Results.csv', help='Where to save the results table')
+    parser.add_argument('--cases', nargs='+', choices=list(CASE_PORTFOLIO_IDS.keys()), help='Cases to run (default: all)')
+    parser.add_argument('--iterations', nargs='+', choices=list(ITERATIONS.keys()), help='Iterations to run (default: all)')
+    parser.add_argument('--with-and-without-IRA', action='store_true', help='Run every scenario with and without IRA')
+    parser.add_argument('--max-workers', type=int, help='Number of worker processes')
+    parser.add_argument('--export-folder', help='Also export every table to a Parquet dataset in this folder')
+    parser.add_argument('--summary-workbook', help='Also write a workbook with one sheet per scenario (needs --export-folder)')
+    args = parser.parse_args()
+
+    runs = build_scenario_runs(case_names=args.cases,
+                               iterations=args.iterations,
+                               use_IRA_options=(True, False) if args.with_and_without_IRA else (True,))
+    if args.export_folder is None:
+        sweep_results_df = run_scenario_sweep(args.model_inputs_path, runs=runs, max_workers=args.max_workers)
+    else:
+        from .result_export_functions import EXPORT_TABLES, export_scenario_results
+        sweep_results_df, scenario_results = run_scenario_sweep(args.model_inputs_path, runs=runs, max_workers=args.max_workers,
+                                                                result_names=list(EXPORT_TABLES.values()))
+        export_scenario_results(scenario_results, args.export_folder, summary_workbook=args.summary_workbook,
+                                max_workers=args.max_workers)
+    sweep_results_df.to_csv(args.output, index=False)
+    print(sweep_results_df.drop(columns='error').to_string(index=False))
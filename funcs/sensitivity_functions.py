@@ -0,0 +1,227 @@
+import os
+import argparse
+import traceback
+import warnings
+import pandas as pd
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from .revenue_requirement_functions import load_model_inputs
+from .pipeline_functions import run_pipeline, run_revenue_requirement, get_downstream_outputs
+from .scenario_sweep_functions import CASE_PORTFOLIO_IDS, ITERATIONS, build_scenario_runs
+
+# Financial scalars perturbed by default: the rates and ratios behind the capital charge, retired plants, taxes and NPVRR
+SENSITIVITY_SCALARS = ['Return on Equity (Existing)', 'Return on Equity (New)', 'Cost of Debt (Existing)', 'Cost of Debt (New)',
+                       'Equity % Rate Base', 'Income Tax Rate', 'State Income Tax Rate', 'Federal Income Tax Rate',
+                       'Property Tax Rate', 'License Fee', 'After-Tax WACC']
+
+# Scalars that add up to 1 with another scalar, which is set to 1 minus the perturbed value so they still do
+COMPLEMENTARY_SCALARS = {'Equity % Rate Base': 'Debt % Rate Base',
+                         'Debt % Rate Base': 'Equity % Rate Base'}
+
+# Model inputs, run variables, options and upstream results for the cases in this worker process, set when the worker starts
+_worker_model_inputs = None
+_worker_run_variables_dict = None
+_worker_upstream_results = None
+_worker_options = None
+
+
+def perturb_financial_scalars(financial_scalars_inputs, scalar_name, change):
+    """
+    Returns a copy of financial_scalars_inputs with one scalar changed by a relative amount (e.g. 0.1 for +10%).
+
+    If the scalar has a complement in COMPLEMENTARY_SCALARS (e.g. 'Debt % Rate Base' for 'Equity % Rate Base'), the
+    complement is set to 1 minus the new value.
+
+    Parameters:
+    - financial_scalars_inputs (pd.DataFrame): 'Scalar Inputs' table indexed by 'Scalar Input'.
+    - scalar_name (str): Row to change.
+    - change (float): Relative change to the value.
+
+    Returns:
+    - pd.DataFrame: Perturbed copy of financial_scalars_inputs.
+    """
+
+    perturbed_scalars = financial_scalars_inputs.copy()
+    perturbed_value = float(financial_scalars_inputs.loc[scalar_name, 'Value']) * (1 + change)
+    perturbed_scalars.loc[scalar_name, 'Value'] = perturbed_value
+
+    if scalar_name in COMPLEMENTARY_SCALARS:
+        perturbed_scalars.loc[COMPLEMENTARY_SCALARS[scalar_name], 'Value'] = 1 - perturbed_value
+
+    return perturbed_scalars
+
+
+def get_changed_names(scalar_name):
+
+    # A perturbed scalar also changes its complement
+    return [scalar_name] + ([COMPLEMENTARY_SCALARS[scalar_name]] if scalar_name in COMPLEMENTARY_SCALARS else [])
+
+
+def init_sensitivity_worker(model_inputs_path, run_variables_dict, upstream_results, options):
+
+    global _worker_model_inputs, _worker_run_variables_dict, _worker_upstream_results, _worker_options
+
+    # Pause future warnings for cleaner output, as in the notebook
+    warnings.simplefilter(action='ignore', category=FutureWarning)
+
+    # Load from the input cache the parent process already built (memory mapped, so nothing is re-parsed)
+    _worker_model_inputs = load_model_inputs(model_inputs_path)
+    _worker_run_variables_dict = run_variables_dict
+    _worker_upstream_results = upstream_results
+    _worker_options = options
+
+
+def run_sensitivity_case(scalar_name, change):
+
+    case_row = {'scalar': scalar_name, 'change': change}
+
+    try:
+        model_inputs = dict(_worker_model_inputs)
+        model_inputs['financial_scalars_inputs'] = perturb_financial_scalars(_worker_model_inputs['financial_scalars_inputs'],
+                                                                            scalar_name, change)
+        case_row['value'] = model_inputs['financial_scalars_inputs'].loc[scalar_name, 'Value']
+
+        # Keep the results that don't depend on this scalar, so only the stages downstream of it rerun
+        downstream_outputs = get_downstream_outputs(get_changed_names(scalar_name))
+        results = {name: value for name, value in _worker_upstream_results.items() if name not in downstream_outputs}
+        results = run_pipeline(model_inputs, _worker_run_variables_dict, targets=['npv_df'], results=results, **_worker_options)
+
+        case_row.update(results['npv_df'].iloc[0].to_dict())
+        case_row['error'] = None
+    except Exception:
+        # Keep the analysis going and report which case failed
+        case_row['error'] = traceback.format_exc(limit=3)
+
+    return case_row
+
+
+def run_sensitivity_analysis(model_inputs_path,
+                             run_variables_dict,
+                             scalar_names=None,
+                             changes=(-0.1, 0.1),
+                             max_workers=None,
+                             cache=None,
+                             **options):
+    """
+    Reruns the NPVRR with each financial scalar perturbed by each relative change, one scalar at a time.
+
+    The base case runs once (through the stage cache, if given, so O&M, depreciation and the other stages that don't
+    use the financial scalars are reused from earlier runs). Its results are sent to every worker process, and each
+    perturbed case only reruns the stages downstream of the scalar it changes (see get_downstream_outputs).
+
+    Parameters:
+    - model_inputs_path (str): Path to the 'Direct Model Inputs' workbook.
+    - run_variables_dict (dictionary): Scenario and run variables, in the same format as the notebook's run_variables_dict.
+    - scalar_names (list, optional): Rows of financial_scalars_inputs to perturb. Default is SENSITIVITY_SCALARS.
+    - changes (tuple, optional): Relative changes to apply to each scalar. Default is (-0.1, 0.1), i.e. -/+10%.
+    - max_workers (int, optional): Number of worker processes. Default is the number of CPUs (capped at the number of cases).
+    - cache (StageCache, optional): Cache of stage results for the base case.
+    - options: Run options, as in run_pipeline.
+
+    Returns:
+    - pd.DataFrame: One row per case with the scalar, change, perturbed value, NPVRRs and NPVRR deltas from the base
+      case. The base case is the first row (with no scalar and a change of 0).
+    """
+
+    if scalar_names is None:
+        scalar_names = SENSITIVITY_SCALARS
+    cases = [(scalar_name, change) for scalar_name in scalar_names for change in changes]
+    if max_workers is None:
+        max_workers = min(os.cpu_count() or 1, len(cases))
+    options.setdefault('print_warnings', False)
+
+    # Base case (parsing the workbook once up front so the workers only read the input cache)
+    model_inputs = load_model_inputs(model_inputs_path)
+    base_results = run_revenue_requirement(model_inputs, run_variables_dict, cache=cache, **options)
+    base_row = {'scalar': None, 'change': 0.0, 'value': np.nan}
+    base_row.update(base_results['npv_df'].iloc[0].to_dict())
+    base_row['error'] = None
+
+    # Workers only need the results upstream of every perturbed scalar
+    downstream_outputs = get_downstream_outputs([name for scalar_name in scalar_names for name in get_changed_names(scalar_name)])
+    upstream_results = {name: value for name, value in base_results.items() if name not in downstream_outputs}
+
+    with ProcessPoolExecutor(max_workers=max_workers,
+                             initializer=init_sensitivity_worker,
+                             initargs=(model_inputs_path, run_variables_dict, upstream_results, options)) as executor:
+        futures = [executor.submit(run_sensitivity_case, scalar_name, change) for scalar_name, change in cases]
+        case_rows = [future.result() for future in futures]
+
+    # Print any cases that failed
+    for case_row in case_rows:
+        if case_row['error'] is not None:
+            print(f"Warning: sensitivity case {case_row['scalar']} {case_row['change']:+.0%} failed:\n{case_row['error']}")
+
+    sensitivity_results_df = pd.DataFrame([base_row] + case_rows)
+    npv_columns = list(base_results['npv_df'].columns)
+    sensitivity_results_df[npv_columns] = sensitivity_results_df[npv_columns].astype(float)
+
+    # NPVRR deltas from the base case
+    delta_columns = [f'{npv_column} Delta' for npv_column in npv_columns]
+    sensitivity_results_df[delta_columns] = sensitivity_results_df[npv_columns].values - sensitivity_results_df[npv_columns].values[0]
+
+    return sensitivity_results_df[['scalar', 'change', 'value'] + npv_columns + delta_columns + ['error']]
+
+
+def make_tornado_table(sensitivity_results_df, npv_column=None):
+    """
+    Makes a tornado table from run_sensitivity_analysis results: one row per scalar with the NPVRR deltas at its lowest
+    and highest change, sorted by the size of the swing between them (largest first).
+
+    Parameters:
+    - sensitivity_results_df (pd.DataFrame): Results from run_sensitivity_analysis.
+    - npv_column (str, optional): NPVRR to make the table for. Default is the first NPVRR.
+
+    Returns:
+    - pd.DataFrame: Indexed by scalar, with 'Low Change', 'High Change', 'Low Value', 'High Value', 'Low Delta',
+      'High Delta' and 'Swing' columns.
+    """
+
+    if npv_column is None:
+        npv_column = [column for column in sensitivity_results_df.columns if column not in ('scalar', 'change', 'value')][0]
+    delta_column = f'{npv_column} Delta'
+
+    case_results_df = sensitivity_results_df[sensitivity_results_df['scalar'].notna()].sort_values(['scalar', 'change'])
+    low_cases = case_results_df.groupby('scalar', sort=False).first()
+    high_cases = case_results_df.groupby('scalar', sort=False).last()
+
+    tornado_df = pd.DataFrame({'Low Change': low_cases['change'],
+                               'High Change': high_cases['change'],
+                               'Low Value': low_cases['value'],
+                               'High Value': high_cases['value'],
+                               'Low Delta': low_cases[delta_column],
+                               'High Delta': high_cases[delta_column]})
+    tornado_df['Swing'] = (tornado_df['High Delta'] - tornado_df['Low Delta']).abs()
+    tornado_df.index.name = 'Scalar Input'
+
+    return tornado_df.sort_values('Swing', ascending=False)
+
+
+# Run from the model folder with: python -m funcs.sensitivity_functions "Direct Model Inputs.xlsx"
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Perturb the financial scalar inputs and save a tornado table of NPVRR deltas.')
+    parser.add_argument('model_inputs_path', help="Path to the 'Direct Model Inputs' workbook")
+    parser.add_argument('--output', default='Sensitivity Results.csv', help='Where to save the results of every case')
+    parser.add_argument('--tornado-output', default='Tornado Table.csv', help='Where to save the tornado table')
+    parser.add_argument('--case', default='Datacenter', choices=list(CASE_PORTFOLIO_IDS.keys()), help='Case to run')
+    parser.add_argument('--iteration', default='Continue_Change', choices=list(ITERATIONS.keys()), help='Iteration to run')
+    parser.add_argument('--without-IRA', action='store_true', help='Run without IRA')
+    parser.add_argument('--scalars', nargs='+', help='Financial scalar inputs to perturb (default: SENSITIVITY_SCALARS)')
+    parser.add_argument('--change', type=float, default=0.1, help='Relative change to apply up and down (default: 0.1)')
+    parser.add_argument('--max-workers', type=int, help='Number of worker processes')
+    args = parser.parse_args()
+
+    run_variables_dict = build_scenario_runs(case_names=[args.case],
+                                             iterations=[args.iteration],
+                                             use_IRA_options=(not args.without_IRA,))[0]
+    sensitivity_results_df = run_sensitivity_analysis(args.model_inputs_path,
+                                                      run_variables_dict,
+                                                      scalar_names=args.scalars,
+                                                      changes=(-args.change, args.change),
+                                                      max_workers=args.max_workers)
+    tornado_df = make_tornado_table(sensitivity_results_df)
+    sensitivity_results_df.to_csv(args.output, index=False)
+    tornado_df.to_csv(args.tornado_output)
+    print(tornado_df.to_string())
@@ -0,0 +1,224 @@
+import os
+import copy
+import pickle
+import hashlib
+import tempfile
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+
+from .aurora_data_functions import AuroraOutputStore
+from .escalation_functions import EscalationIndex
+
+# Cache files are stored here unless a cache folder is given
+DEFAULT_STAGE_CACHE_FOLDER = os.path.join(os.path.expanduser('~'), '.wpl_stage_cache')
+
+
+def hash_funcs_source():
+    """
+    Hashes the source of every module in the funcs package, so cached stage results are never reused after the code
+    that calculated them changes.
+    """
+
+    funcs_folder = os.path.dirname(os.path.abspath(__file__))
+    source_hash = hashlib.sha256()
+    for file_name in sorted(os.listdir(funcs_folder)):
+        if file_name.endswith('.py'):
+            with open(os.path.join(funcs_folder, file_name), 'rb') as source_file:
+                source_hash.update(file_name.encode())
+                source_hash.update(source_file.read())
+
+    return source_hash.hexdigest()
+
+
+def hash_value(value):
+    """
+    Hashes the contents of a stage input (DataFrames, Series, arrays, dictionaries, lists and scalars), so equal
+    inputs give the same hash no matter which object holds them.
+
+    Parameters:
+    - value: Value to hash.
+
+    Returns:
+    - str: sha256 hex digest of the value's contents.
+    """
+
+    value_hash = hashlib.sha256()
+    update_hash(value_hash, value)
+
+    return value_hash.hexdigest()
+
+
+def update_hash(value_hash, value):
+
+    # Tag every value with its type so e.g. 1 and '1' don't hash the same
+    value_hash.update(type(value).__name__.encode())
+
+    if isinstance(value, AuroraOutputStore):
+        update_hash(value_hash, value.data)
+    elif isinstance(value, EscalationIndex):
+        update_hash(value_hash, (value.first_year, value.last_input_year, value.inflation_rate, value.values))
+    elif isinstance(value, (pd.DataFrame, pd.Series)):
+        value_hash.update(repr(value.shape).encode())
+        value_hash.update(pickle.dumps(value.index))
+        if isinstance(value, pd.DataFrame):
+            value_hash.update(pickle.dumps(value.columns))
+            value_hash.update(repr(list(value.dtypes)).encode())
+            value_columns = [value.iloc[:, position] for position in range(value.shape[1])]
+        else:
+            value_hash.update(repr(value.dtype).encode())
+            value_columns = [value]
+        # Hash column by column so mixed-type (object) columns still hash by their values
+        for column in value_columns:
+            try:
+                value_hash.update(pd.util.hash_pandas_object(column, index=False).values.tobytes())
+            except TypeError:
+                value_hash.update(pickle.dumps(column.tolist()))
+    elif isinstance(value, np.ndarray):
+        value_hash.update(repr((value.dtype, value.shape)).encode())
+        if value.dtype == object:
+            value_hash.update(pickle.dumps(value.tolist()))
+        else:
+            value_hash.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, dict):
+        for key in sorted(value.keys(), key=repr):
+            update_hash(value_hash, key)
+            update_hash(value_hash, value[key])
+    elif isinstance(value, (list, tuple)):
+        value_hash.update(str(len(value)).encode())
+        for item in value:
+            update_hash(value_hash, item)
+    elif value is None or isinstance(value, (str, bool, int, float, np.generic)):
+        value_hash.update(repr(value).encode())
+    else:
+        value_hash.update(pickle.dumps(value))
+
+
+class StageCache:
+    """
+    Two-level cache of pipeline stage results, keyed by a hash of the stage and the contents of its inputs.
+
+    Recently used results are kept in memory, and every result is also saved to disk so it survives restarting the
+    notebook. Both levels are bounded and drop the least recently used results first.
+
+    Parameters:
+    - cache_folder (str, optional): Folder to keep cache files in. Default is DEFAULT_STAGE_CACHE_FOLDER. None of the
+      results are saved to disk if this is False.
+    - max_memory_entries (int, optional): Number of stage results to keep in memory. Default is 64.
+    - max_disk_bytes (int, optional): Total size of the cache files on disk. Default is 2 GB.
+    """
+
+    def __init__(self, cache_folder=None, max_memory_entries=64, max_disk_bytes=2 * 1024**3):
+
+        if cache_folder is None:
+            cache_folder = DEFAULT_STAGE_CACHE_FOLDER
+        self.cache_folder = cache_folder
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.memory_entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+        # Any change to the funcs code makes every saved result stale
+        self.code_hash = hash_funcs_source()
+
+        if self.cache_folder:
+            os.makedirs(self.cache_folder, exist_ok=True)
+
+    def make_key(self, stage_name, input_hashes):
+        """
+        Makes the cache key for a stage from the hashes of its inputs (in the stage's input order).
+        """
+
+        key_hash = hashlib.sha256()
+        key_hash.update(self.code_hash.encode())
+        key_hash.update(stage_name.encode())
+        for input_hash in input_hashes:
+            key_hash.update(input_hash.encode())
+
+        return key_hash.hexdigest()
+
+    def get(self, key):
+        """
+        Looks up a stage result.
+
+        Returns:
+        - (bool, value): Whether the result was found, and the result (a copy, so callers can't change what is cached).
+        """
+
+        # Memory first
+        if key in self.memory_entries:
+            self.memory_entries.move_to_end(key)
+            self.hits += 1
+            return True, copy.deepcopy(self.memory_entries[key])
+
+        # Then disk
+        if self.cache_folder:
+            file_path = os.path.join(self.cache_folder, f'{key}.pkl')
+            try:
+                with open(file_path, 'rb') as cache_file:
+                    value = pickle.load(cache_file)
+                # Touch the file so disk eviction knows it was used
+                os.utime(file_path)
+            except (OSError, pickle.UnpicklingError, EOFError):
+                value = None
+            else:
+                self.hits += 1
+                self.add_to_memory(key, value)
+                return True, copy.deepcopy(value)
+
+        self.misses += 1
+        return False, None
+
+    def put(self, key, value):
+        """
+        Saves a stage result in memory and on disk.
+        """
+
+        value = copy.deepcopy(value)
+        self.add_to_memory(key, value)
+
+        if self.cache_folder:
+            # Write to a temporary file first and move it into place, so a half-written file is never read
+            temp_file = tempfile.NamedTemporaryFile(dir=self.cache_folder, suffix='.tmp', delete=False)
+            with temp_file:
+                pickle.dump(value, temp_file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_file.name, os.path.join(self.cache_folder, f'{key}.pkl'))
+            self.evict_from_disk()
+
+    def add_to_memory(self, key, value):
+
+        self.memory_entries[key] = value
+        self.memory_entries.move_to_end(key)
+        while len(self.memory_entries) > self.max_memory_entries:
+            self.memory_entries.popitem(last=False)
+
+    def evict_from_disk(self):
+
+        # Drop the least recently used files until the cache fits
+        cache_files = []
+        for file_name in os.listdir(self.cache_folder):
+            if file_name.endswith('.pkl'):
+                file_stats = os.stat(os.path.join(self.cache_folder, file_name))
+                cache_files.append((file_stats.st_mtime, file_stats.st_size, file_name))
+
+        total_bytes = sum(file_size for _, file_size, _ in cache_files)
+        for _, file_size, file_name in sorted(cache_files):
+            if total_bytes <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_folder, file_name))
+            except OSError:
+                pass
+            total_bytes -= file_size
+
+    def clear(self):
+        """
+        Removes every cached result from memory and disk.
+        """
+
+        self.memory_entries.clear()
+        if self.cache_folder:
+            for file_name in os.listdir(self.cache_folder):
+                if file_name.endswith('.pkl'):
+                    os.remove(os.path.join(self.cache_folder, file_name))
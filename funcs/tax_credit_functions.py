@@ -2,15 +2,95 @@ import pandas as pd
 import numpy as np
 from datetime import date
 
-from data_processing_functions import stack_dataframes
+from .data_processing_functions import stack_dataframes, make_year_axis
+from .depreciation_functions import create_book_depreciation_schedule
+from .aurora_data_functions import get_aurora_output_store
+from .escalation_functions import get_escalation_index
+
+# Credit windows by generation row: when the resource went in service, how many years it earns credits for, and
+# whether the year the window ends earns credits for part of the year (the months before the in-service month)
+CREDIT_WINDOWS = {'Kossuth': {'in_service_date': date(2020, 10, 1), 'credit_years': 10, 'partial_final_year': True},
+                  'Hydrogen': {'in_service_date': date(2035, 1, 1), 'credit_years': 10, 'partial_final_year': False},
+                  'Gas CCGT with CCS': {'in_service_date': date(2033, 11, 1), 'credit_years': 12, 'partial_final_year': False}}
+
+# Credit price (PTC_df row) each generation row earns
+OLD_TAX_POLICY_CREDIT_STREAMS = {'Kossuth': 'PTC Price Kossuth',
+                                 'Qualifying New Wind': 'PTC Price',
+                                 'Gas CCGT with CCS': '45Q Tax Credit'}
+IRA_CREDIT_STREAMS = {'Qualifying New Wind': 'PTC Price',
+                      'Qualifying New Solar (Post-CA1/CA2)': 'PTC Price',
+                      'CA1 Solar': 'PTC Price',
+                      'CA2 Solar': 'PTC Price',
+                      'Hydrogen': 'H2 PTC'}
+
+
+def calc_credit_eligibility(years, in_service_date, credit_years, partial_final_year=False):
+    """
+    Calculates the share of each year's generation that earns credits: 1 until the credit window ends and 0 after.
+    Years before the in-service date are left eligible, as they always have been in the model.
+
+    Parameters:
+    - years (array): Years to calculate eligibility for.
+    - in_service_date (date): Date the resource went in service.
+    - credit_years (int): Number of years the resource earns credits for.
+    - partial_final_year (bool, optional): Whether the year the window ends earns credits for the months before the
+      in-service month, (month - 1) / 12. Default is False (that year earns nothing).
+
+    Returns:
+    - np.ndarray: Eligibility (0 to 1) by year.
+    """
+
+    years = np.asarray(years, dtype=np.float64)
+    end_year = in_service_date.year + credit_years
+
+    eligibility = (years < end_year).astype(np.float64)
+    if partial_final_year:
+        eligibility[years == end_year] = (in_service_date.month - 1) / 12
+
+    return eligibility
+
+
+def calc_credit_streams(generation_df, PTC_df, credit_streams, eligibility=None, years=None):
+    """
+    Calculates the tax credits for several generation rows at once, as one elementwise product of generation, credit
+    price and eligibility. Missing generation and credit prices count as 0.
+
+    Parameters:
+    - generation_df (pd.DataFrame): Generation by row with years as columns.
+    - PTC_df (pd.DataFrame): Credit prices by row with years as columns.
+    - credit_streams (dictionary): PTC_df row of the credit price for each generation row.
+    - eligibility (dictionary, optional): Eligibility for each generation row, either one value or one per year.
+      Rows that aren't in it are fully eligible.
+    - years (pd.Index, optional): Years to calculate. Default is every year in generation_df or PTC_df.
+
+    Returns:
+    - pd.DataFrame: Tax credits with the generation rows as rows and years as columns.
+    """
+
+    if years is None:
+        years = make_year_axis([generation_df, PTC_df])
+    if eligibility is None:
+        eligibility = {}
+
+    generation_rows = list(credit_streams.keys())
+    generation = generation_df.reindex(index=generation_rows, columns=years).fillna(0).values.astype(np.float64)
+    credit_prices = PTC_df.reindex(index=list(credit_streams.values()), columns=years).fillna(0).values.astype(np.float64)
+    eligibility_values = np.stack([np.broadcast_to(np.asarray(eligibility.get(row, 1), dtype=np.float64), (len(years),))
+                                   for row in generation_rows])
+
+    return pd.DataFrame(generation * credit_prices * eligibility_values, index=generation_rows, columns=years)
+
 
 def calculate_ptc(inflation_vector, financial_inputs_tables):
     
-    # PTC_Price_Kossuth calculation
-    PTC_Price_Kossuth = (inflation_vector * 25).astype(float).round().to_frame(name='PTC Price Kossuth').T
+    # Inflation over the years of the input vector
+    escalation_index = get_escalation_index(inflation_vector)
+    inflation_series = escalation_index.to_series(end_year=escalation_index.last_input_year)
 
-    # H2_PTC calculation
-    H2_PTC = (inflation_vector * 3).astype(float).round().to_frame(name='H2 PTC').T
+    # PTC_Price_Kossuth and H2_PTC calculations ($25/MWh and $3/kg in base year dollars), rounded to whole dollars
+    inflated_PTC_prices = np.round(np.outer([25, 3], inflation_series.values))
+    PTC_Price_Kossuth = pd.DataFrame(inflated_PTC_prices[[0]], index=['PTC Price Kossuth'], columns=inflation_series.index)
+    H2_PTC = pd.DataFrame(inflated_PTC_prices[[1]], index=['H2 PTC'], columns=inflation_series.index)
 
     # PTC_and_45Q_Tax_Credit DataFrame
     PTC_and_45Q_Tax_Credit = financial_inputs_tables['PTC and 45Q Tax Credit'].set_index('Year')
@@ -49,37 +129,32 @@ def calculate_generation(ptcs_and_itcs_tables, aurora_portfolio_resource, aurora
     solar_generation_CA2 = solar_generation_CA2.rename(index={'CA2 Generation * PTC': 'CA2 Solar'})
 
      # Filter the Auroura portfolio resource data to get Kossoth info
-    condition_mask = aurora_portfolio_resource['Condition'] == aurora_condition
-    run_id_mask = aurora_portfolio_resource['Run_ID'] == aurora_iteration
-    portfolio_id_mask = aurora_portfolio_resource['Portfolio_ID'] == aurora_portfolio_ID
-    resource_name_mask = aurora_portfolio_resource['Resource_Name'] == "Kossuth"
-    aurora_resource_summary_filtered = aurora_portfolio_resource[condition_mask & run_id_mask & portfolio_id_mask & resource_name_mask]
+    aurora_portfolio_resource = get_aurora_output_store(aurora_portfolio_resource)
+    aurora_resource_summary_filtered = aurora_portfolio_resource.select(aurora_condition, aurora_iteration, aurora_portfolio_ID, "Kossuth")
     aurora_resource_summary_filtered = aurora_resource_summary_filtered.rename(columns={'Time_Period': 'Year'})
     aurora_resource_summary_filtered = aurora_resource_summary_filtered.set_index('Year').sort_index()
     kossuth = aurora_resource_summary_filtered[['Output_MWH']].T
     kossuth = kossuth.rename(index={'Output_MWH': 'Kossuth'})
     
     # hydrogen equals to installed capapcity * production in kg for the given iteration.
-    # we then also zero out any hydrogen less than the 'hydrogen date' or 10 years more than the hydrogen date
+    # we then also zero out any hydrogen once its credit window (10 years from the 'hydrogen date') ends
     h2_production_by_scenario = hydrogen_island_inputs['H2 Production (kg/MW-yr)'].set_index('Scenario')
     h2_production = h2_production_by_scenario[iteration].values[0]
     hydrogen = cumulative_installed_capacity_MW_df.loc[['H2 Island']] * h2_production
     hydrogen = hydrogen.rename(index={'H2 Island': 'Hydrogen'})
-    hydrogen_date = date(2035, 1, 1)
-    hydrogen = hydrogen.apply(lambda col: col if int(col.name) < hydrogen_date.year or int(col.name) < hydrogen_date.year + 10 else 0)
+    hydrogen = hydrogen * calc_credit_eligibility(hydrogen.columns, **CREDIT_WINDOWS['Hydrogen'])
 
     CCS_CO2 = CCS_inputs_tables['CO2 Tons'][CCS_inputs_tables['CO2 Tons'].Aurora_Iteration == aurora_iteration]
     CCS_CO2 = CCS_CO2.reset_index().drop(columns=['Aurora_Iteration', 'index'])
     CCS_CO2 = CCS_CO2.rename(index={0: 'Gas CCGT with CCS'})
-    CCS_date = date(2033, 11, 1)
-    CCS_CO2 = CCS_CO2.apply(lambda col: col if int(col.name) < CCS_date.year or int(col.name) < CCS_date.year + 12 else 0)
+    CCS_CO2 = CCS_CO2 * calc_credit_eligibility(CCS_CO2.columns, **CREDIT_WINDOWS['Gas CCGT with CCS'])
 
     # Stack DataFrames
     generation_df = stack_dataframes([wind_generation, solar_generation_postCA1CA2, solar_generation_CA1, 
                                   solar_generation_CA2, kossuth, hydrogen, CCS_CO2], print_warnings=False)
     
-    # Replace all None values with 0 to ensure we can do multiplications later on
-    generation_df = generation_df.replace({None: 0})
+    # Fill missing values with 0 to ensure we can do multiplications later on
+    generation_df = generation_df.fillna(0)
     
     return generation_df
 
@@ -99,48 +174,18 @@ def calculate_old_tax_policy_PTC_generated(PTC_df, generation_df, financial_inpu
     - DataFrame containing old tax policy PTC generated.
     """
 
-    ### Qualifying New Wind
-    ptc_price_series = PTC_df.loc['PTC Price'] 
-    qualifying_new_wind_series = generation_df.loc['Qualifying New Wind']
-    # Align series so we multiply matching years
-    ptc_price_series, qualifying_new_wind_series = ptc_price_series.align(qualifying_new_wind_series, fill_value=0)
-    qualifying_new_wind_old_ptc = qualifying_new_wind_series * ptc_price_series
-    qualifying_new_wind_old_ptc = qualifying_new_wind_old_ptc.to_frame().T
-    qualifying_new_wind_old_ptc = qualifying_new_wind_old_ptc.rename(index={0: 'Qualifying New Wind'})
-    if use_IRA == True:
-        qualifying_new_wind_old_ptc.loc['Qualifying New Wind'] = 0
-
-    ### Captured CO2
-    tax_credit_45Q_series = PTC_df.loc['45Q Tax Credit'] 
-    gas_ccgt_series = generation_df.loc['Gas CCGT with CCS']
-    # Align series so we multiply matching years
-    tax_credit_45Q_series, gas_ccgt_series = tax_credit_45Q_series.align(gas_ccgt_series, fill_value=0)
-    captured_co2_old_ptc = tax_credit_45Q_series * gas_ccgt_series
-    captured_co2_old_ptc = captured_co2_old_ptc.to_frame().T
-    captured_co2_old_ptc = captured_co2_old_ptc.rename(index={0: 'Captured CO2'})
-
-    ### Kossuth
+    # Kossuth earns its share of PTCs until its credit window ends, and new wind only earns them without the IRA
     WPL_Owned_Wind = financial_inputs_tables['WPL Owned Wind'].set_index('WPL Owned Wind')
-    kossuth_date = date(2020, 10, 1)
-    kossuth_old_ptc = captured_co2_old_ptc.copy()
-    kossuth_old_ptc = kossuth_old_ptc.rename(index={'Captured CO2': 'Kossuth'})
-    kossuth_old_ptc.loc['Kossuth'] = 0
     ptc_eligibility = WPL_Owned_Wind.loc[['Kossuth']]['PTC Eligibility'].values[0]
+    years = make_year_axis([generation_df, PTC_df])
+    eligibility = {'Kossuth': ptc_eligibility * calc_credit_eligibility(years, **CREDIT_WINDOWS['Kossuth']),
+                   'Qualifying New Wind': 0 if use_IRA == True else 1}
 
-    for year in kossuth_old_ptc.columns:
-        if year > kossuth_date.year + 10:
-            kossuth_old_ptc.loc['Kossuth', year] = 0
-        elif year == kossuth_date.year + 10:
-            kossuth_generation_val = generation_df.loc[['Kossuth']].get(year, pd.Series([0])).values[0]
-            kossuth_old_ptc_val = PTC_df.loc[['PTC Price Kossuth'], year].fillna(0).values[0]
-            kossuth_old_ptc.loc['Kossuth', year] = kossuth_old_ptc_val * ptc_eligibility * kossuth_generation_val * ((kossuth_date.month - 1) / 12)
-        else:
-            kossuth_generation_val = generation_df.loc[['Kossuth']].get(year, pd.Series([0])).values[0]
-            kossuth_old_ptc_val = PTC_df.loc[['PTC Price Kossuth'], year].fillna(0).values[0]
-            kossuth_old_ptc.loc['Kossuth', year] = kossuth_old_ptc_val * ptc_eligibility * kossuth_generation_val
+    ### Kossuth, Qualifying New Wind and Captured CO2
+    old_tax_policy_PTC_generated = calc_credit_streams(generation_df, PTC_df, OLD_TAX_POLICY_CREDIT_STREAMS, eligibility, years)
+    old_tax_policy_PTC_generated = old_tax_policy_PTC_generated.rename(index={'Gas CCGT with CCS': 'Captured CO2'})
 
     ### Grossed Up PTC
-    old_tax_policy_PTC_generated = stack_dataframes([kossuth_old_ptc, qualifying_new_wind_old_ptc, captured_co2_old_ptc], print_warnings=False)
     old_tax_policy_PTC_generated.loc['Grossed Up PTC'] = old_tax_policy_PTC_generated.sum()
     # Divide the "Grossed Up PTC" row by (1 - Income Tax Rate)
     old_tax_policy_PTC_generated.loc['Grossed Up PTC'] = old_tax_policy_PTC_generated.loc['Grossed Up PTC'] / (1 - financial_scalars_inputs.loc['Income Tax Rate'].values[0])
@@ -161,44 +206,13 @@ def calculate_ira_ptc(generation_df, PTC_df, financial_scalars_inputs, use_IRA):
     - DataFrame containing IRA PTC calculations.
     """
 
-    # Copy generation_df and initialize IRA_PTC_df with zeros
-    IRA_PTC_df = generation_df.copy().drop(['Kossuth', 'Gas CCGT with CCS'])
-    IRA_PTC_df.loc[:, :] = 0
-
-    # Check if IRA is being used
-    if use_IRA == True:
-        
-        # Qualifying New Wind
-        ptc_price_series = PTC_df.loc['PTC Price'] 
-        qualifying_new_wind_series = generation_df.loc['Qualifying New Wind']
-        # Align series so we multiply matching years
-        ptc_price_series, qualifying_new_wind_series = ptc_price_series.align(qualifying_new_wind_series, fill_value=0)
-        IRA_PTC_df.loc['Qualifying New Wind'] = ptc_price_series * qualifying_new_wind_series
-        
-        # Hydrogen
-        h2_ptc_price_series = PTC_df.loc['H2 PTC']
-        hydrogen_series = generation_df.loc['Hydrogen']
-        # Align series so we multiply matching years
-        h2_ptc_price_series, hydrogen_series = h2_ptc_price_series.align(hydrogen_series, fill_value=0)
-        IRA_PTC_df.loc['Hydrogen'] = h2_ptc_price_series * hydrogen_series
-
-        # Check if long-term solar projects use PTC
-        if financial_scalars_inputs.loc['Long-term solar projects ITCs or PTCs?'].values[0] == 'PTC':
-            
-            # CA1 Solar
-            CA1_series = generation_df.loc['CA1 Solar']
-            ptc_price_series, CA1_series = ptc_price_series.align(CA1_series, fill_value=0)
-            IRA_PTC_df.loc['CA1 Solar'] = ptc_price_series * CA1_series
-            
-            # CA2 Solar
-            CA2_series = generation_df.loc['CA2 Solar']
-            ptc_price_series, CA2_series = ptc_price_series.align(CA2_series, fill_value=0)
-            IRA_PTC_df.loc['CA2 Solar'] = ptc_price_series * CA2_series
-            
-            # Qualifying New Solar (Post-CA1/CA2)
-            qualifying_new_solar_series = generation_df.loc['Qualifying New Solar (Post-CA1/CA2)']
-            ptc_price_series, qualifying_new_solar_series = ptc_price_series.align(qualifying_new_solar_series, fill_value=0)
-            IRA_PTC_df.loc['Qualifying New Solar (Post-CA1/CA2)'] = ptc_price_series * qualifying_new_solar_series
+    # Wind and hydrogen earn PTCs under the IRA, and solar does too if long-term solar projects use PTCs
+    solar_uses_PTC = financial_scalars_inputs.loc['Long-term solar projects ITCs or PTCs?'].values[0] == 'PTC'
+    eligibility = {row: float(use_IRA == True) for row in IRA_CREDIT_STREAMS}
+    for row in ['Qualifying New Solar (Post-CA1/CA2)', 'CA1 Solar', 'CA2 Solar']:
+        eligibility[row] *= float(solar_uses_PTC)
+
+    IRA_PTC_df = calc_credit_streams(generation_df, PTC_df, IRA_CREDIT_STREAMS, eligibility, years=generation_df.columns)
 
     # Grossed Up PTC
     IRA_PTC_df.loc['Grossed Up PTC'] = IRA_PTC_df.sum()